@@ -1,73 +1,717 @@
-from lesion_analyzer import SkinLesionAnalyzer
-import os
+from lesion_analyzer import (SkinLesionAnalyzer, ResultadoAnalise, ContextoPipeline, classificar_lote,
+                             interpretar_modo_relatorio, impressao_pipeline, decodificar, verificar_decodificacao,
+                             MODOS_DECODIFICACAO, MODOS_SEGMENTACAO, PARAMETROS_PIPELINE)
+from fontes_imagens import (iterar_imagens, selecionar_por_metadata, filtrar_ids, caminho_item, ImagemEmMemoria,
+                            PADROES_IMAGEM)
+from instrumentacao import Instrumentacao, DESATIVADA
+from escrita_csv import EscritorCSVIncremental, ColunasIncompativeis
+from cache_features import CacheFeatures, chave_arquivo, chave_conteudo, compactar_mascara, MODOS_CHAVE
+from armazem_mascaras import ArmazemMascaras
+from relatorio_visual import RENDERIZADORES
+from registro_modelos import MODELO_PADRAO, carregar_modelo
+from esteira import Esteira, Estagio
+from fragmentos import filtrar_shard, interpretar_shard, nome_csv_shard
+from multiprocessing import Pool
+from dataclasses import dataclass, field, replace
+import argparse
 import csv
-import shutil
+import os
+import sys
 import time
 
 # =================== CONFIGURAÇÕES ===================
 
-# Definir os caminhos conforme a necessidade:
-# ✔️ Basta mudar esses dois caminhos para usar em qualquer lote
-
+# Caminhos padrão (podem ser trocados pela linha de comando)
 caminho_imgs = r"C:\Users\DettCloud2\Downloads\tcc\ham10000\images"  # Caminho das imagens
-# caminho_imgs = r"C:\Users\DettCloud2\Downloads\tcc\ham10000\teste100" 
+# caminho_imgs = r"C:\Users\DettCloud2\Downloads\tcc\ham10000\teste100"
 saida = r"C:\Users\DettCloud2\Downloads\tcc\results_lote_0707_ml_balanced"             # Pasta de saída
-# saida = r"C:\Users\DettCloud2\Downloads\tcc\results2406"   
+# saida = r"C:\Users\DettCloud2\Downloads\tcc\results2406"
 
-# Criar pasta de saída se não existir
-os.makedirs(saida, exist_ok=True)
+COLUNAS_CSV = ["imagem", "area", "perimetro", "circularidade", "aspect_ratio", "solidez", "assimetria",
+               "irregularidade_borda", "variancia_cor", "diametro", "classificacao"]
+COLUNA_CLASSIFICACAO = COLUNAS_CSV.index("classificacao")
 
 # ==========================================================
 
-# Função robusta para mover arquivos (sobrescreve se existir)
-def mover_com_sobrescrita(origem, destino):
-    if os.path.exists(destino):
-        os.remove(destino)
-    shutil.move(origem, destino)
+@dataclass
+class ConfigLote:
+    """Opções de um lote repassadas a cada processo worker"""
+    saida: str
+    modo_relatorio: str = 'png'
+    renderizador: str = 'matplotlib'
+    decodificacao: str = 'full'
+    cache_path: str = None         # cache de features (SQLite); None desativa
+    chave_cache: str = 'hash'      # 'hash' (conteúdo) ou 'mtime' (tamanho + data)
+    guardar_mascaras: bool = False  # também guarda as máscaras no cache
+    instrumentar: bool = False     # tempo de CPU por etapa, ganchos e perfis por amostragem
+    ganchos: tuple = ()            # funções gancho(etapa, parede_ns, cpu_ns) chamadas nos workers
+    perfil_amostra: int = 0        # cProfile em 1 a cada N imagens
+    memoria_amostra: int = 0       # tracemalloc em 1 a cada N imagens
+    segmentacao: str = 'watershed'  # 'tiered' só roda o watershed em máscaras ambíguas
+    armazenar_mascaras: bool = False  # devolve a máscara compactada para o armazém de máscaras
+    relogio_cpu: str = 'processo'  # 'thread' no modo esteira (ver instrumentacao.RELOGIOS_CPU)
+
+
+@dataclass
+class SaidaImagem:
+    """O que um worker devolve por imagem ao processo principal"""
+    linha: list = None             # linha do CSV (None = falha)
+    registro: tuple = None         # (chave, features, máscara) para gravar no cache
+    tempos: dict = field(default_factory=dict)
+    tempos_cpu: dict = field(default_factory=dict)
+    nivel_segmentacao: str = None  # 'morphology' ou 'watershed' (None para acertos no cache)
+    mascara: bytes = None          # máscara em 1 bit por pixel (com armazenar_mascaras)
+
+
+# Estado do processo worker (preenchido uma vez no inicializador)
+_modelo = None
+_config = None
+_cache = None
+_instr = DESATIVADA
+_contexto = None
+
+
+def _inicializar_worker(modelo_path, config=None):
+    """Carrega o modelo, abre o cache (somente leitura) e cria os buffers uma única vez em cada processo"""
+    global _modelo, _config, _cache, _instr, _contexto
+    _modelo = carregar_modelo(modelo_path)
+    _config = config
+    _contexto = ContextoPipeline()
+    _instr = DESATIVADA  # nada de ganchos/perfis de um lote anterior no mesmo processo
+    if config is not None and config.instrumentar:
+        _instr = Instrumentacao(ganchos=config.ganchos, perfil_amostra=config.perfil_amostra,
+                                memoria_amostra=config.memoria_amostra,
+                                pasta_perfis=os.path.join(config.saida, "perfis"), acumular=False,
+                                relogio_cpu=config.relogio_cpu)
+    # Sem reaproveitar o cache de um lote anterior no mesmo processo (pode estar
+    # fechado ou ter outra impressão do pipeline)
+    if _cache is not None:
+        _cache.fechar()
+    _cache = None
+    if config is not None and config.cache_path:
+        _cache = CacheFeatures(config.cache_path, impressao_pipeline(decode_mode=config.decodificacao,
+                                                                       segmentation_mode=config.segmentacao),
+                               somente_leitura=True)
+
+
+def id_imagem(caminho):
+    """Identificador da imagem no CSV (nome do arquivo sem extensão; aceita ImagemEmMemoria)"""
+    return os.path.splitext(os.path.basename(caminho_item(caminho)))[0]
 
-# Listar imagens válidas
-imagens = [img for img in os.listdir(caminho_imgs) if img.lower().endswith(".jpg")]
-dados_csv = []
 
-print(f"🔬 Total de imagens encontradas: {len(imagens)}")
+def listar_imagens(pasta):
+    """Lista as imagens .jpg de uma pasta, em ordem alfabética"""
+    return list(iterar_imagens(pasta, incluir=("*.jpg",), recursivo=False, ordenar=True))
 
-# Loop principal de processamento
-for i, nome_img in enumerate(imagens, 1):
-    caminho = os.path.join(caminho_imgs, nome_img)
-    print(f"[{i}/{len(imagens)}] Processando: {nome_img}")
+
+def processar_imagem(caminho, config=None, modelo_path=MODELO_PADRAO):
+    """Analisa uma imagem e devolve a linha do CSV (ou None em caso de falha)
+
+    Fora de um worker já inicializado, carrega o modelo de `modelo_path` na
+    primeira chamada; sem `config`, usa as opções padrão do lote sem relatórios.
+    """
+    config = config or _config or ConfigLote(saida, modo_relatorio='none')
+    if _modelo is None:
+        _inicializar_worker(modelo_path, config)
+    return processar_bloco([caminho], config)[0].linha
+
+
+@dataclass
+class ItemLote:
+    """Uma imagem em trânsito entre as etapas do lote: leitura -> cálculo -> gravação"""
+    indice: int
+    caminho: str
+    conteudo: object = None        # bytes da imagem (arquivo compactado ou lidos pela leitora)
+    entrada: object = None         # imagem já decodificada pela leitora (modo esteira)
+    chave: str = None              # chave no cache de features
+    em_cache: bool = False
+    features: dict = None          # features do cache (com em_cache=True)
+    descartado: bool = False       # erro já informado: só conta como falha
+    analyzer: SkinLesionAnalyzer = None
+    resultado: ResultadoAnalise = None
+    saida: SaidaImagem = field(default_factory=SaidaImagem)
+
+    @property
+    def nome(self):
+        return os.path.basename(self.caminho)
+
+
+def ler_item(indice, item, config, cache=None, ler_arquivo=False):
+    """Etapa de leitura: chave e consulta ao cache e, com `ler_arquivo=True`, bytes e decodificação
+
+    No modo em processos a imagem é lida pelo próprio analisador; no modo
+    esteira a thread leitora lê e decodifica aqui (antes do cálculo), e
+    acertos no cache nem chegam a ser decodificados.
+    """
+    lido = ItemLote(indice, caminho_item(item))
+    em_memoria = isinstance(item, ImagemEmMemoria)
+    lido.conteudo = item.conteudo if em_memoria else None
+    tempos = lido.saida.tempos
     try:
-        analyzer = SkinLesionAnalyzer(caminho)
-        analyzer.analyze()
+        if ler_arquivo and not em_memoria:
+            with DESATIVADA.etapa('read_file', tempos):
+                try:
+                    with open(lido.caminho, 'rb') as f:
+                        lido.conteudo = f.read()
+                except OSError:
+                    pass  # o analisador tenta de novo e informa a falha de leitura
 
-        base = nome_img.replace(".jpg", "")
-        mover_com_sobrescrita("results/lesion_analysis.png", os.path.join(saida, f"{base}_analysis.png"))
-        mover_com_sobrescrita("results/lesion_report.txt", os.path.join(saida, f"{base}_report.txt"))
+        if cache is not None:
+            # Em memória não há mtime: a chave é sempre o hash do conteúdo
+            if em_memoria or (lido.conteudo is not None and config.chave_cache == 'hash'):
+                lido.chave = chave_conteudo(lido.conteudo)
+            else:
+                lido.chave = chave_arquivo(lido.caminho, config.chave_cache)
+            lido.em_cache, lido.features = cache.obter(lido.chave)
+
+        if ler_arquivo and not lido.em_cache and lido.conteudo is not None:
+            with DESATIVADA.etapa('load_image', tempos):
+                lido.entrada = decodificar(lido.conteudo, color=config.decodificacao == 'full')
+    except Exception as e:
+        print(f"⚠️ Erro ao processar {lido.nome}: {e}")
+        lido.descartado = True
+    return lido
 
-        time.sleep(0.1)  # Pequena pausa para evitar conflitos de I/O
 
+def calcular_bloco(itens, config, contexto=None):
+    """Etapa de cálculo: segmenta e extrai as features das imagens lidas e classifica o bloco de uma vez
+
+    Acertos no cache só são usados se a imagem não precisar de relatório. O
+    registro (chave, features, máscara) só existe para imagens calculadas
+    agora, e é gravado no cache pelo processo principal.
+    """
+    pendentes = []
+    for item in itens:
+        if item.descartado:
+            continue
+        base = id_imagem(item.caminho)
         try:
-            with open(os.path.join(saida, f"{base}_report.txt"), encoding="utf-8") as f:
-                linhas = f.readlines()
-                area = float(linhas[3].split(":")[1])
-                perimetro = float(linhas[4].split(":")[1])
-                circ = float(linhas[5].split(":")[1])
-                ar = float(linhas[6].split(":")[1])
-                solidez = float(linhas[7].split(":")[1])
-                classificacao = linhas[9].split(":")[1].strip()
-                dados_csv.append([base, area, perimetro, circ, ar, solidez, classificacao])
+            # Cada imagem grava o próprio relatório na pasta de saída (sem arquivo compartilhado)
+            analyzer = SkinLesionAnalyzer(item.caminho, modelo=_modelo, output_dir=config.saida, report_name=base,
+                                          report_mode=config.modo_relatorio, renderer=config.renderizador,
+                                          decode_mode=config.decodificacao, instrumentacao=_instr,
+                                          contexto=contexto, conteudo=item.conteudo,
+                                          segmentation_mode=config.segmentacao)
+            item.analyzer = analyzer
+
+            if item.em_cache and not any(analyzer.report_outputs(sucesso=item.features is not None)):
+                if item.features is None:
+                    print(f"⚠️ {item.nome}: falha na extração de características (cache)")
+                    continue
+                item.resultado = ResultadoAnalise(item.caminho, features=item.features)
+                pendentes.append(item)
+                continue
+
+            with _instr.perfilar(base):
+                resultado = analyzer.analyze(verbose=False, classify=False,
+                                             keep_mask=config.guardar_mascaras or config.armazenar_mascaras,
+                                             entrada=item.entrada)
+            item.entrada = None
+            # Tempos da leitura (modo esteira) somados aos do analisador
+            resultado.timings.update(item.saida.tempos)
+            item.saida.tempos, item.saida.tempos_cpu = resultado.timings, resultado.cpu_timings
+            item.saida.nivel_segmentacao = resultado.segmentation_tier
+            if item.chave is not None and resultado.erro != "Falha ao carregar a imagem":
+                item.saida.registro = (item.chave, resultado.features, resultado.mask)
+            if config.armazenar_mascaras and resultado.sucesso:
+                # 8 KiB em vez de 64 KiB no caminho de volta ao processo principal
+                item.saida.mascara = compactar_mascara(resultado.mask)
+            resultado.mask = None
+            if not resultado.sucesso:
+                print(f"⚠️ {item.nome}: {resultado.erro}")
+                continue
+            item.resultado = resultado
+            pendentes.append(item)
         except Exception as e:
-            print(f"⚠️ Erro ao ler relatório de {base}: {e}")
-            continue
+            print(f"⚠️ Erro ao processar {item.nome}: {e}")
+
+    if not pendentes:
+        return itens
+
+    tempos_bloco, cpu_bloco = {}, {}
+    try:
+        with _instr.etapa('classify_lesion', tempos_bloco, cpu_bloco):
+            rotulos = classificar_lote(_modelo, [item.resultado.features for item in pendentes])
+    except Exception as e:
+        print(f"⚠️ Erro ao classificar bloco: {e}")
+        for item in pendentes:
+            item.resultado = None
+        return itens
+
+    for item, rotulo in zip(pendentes, rotulos):
+        item.resultado.classification = rotulo
+        # Tempo da classificação do bloco dividido entre as imagens
+        item.saida.tempos['classify_lesion'] = tempos_bloco['classify_lesion'] / len(pendentes)
+        if cpu_bloco:
+            item.saida.tempos_cpu['classify_lesion'] = cpu_bloco['classify_lesion'] / len(pendentes)
+    return itens
 
+
+def gravar_item(item):
+    """Etapa de gravação: relatório pendente (PNG/TXT) e a linha do CSV de uma imagem classificada"""
+    if item.resultado is None or item.resultado.classification is None:
+        return item.saida
+    base = id_imagem(item.caminho)
+    try:
+        if item.resultado.etapas is not None:
+            item.analyzer.write_report(item.resultado)
+        item.saida.linha = item.resultado.linha_csv(base)
     except Exception as e:
-        print(f"⚠️ Erro ao processar {nome_img}: {e}")
-        continue
+        print(f"⚠️ Erro ao gravar relatório de {base}: {e}")
+    item.analyzer = item.resultado = None
+    return item.saida
+
+
+def processar_bloco(caminhos, config=None):
+    """Analisa um bloco de imagens (caminhos ou ImagemEmMemoria) e classifica todas com uma única chamada ao modelo
+
+    Devolve uma SaidaImagem por imagem, na mesma ordem. A linha é None para
+    falhas; o registro (chave, features, máscara) só existe para imagens
+    calculadas agora, e é gravado no cache pelo processo principal.
+    """
+    config = config or _config
+    itens = [ler_item(i, item, config, _cache) for i, item in enumerate(caminhos)]
+    return [gravar_item(item) for item in calcular_bloco(itens, config, _contexto)]
+
+
+def _estagios_esteira(config, cache_path, ordenado, leitores, threads_calculo, tamanho_fila, chunksize):
+    """Leitura (pool de threads) -> cálculo (uma thread por ContextoPipeline) -> gravação dos relatórios"""
+    def abrir_cache():
+        # Conexão SQLite própria de cada leitora (não pode ser compartilhada entre threads)
+        if cache_path:
+            return CacheFeatures(cache_path, impressao_pipeline(decode_mode=config.decodificacao,
+                                                                       segmentation_mode=config.segmentacao),
+                                 somente_leitura=True)
+        return None
+
+    def ler(cache, itens):
+        return [ler_item(indice, item, config, cache, ler_arquivo=True) for indice, item in itens]
+
+    def calcular(contexto, itens):
+        return calcular_bloco(itens, config, contexto)
+
+    def gravar(estado, itens):
+        # Uma thread só (o matplotlib não é usado em paralelo); com `ordenado`, as saídas
+        # esperam as anteriores para o CSV sair na ordem das imagens
+        if not ordenado:
+            return [[gravar_item(item) for item in itens]]
+        for item in itens:
+            estado['prontas'][item.indice] = gravar_item(item)
+        saidas = []
+        while estado['proxima'] in estado['prontas']:
+            saidas.append(estado['prontas'].pop(estado['proxima']))
+            estado['proxima'] += 1
+        return [saidas] if saidas else []
+
+    return [
+        Estagio("leitura", ler, threads=leitores, fila=tamanho_fila, inicializar=abrir_cache,
+                finalizar=lambda cache: cache is not None and cache.fechar()),
+        Estagio("calculo", calcular, threads=threads_calculo, fila=tamanho_fila, lote=chunksize,
+                inicializar=ContextoPipeline),
+        Estagio("gravacao", gravar, threads=1, fila=tamanho_fila, lote=chunksize,
+                inicializar=lambda: {'prontas': {}, 'proxima': 0}),
+    ]
+
+
+def gravar_metricas_esteira(metricas, caminho):
+    """Grava a ocupação das filas e a utilização de cada estágio (uma linha por fila)"""
+    colunas = ["estagio", "threads", "capacidade", "ocupacao_media", "ocupacao_media_pct", "ocupacao_maxima",
+               "vezes_cheia", "espera_put_s", "espera_get_s", "utilizacao_pct"]
+    with open(caminho, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(colunas)
+        for linha in metricas:
+            writer.writerow(["" if linha[c] is None else (round(linha[c], 3) if isinstance(linha[c], float)
+                                                          else linha[c]) for c in colunas])
+    return caminho
+
+
+def _pular_concluidas(imagens, concluidas, contador):
+    """Descarta as imagens que já estão no CSV, contando quantas foram puladas"""
+    for caminho in imagens:
+        if id_imagem(caminho) in concluidas:
+            contador[0] += 1
+        else:
+            yield caminho
+
+
+def _em_blocos(iteravel, tamanho):
+    """Agrupa um iterável em listas de até `tamanho` itens"""
+    bloco = []
+    for item in iteravel:
+        bloco.append(item)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+class Progresso:
+    """Exibe o progresso do lote e a vazão (imagens/s) no máximo uma vez por intervalo"""
+
+    def __init__(self, total=None, intervalo=1.0, ativo=True):
+        self.total = total
+        self.intervalo = intervalo
+        self.ativo = ativo
+        self.inicio = time.perf_counter()
+        self._ultimo = 0.0
+        self.concluidas = 0
+        self.falhas = 0
+
+    def atualizar(self, sucesso=True):
+        self.concluidas += 1
+        if not sucesso:
+            self.falhas += 1
+        agora = time.perf_counter()
+        if self.ativo and (agora - self._ultimo >= self.intervalo or self.concluidas == self.total):
+            self._ultimo = agora
+            self.exibir(agora)
+
+    def vazao(self, agora=None):
+        decorrido = (agora or time.perf_counter()) - self.inicio
+        return self.concluidas / decorrido if decorrido > 0 else 0.0
+
+    def exibir(self, agora=None):
+        total = f"/{self.total}" if self.total else ""
+        print(f"[{self.concluidas}{total}] {self.vazao(agora):.1f} imagens/s | falhas: {self.falhas}", flush=True)
+
+
+def run_batch(imagens, saida, modelo_path=MODELO_PADRAO, workers=None, chunksize=8, ordenado=True,
+              progresso=True, modo_relatorio='png', renderizador='matplotlib', decodificacao='full',
+              cache_path=None, chave_cache='hash', guardar_mascaras=False, retomar=False, bloco_escrita=50,
+              instrumentar=False, ganchos=(), perfil_amostra=0, memoria_amostra=0, esteira=False, leitores=4,
+              threads_calculo=None, tamanho_fila=32, segmentacao='watershed', armazem_mascaras=None,
+              nome_csv="relatorio_lote.csv", metricas=None, limpar_cache=False):
+    """Processa um lote de imagens em paralelo e grava `nome_csv` (relatorio_lote.csv) em `saida`
+
+    `workers` define o número de processos (None = todos os núcleos, 0 ou 1 =
+    execução no próprio processo). Cada tarefa é um bloco de `chunksize`
+    imagens, classificado com uma única chamada ao modelo. `ordenado=False` grava as linhas na ordem em
+    que terminam, o que evita esperar por imagens lentas. `modo_relatorio`
+    escolhe quais imagens ganham PNG/TXT ('none', 'text', 'png', 'sampled:N',
+    'on-failure'); com 'none' apenas o CSV é gravado. `decodificacao='reduced'`
+    lê os JPEGs em cinza a 1/2 da resolução (mais rápido; features mudam pouco).
+    Com `cache_path`, as características ficam num cache SQLite (ver
+    cache_features.py) e só as imagens ausentes do cache são processadas;
+    `limpar_cache=True` remove antes as entradas de outros parâmetros do pipeline.
+    O CSV é gravado em blocos de `bloco_escrita` linhas durante o lote (ver
+    escrita_csv.py); com `retomar=True` as imagens já presentes no CSV são
+    puladas e as novas linhas são acrescentadas.
+    Com `instrumentar=True` os tempos de parede/CPU de cada etapa são
+    agregados (p50/p95/p99) em `relatorio_lote_etapas.csv`, os `ganchos` são
+    chamados nos workers e 1 a cada `perfil_amostra`/`memoria_amostra`
+    imagens ganha um perfil cProfile/tracemalloc em `saida/perfis`.
+    `segmentacao='tiered'` dispensa o watershed quando a máscara morfológica
+    já é limpa (ver benchmarks/segmentacao_niveis.py antes de usar).
+    Com `armazem_mascaras` (caminho), as máscaras das imagens processadas são
+    acrescentadas ao armazém (ver armazem_mascaras.py); acertos no cache de
+    features não têm máscara e ficam de fora.
+    Com `esteira=True` o lote roda em threads no próprio processo (ver
+    esteira.py): `leitores` threads leem e decodificam as imagens adiantado,
+    `threads_calculo` (None = todos os núcleos) segmentam e classificam em
+    blocos de `chunksize`, e uma thread grava os relatórios; as filas entre
+    eles guardam até `tamanho_fila` itens. Rende mais quando a leitura é
+    lenta (disco de rede). A ocupação das filas vai para
+    `relatorio_lote_esteira.csv`.
+    Os CSVs de etapas e de filas levam o nome de `nome_csv` como prefixo
+    (ex.: relatorio_lote_shard_1_de_4_etapas.csv, ver fragmentos.py).
+    `metricas` (metricas_incrementais.MetricasAoVivo) recebe cada linha do
+    CSV, grava snapshots das métricas durante o lote e pode pará-lo cedo se
+    uma métrica ficar abaixo do mínimo (motivo em "interrompido").
+    Retorna um dicionário com o caminho do CSV e as contagens do lote.
+    """
+    interpretar_modo_relatorio(modo_relatorio)  # valida antes de abrir o pool
+    if decodificacao != 'full':
+        # Um modelo com a variância de cor não classifica imagens decodificadas em cinza
+        verificar_decodificacao(carregar_modelo(modelo_path), decodificacao)
+    os.makedirs(saida, exist_ok=True)
+    csv_path = os.path.join(saida, nome_csv)
+    prefixo = os.path.join(saida, os.path.splitext(nome_csv)[0])
+    escritor = EscritorCSVIncremental(csv_path, COLUNAS_CSV, retomar=retomar, tamanho_bloco=bloco_escrita)
+    # `imagens` pode ser um gerador (ex.: fontes_imagens.iterar_imagens): o pool
+    # começa a trabalhar enquanto a varredura continua
+    total = len(imagens) if hasattr(imagens, '__len__') else None
+    puladas = [0]
+    if escritor.concluidas:
+        if progresso:
+            print(f"↩️ Retomando: {len(escritor.concluidas)} imagens já concluídas no CSV")
+        imagens = _pular_concluidas(imagens, escritor.concluidas, puladas)
+        total = None
+        if metricas is not None:
+            metricas.acumular_csv(csv_path)  # as linhas já gravadas entram nas métricas
+    prog = Progresso(total=total, ativo=progresso)
+    config = ConfigLote(saida, modo_relatorio, renderizador, decodificacao, cache_path, chave_cache,
+                        guardar_mascaras, instrumentar, tuple(ganchos), perfil_amostra, memoria_amostra,
+                        segmentacao, armazem_mascaras is not None,
+                        # Na esteira as etapas dividem o processo: cada uma mede só a própria thread
+                        relogio_cpu='thread' if esteira else 'processo')
+    etapas = Instrumentacao(relogio_cpu=config.relogio_cpu) if instrumentar else None
+
+    # O cache é criado/invalidado aqui; os workers só leem e o processo principal grava
+    impressao = impressao_pipeline(decode_mode=decodificacao, segmentation_mode=segmentacao)
+    cache = CacheFeatures(cache_path, impressao, descartar_obsoletas=limpar_cache) if cache_path else None
+    calculadas = 0
+    niveis = {}
+    lado = PARAMETROS_PIPELINE['tamanho']
+    armazem = ArmazemMascaras(armazem_mascaras, forma=(lado, lado)) if armazem_mascaras else None
+
+    blocos = _em_blocos(imagens, max(1, chunksize))
+    linha_esteira = None
+    interrompido = None
+
+    with escritor:
+        if esteira:
+            # Threads compartilham o modelo; o cache de cada leitora é aberto no próprio estágio
+            _inicializar_worker(modelo_path, replace(config, cache_path=None))
+            linha_esteira = Esteira(_estagios_esteira(config, cache_path, ordenado, max(1, leitores),
+                                                      threads_calculo or os.cpu_count() or 1, tamanho_fila,
+                                                      max(1, chunksize)), fila_saida=tamanho_fila)
+            resultados = linha_esteira.executar(enumerate(imagens))
+            pool = None
+        elif workers is not None and workers <= 1:
+            _inicializar_worker(modelo_path, config)
+            resultados = map(processar_bloco, blocos)
+            pool = None
+        else:
+            pool = Pool(processes=workers, initializer=_inicializar_worker, initargs=(modelo_path, config))
+            mapear = pool.imap if ordenado else pool.imap_unordered
+            resultados = mapear(processar_bloco, blocos)
+
+        try:
+            for saidas in resultados:
+                registros = [saida_img.registro for saida_img in saidas if saida_img.registro is not None]
+                if cache is not None and registros:
+                    cache.gravar_varias(registros)
+                    calculadas += len(registros)
+                for saida_img in saidas:
+                    if saida_img.linha is not None:
+                        escritor.adicionar(saida_img.linha)
+                        if armazem is not None and saida_img.mascara is not None:
+                            armazem.adicionar(saida_img.linha[0], saida_img.mascara)
+                        if metricas is not None:
+                            metricas.registrar(saida_img.linha[0], saida_img.linha[COLUNA_CLASSIFICACAO])
+                    if saida_img.nivel_segmentacao is not None:
+                        niveis[saida_img.nivel_segmentacao] = niveis.get(saida_img.nivel_segmentacao, 0) + 1
+                    if etapas is not None and saida_img.tempos:
+                        etapas.registrar(saida_img.tempos, saida_img.tempos_cpu)
+                    prog.atualizar(sucesso=saida_img.linha is not None)
+                interrompido = metricas.motivo_parada() if metricas is not None else None
+                if interrompido:
+                    break
+        finally:
+            if linha_esteira is not None:
+                resultados.close()  # para e aguarda as threads se o lote foi interrompido
+            if pool is not None:
+                if interrompido:
+                    pool.terminate()  # descarta os blocos ainda na fila
+                else:
+                    pool.close()
+                pool.join()
+            if cache is not None:
+                cache.fechar()
+            if armazem is not None:
+                armazem.fechar()
+            if metricas is not None:
+                metricas.gravar()
+
+    etapas_path = None
+    if etapas is not None:
+        etapas_path = etapas.gravar_csv(prefixo + "_etapas.csv")
+    filas, filas_path = None, None
+    if linha_esteira is not None:
+        filas = linha_esteira.metricas()
+        filas_path = gravar_metricas_esteira(filas, prefixo + "_esteira.csv")
+
+    return {
+        "csv": csv_path,
+        "etapas": etapas_path,
+        "filas": filas,
+        "filas_csv": filas_path,
+        "processadas": prog.concluidas - prog.falhas,
+        "falhas": prog.falhas,
+        "acertos_cache": prog.concluidas - calculadas if cache_path else 0,
+        "puladas": puladas[0],
+        "niveis_segmentacao": niveis,
+        "metricas": metricas.metricas.metricas() if metricas is not None else None,
+        "interrompido": interrompido,
+        "segundos": time.perf_counter() - prog.inicio,
+    }
+
+
+def _modo_relatorio(valor):
+    """Valida o modo de relatório na linha de comando"""
+    try:
+        interpretar_modo_relatorio(valor)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return valor
+
+
+def _minimo(valor):
+    """Valida o --minimo metrica=valor na linha de comando"""
+    from metricas_incrementais import interpretar_minimo  # pandas só com --minimo/--metricas-ao-vivo
+
+    try:
+        return interpretar_minimo(valor)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _shard(valor):
+    """Valida o --shard i/N na linha de comando"""
+    try:
+        return interpretar_shard(valor)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise em lote de lesões cutâneas")
+    parser.add_argument("--imagens", nargs="+", default=[caminho_imgs],
+                        help="pastas (percorridas recursivamente) ou arquivos .zip/.tar com as imagens, "
+                             "lidos sem extrair (ex.: part_1.zip part_2.zip)")
+    parser.add_argument("--incluir", action="append", metavar="PADRAO",
+                        help="padrão glob de arquivos a incluir (padrão: *.jpg e *.jpeg); pode repetir")
+    parser.add_argument("--excluir", action="append", default=[], metavar="PADRAO",
+                        help="padrão glob de arquivos a ignorar; pode repetir")
+    parser.add_argument("--metadata", help="HAM10000_metadata.csv para selecionar um subconjunto")
+    parser.add_argument("--dx", nargs="+", help="só estes diagnósticos (exige --metadata)")
+    parser.add_argument("--localizacao", nargs="+", help="só estas localizações (exige --metadata)")
+    parser.add_argument("--um-por-lesao", action="store_true", help="uma imagem por lesion_id (exige --metadata)")
+    parser.add_argument("--amostra", type=int, help="amostra estratificada por dx de N imagens (exige --metadata)")
+    parser.add_argument("--semente", type=int, default=42, help="semente da amostra")
+    parser.add_argument("--saida", default=saida, help="pasta de saída dos relatórios e do CSV")
+    parser.add_argument("--modelo", default=MODELO_PADRAO, help="caminho do modelo treinado (.pkl ou floresta nativa .npz)")
+    parser.add_argument("--workers", type=int, default=None, help="número de processos (padrão: todos os núcleos)")
+    parser.add_argument("--chunksize", type=int, default=8, help="imagens por tarefa (classificadas numa única chamada ao modelo)")
+    parser.add_argument("--desordenado", action="store_true", help="grava as linhas na ordem de término")
+    parser.add_argument("--relatorios", type=_modo_relatorio, default="png", metavar="MODO",
+                        help="relatórios por imagem: none, text, png, sampled:N ou on-failure (padrão: png)")
+    parser.add_argument("--renderizador", choices=RENDERIZADORES, default="matplotlib",
+                        help="como desenhar o PNG (opencv é mais rápido)")
+    parser.add_argument("--decodificacao", choices=MODOS_DECODIFICACAO, default="full",
+                        help="reduced decodifica o JPEG em cinza a 1/2 da resolução")
+    parser.add_argument("--segmentacao", choices=MODOS_SEGMENTACAO, default="watershed",
+                        help="tiered só roda o watershed quando a máscara morfológica é ambígua "
+                             "(valide antes com benchmarks/segmentacao_niveis.py)")
+    parser.add_argument("--cache-features", metavar="ARQUIVO",
+                        help="cache SQLite das características (só as imagens novas são processadas)")
+    parser.add_argument("--chave-cache", choices=MODOS_CHAVE, default="hash",
+                        help="identifica a imagem pelo hash do conteúdo ou por tamanho + mtime")
+    parser.add_argument("--limpar-cache", action="store_true",
+                        help="remove do cache as entradas de outros parâmetros do pipeline (outra decodificação/segmentação)")
+    parser.add_argument("--resume", "--retomar", dest="retomar", action="store_true",
+                        help="retoma um lote interrompido, pulando as imagens já presentes no CSV")
+    parser.add_argument("--bloco-escrita", type=int, default=50, help="linhas gravadas no CSV por bloco")
+    parser.add_argument("--instrumentar", action="store_true",
+                        help="grava p50/p95/p99 de cada etapa em relatorio_lote_etapas.csv")
+    parser.add_argument("--perfil-amostra", type=int, default=0, metavar="N",
+                        help="com --instrumentar, grava um perfil cProfile de 1 a cada N imagens")
+    parser.add_argument("--memoria-amostra", type=int, default=0, metavar="N",
+                        help="com --instrumentar, grava um relatório tracemalloc de 1 a cada N imagens")
+    parser.add_argument("--cache-mascaras", action="store_true", help="guarda também as máscaras no cache")
+    parser.add_argument("--armazem-mascaras", metavar="ARQUIVO",
+                        help="acrescenta as máscaras (1 bit por pixel) a este armazém; ver armazem_mascaras.py")
+    parser.add_argument("--esteira", action="store_true",
+                        help="threads em vez de processos: leitura adiantada, cálculo e gravação sobrepostos "
+                             "(bom para imagens em disco de rede)")
+    parser.add_argument("--leitores", type=int, default=4, help="com --esteira, threads que leem e decodificam")
+    parser.add_argument("--threads-calculo", type=int, default=None,
+                        help="com --esteira, threads de segmentação/classificação (padrão: todos os núcleos)")
+    parser.add_argument("--fila", type=int, default=32, help="com --esteira, capacidade de cada fila entre estágios")
+    parser.add_argument("--shard", type=_shard, metavar="i/N",
+                        help="processa só o shard i de N e grava relatorio_lote_shard_i_de_N.csv (ver fragmentos.py)")
+    parser.add_argument("--manifesto", help="com --shard, manifesto gerado por fragmentos.py (padrão: hash do image_id)")
+    parser.add_argument("--metricas-ao-vivo", metavar="JSON",
+                        help="acumula acurácia/precisão/recall/F1 por dx, localização e idade durante o lote e "
+                             "grava o snapshot neste JSON (exige --metadata)")
+    parser.add_argument("--metricas-intervalo", type=int, default=100,
+                        help="regrava o snapshot a cada N imagens com rótulo")
+    parser.add_argument("--minimo", type=_minimo, action="append", default=[], metavar="METRICA=VALOR",
+                        help="para o lote se a métrica geral ficar abaixo do valor (ex.: recall=0.8)")
+    parser.add_argument("--minimo-apos", type=int, default=200,
+                        help="só confere os --minimo depois de N imagens com rótulo")
+    args = parser.parse_args(argv)
+
+    subconjunto = args.dx or args.localizacao or args.um_por_lesao or args.amostra is not None
+    if subconjunto and not args.metadata:
+        parser.error("--dx, --localizacao, --um-por-lesao e --amostra exigem --metadata")
+    if (args.metricas_ao_vivo or args.minimo) and not args.metadata:
+        parser.error("--metricas-ao-vivo e --minimo exigem --metadata")
+
+    imagens = iterar_imagens(args.imagens, incluir=args.incluir or PADROES_IMAGEM, excluir=args.excluir)
+    if subconjunto:
+        ids = selecionar_por_metadata(args.metadata, dx=args.dx, localizacao=args.localizacao,
+                                      um_por_lesao=args.um_por_lesao, amostra=args.amostra, semente=args.semente)
+        print(f"🎯 {len(ids)} imagens selecionadas pelo metadata")
+        imagens = filtrar_ids(imagens, ids)
+    nome_csv = "relatorio_lote.csv"
+    if args.manifesto and not args.shard:
+        parser.error("--manifesto exige --shard")
+    if args.shard:
+        i, n = args.shard
+        try:
+            imagens = filtrar_shard(imagens, i, n, args.manifesto)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+        nome_csv = nome_csv_shard(i, n)
+        print(f"🧩 Shard {i} de {n}" + (f" (manifesto {args.manifesto})" if args.manifesto else ""))
+    metricas = None
+    if args.metricas_ao_vivo or args.minimo:
+        from metricas_incrementais import MetricasAoVivo
+        metricas = MetricasAoVivo.do_csv_metadata(args.metadata, caminho=args.metricas_ao_vivo,
+                                                  intervalo=args.metricas_intervalo, minimos=dict(args.minimo),
+                                                  apos=args.minimo_apos)
+    print(f"🔬 Processando imagens de: {', '.join(args.imagens)}")
+
+    try:
+        resumo = run_batch(imagens, args.saida, modelo_path=args.modelo, workers=args.workers,
+                           chunksize=args.chunksize, ordenado=not args.desordenado,
+                           modo_relatorio=args.relatorios, renderizador=args.renderizador,
+                           decodificacao=args.decodificacao, cache_path=args.cache_features,
+                           chave_cache=args.chave_cache, guardar_mascaras=args.cache_mascaras,
+                           retomar=args.retomar, bloco_escrita=args.bloco_escrita, instrumentar=args.instrumentar,
+                           perfil_amostra=args.perfil_amostra, memoria_amostra=args.memoria_amostra,
+                           esteira=args.esteira, leitores=args.leitores, threads_calculo=args.threads_calculo,
+                           tamanho_fila=args.fila, segmentacao=args.segmentacao,
+                           armazem_mascaras=args.armazem_mascaras, nome_csv=nome_csv, metricas=metricas,
+                           limpar_cache=args.limpar_cache)
+    except ColunasIncompativeis as e:
+        print(f"❌ {e}")
+        print("   Use outra --saida (começa um CSV novo) ou rode sem --resume para sobrescrever o CSV atual.")
+        return 1
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✅ Relatório CSV salvo em: {resumo['csv']}")
+    print(f"⏱️ {resumo['processadas']} imagens em {resumo['segundos']:.1f}s "
+          f"({resumo['processadas'] / max(resumo['segundos'], 1e-9):.1f} imagens/s), falhas: {resumo['falhas']}")
+    if resumo['etapas']:
+        print(f"⏱️ Tempos por etapa salvos em: {resumo['etapas']}")
+    if args.segmentacao == 'tiered' and resumo['niveis_segmentacao']:
+        niveis = resumo['niveis_segmentacao']
+        print(f"✂️ Segmentação: {niveis.get('morphology', 0)} sem watershed, {niveis.get('watershed', 0)} com watershed")
+    if resumo['filas']:
+        print(f"🧵 Ocupação das filas salva em: {resumo['filas_csv']}")
+        for fila in resumo['filas']:
+            utilizacao = "" if fila['utilizacao_pct'] is None else f", estágio ocupado {fila['utilizacao_pct']:.0f}%"
+            print(f"   {fila['estagio']:>9}: fila {fila['ocupacao_media']:.1f}/{fila['capacidade']} em média "
+                  f"(máx. {fila['ocupacao_maxima']}), cheia {fila['vezes_cheia']}x{utilizacao}")
+    if args.cache_features:
+        print(f"💾 Acertos no cache de features: {resumo['acertos_cache']}")
+    if resumo['metricas']:
+        m = resumo['metricas']
+        print(f"📊 {m['n']} imagens com rótulo: acurácia {m['acuracia'] * 100:.1f}% | precisão {m['precisao'] * 100:.1f}% "
+              f"| recall {m['recall'] * 100:.1f}% | F1 {m['f1'] * 100:.1f}%")
+        if args.metricas_ao_vivo:
+            print(f"📊 Métricas por dx, localização e idade salvas em: {args.metricas_ao_vivo}")
+    if resumo['interrompido']:
+        print(f"⛔ Lote interrompido: {resumo['interrompido']}")
+        return 1
+    return 0
 
-# Gerar CSV
-csv_path = os.path.join(saida, "relatorio_lote.csv")
-with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(["imagem", "area", "perimetro", "circularidade", "aspect_ratio", "solidez", "classificacao"])
-    writer.writerows(dados_csv)
 
-print(f"✅ Relatório CSV salvo em: {csv_path}")
+if __name__ == "__main__":
+    sys.exit(main())
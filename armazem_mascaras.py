@@ -0,0 +1,216 @@
+"""Armazém de máscaras de segmentação: um arquivo só, com as máscaras em 1 bit por pixel
+
+    py analisar_lote.py --relatorios none --armazem-mascaras results_lote/mascaras.bin
+    py armazem_mascaras.py results_lote/mascaras.bin --features features_mascaras.csv
+
+Cada máscara (256x256 no pipeline) vira um registro de tamanho fixo
+(np.packbits: 8 KiB), acrescentado ao fim do arquivo de dados; o índice ao
+lado (`.idx`, um image_id por linha, na ordem dos registros) diz qual
+registro é de qual imagem. A leitura é um np.memmap do arquivo inteiro:
+acesso aleatório sem abrir um arquivo por imagem, e 10 mil máscaras ocupam
+~82 MB. Reanálises (novas características, revisão, retreino) leem as
+máscaras daqui em vez de rodar o pipeline de novo.
+"""
+import argparse
+import csv
+import os
+import struct
+import sys
+
+import numpy as np
+
+from extrator_features import CAMPOS_FEATURES, alocar_features, extrair_lote
+
+# Cabeçalho fixo: assinatura, versão, altura e largura das máscaras
+ASSINATURA = b"MASCARAS"
+VERSAO = 1
+_CABECALHO = struct.Struct("<8sIII")
+TAMANHO_CABECALHO = 64
+
+
+class ArmazemMascaras:
+    """Máscaras binárias num arquivo de registros fixos, mapeado em memória, indexadas por image_id
+
+    Só acrescenta: gravar de novo um image_id acrescenta outro registro e o
+    índice passa a apontar para ele. As gravações ficam num buffer e vão ao
+    disco em blocos de `tamanho_bloco` (dados primeiro, depois o índice, cada
+    um com fsync); ao reabrir, registros sem linha no índice (processo morto
+    no meio de um bloco) são descartados. Um único processo deve gravar; outros
+    podem ler ao mesmo tempo.
+    """
+
+    def __init__(self, caminho, forma=(256, 256), somente_leitura=False, tamanho_bloco=256):
+        self.caminho = caminho
+        self.caminho_indice = caminho + ".idx"
+        self.somente_leitura = somente_leitura
+        self.tamanho_bloco = tamanho_bloco
+        self._pendentes = []
+        self._mapa = None
+
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as f:
+                assinatura, versao, altura, largura = _CABECALHO.unpack(f.read(_CABECALHO.size))
+            if assinatura != ASSINATURA or versao != VERSAO:
+                raise ValueError(f"{caminho} não é um armazém de máscaras (versão {VERSAO})")
+            self.forma = (altura, largura)
+        elif somente_leitura:
+            raise FileNotFoundError(caminho)
+        else:
+            self.forma = tuple(forma)
+            pasta = os.path.dirname(os.path.abspath(caminho))
+            os.makedirs(pasta, exist_ok=True)
+            with open(caminho, 'wb') as f:
+                f.write(_CABECALHO.pack(ASSINATURA, VERSAO, *self.forma).ljust(TAMANHO_CABECALHO, b"\0"))
+            open(self.caminho_indice, 'w', encoding='utf-8').close()
+
+        self.pixels = self.forma[0] * self.forma[1]
+        self.bytes_registro = (self.pixels + 7) // 8
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        """Lê o índice (só linhas completas) e descarta registros de dados sem linha no índice"""
+        ids = []
+        if os.path.exists(self.caminho_indice):
+            with open(self.caminho_indice, 'rb') as f:
+                conteudo = f.read()
+            fim = conteudo.rfind(b"\n") + 1
+            ids = conteudo[:fim].decode('utf-8').splitlines()
+            if fim < len(conteudo) and not self.somente_leitura:
+                with open(self.caminho_indice, 'rb+') as f:
+                    f.truncate(fim)
+        tamanho = TAMANHO_CABECALHO + len(ids) * self.bytes_registro
+        if os.path.getsize(self.caminho) < tamanho:
+            raise ValueError(f"{self.caminho} tem menos registros que o índice")
+        if os.path.getsize(self.caminho) > tamanho and not self.somente_leitura:
+            with open(self.caminho, 'rb+') as f:
+                f.truncate(tamanho)
+        self.ids = ids
+        # A última gravação de cada image_id vale
+        self.indice = {image_id: i for i, image_id in enumerate(ids)}
+        self._mapa = None
+
+    @property
+    def registros(self):
+        """Matriz (registros x bytes) mapeada do arquivo; refeita só quando o arquivo cresce"""
+        if self._mapa is None or len(self._mapa) != len(self.ids):
+            if not self.ids:
+                return np.empty((0, self.bytes_registro), np.uint8)
+            self._mapa = np.memmap(self.caminho, dtype=np.uint8, mode='r', offset=TAMANHO_CABECALHO,
+                                   shape=(len(self.ids), self.bytes_registro))
+        return self._mapa
+
+    def compactar(self, mascara):
+        """Máscara (forma do armazém, 0/255 ou bool) -> registro de 1 bit por pixel"""
+        mascara = np.asarray(mascara)
+        if mascara.shape != self.forma:
+            raise ValueError(f"Máscara {mascara.shape} não tem a forma do armazém {self.forma}")
+        return np.packbits(mascara > 0).tobytes()
+
+    def adicionar(self, image_id, mascara):
+        """Acrescenta a máscara de `image_id` (array, ou bytes já compactados, ex.: cache_features.compactar_mascara)"""
+        if self.somente_leitura:
+            raise PermissionError(f"{self.caminho} aberto somente para leitura")
+        image_id = str(image_id)
+        if "\n" in image_id or "\r" in image_id:
+            raise ValueError(f"image_id inválido: {image_id!r}")
+        dados = bytes(mascara) if isinstance(mascara, (bytes, bytearray, memoryview)) else self.compactar(mascara)
+        if len(dados) != self.bytes_registro:
+            raise ValueError(f"Registro com {len(dados)} bytes; o armazém usa {self.bytes_registro}")
+        self._pendentes.append((image_id, dados))
+        if len(self._pendentes) >= self.tamanho_bloco:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava o bloco pendente: dados (fsync) e só então o índice (fsync)"""
+        if not self._pendentes:
+            return
+        with open(self.caminho, 'ab') as f:
+            f.write(b"".join(dados for _, dados in self._pendentes))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.caminho_indice, 'a', encoding='utf-8', newline='\n') as f:
+            f.write("".join(f"{image_id}\n" for image_id, _ in self._pendentes))
+            f.flush()
+            os.fsync(f.fileno())
+        for image_id, _ in self._pendentes:
+            self.indice[image_id] = len(self.ids)
+            self.ids.append(image_id)
+        self._pendentes.clear()
+
+    def _expandir(self, linhas):
+        """Registros -> pilha de máscaras uint8 0/255 (k x altura x largura)"""
+        bits = np.unpackbits(linhas, axis=1, count=self.pixels)
+        return np.multiply(bits, 255, out=bits).reshape((len(linhas),) + self.forma)
+
+    def obter(self, image_id):
+        """Máscara de `image_id` (uint8 0/255) ou None se não estiver no armazém"""
+        i = self.indice.get(str(image_id))
+        return None if i is None else self._expandir(self.registros[i:i + 1])[0]
+
+    def __contains__(self, image_id):
+        return str(image_id) in self.indice
+
+    def __len__(self):
+        return len(self.indice)
+
+    def iterar_lotes(self, tamanho=256, ids=None):
+        """Gera (ids, máscaras) em lotes de até `tamanho`, em ordem de registro (leitura sequencial)
+
+        `ids` restringe às imagens pedidas (as ausentes são ignoradas). As
+        máscaras de cada lote vêm numa pilha uint8 (k x altura x largura),
+        pronta para extrator_features.extrair_lote.
+        """
+        if ids is None:
+            linhas = sorted(self.indice.values())
+        else:
+            linhas = sorted(self.indice[str(i)] for i in ids if str(i) in self.indice)
+        registros = self.registros
+        for inicio in range(0, len(linhas), tamanho):
+            bloco = np.asarray(linhas[inicio:inicio + tamanho])
+            yield [self.ids[i] for i in bloco], self._expandir(registros[bloco])
+
+    def extrair_features(self, tamanho=256, ids=None):
+        """Gera (ids, características DTYPE_FEATURES) extraindo lote a lote das máscaras armazenadas
+
+        Sem as imagens, a variância de cor fica NaN (ver extract_features).
+        """
+        saida = alocar_features(tamanho)
+        for lote_ids, mascaras in self.iterar_lotes(tamanho, ids):
+            yield lote_ids, extrair_lote(mascaras, saida=saida)
+
+    def fechar(self):
+        self.descarregar()
+        self._mapa = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta o armazém de máscaras e extrai características dele")
+    parser.add_argument("armazem", help="arquivo do armazém (ex.: results_lote/mascaras.bin)")
+    parser.add_argument("--features", metavar="CSV", help="extrai as características de todas as máscaras para este CSV")
+    parser.add_argument("--lote", type=int, default=256, help="máscaras por lote na extração")
+    args = parser.parse_args(argv)
+
+    armazem = ArmazemMascaras(args.armazem, somente_leitura=True)
+    tamanho = os.path.getsize(args.armazem)
+    print(f"🗂️ {len(armazem)} máscaras {armazem.forma[0]}x{armazem.forma[1]} "
+          f"({len(armazem.ids)} registros, {tamanho / 1024 ** 2:.1f} MB)")
+    if args.features:
+        with open(args.features, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(("imagem",) + CAMPOS_FEATURES)
+            for ids, features in armazem.extrair_features(args.lote):
+                for image_id, linha in zip(ids, features):
+                    if linha['valida']:
+                        writer.writerow([image_id] + [round(float(linha[c]), 2) for c in CAMPOS_FEATURES])
+        print(f"✅ Características salvas em: {args.features}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Verifica com tracemalloc que o pipeline com ContextoPipeline não aloca por imagem.
+
+Decodifica as imagens sintéticas antes da medição (a decodificação sempre
+aloca) e mede, imagem a imagem, o pico de memória alocada pelo
+pré-processamento, segmentação e extração de características, com e sem o
+contexto de buffers, e quanto de cada imagem continua alocado depois dela
+(vazamento). Também confere que as máscaras e características são idênticas
+nos dois casos. Sai com código 1 se a alocação com contexto não for plana:
+algum pico acima de --limite-kb, picos da segunda metade do lote acima dos da
+primeira por mais de --crescimento-kb, ou mais de --retido-kb retidos por
+imagem:
+
+    py benchmarks/alocacao.py --imagens 50
+
+Uma versão com limites fixos roda no pytest (tests/test_alocacao.py).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import cv2
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lesion_analyzer import SkinLesionAnalyzer, EtapasLesao, ContextoPipeline  # noqa: E402
+from sinteticas import gerar_conjunto  # noqa: E402
+
+
+def medir(imagens, contexto, aquecimento=3):
+    """Pico e memória retida (bytes) de cada imagem, além das máscaras e características obtidas
+
+    Retida: o que a imagem deixou alocado depois de descartadas as etapas
+    (além das próprias características, ~0,5 KiB). Um vazamento aparece aqui,
+    imagem após imagem, mesmo que nunca aumente o pico.
+    """
+    analyzer = SkinLesionAnalyzer("memoria", report_mode='none', contexto=contexto,
+                                  output_dir=tempfile.gettempdir())
+    picos, retidos, mascaras, features = [], [], [], []
+    for i, imagem in enumerate(imagens):
+        tracemalloc.start()
+        etapas = EtapasLesao(analyzer, entrada=imagem)
+        features.append(etapas.features)
+        _, pico = tracemalloc.get_traced_memory()
+        mascara = etapas.mask
+        del etapas
+        retido, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        mascaras.append(mascara.copy())
+        if i >= aquecimento:
+            picos.append(pico)
+            retidos.append(retido)
+    return np.asarray(picos), np.asarray(retidos), mascaras, features
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Alocação por imagem com e sem ContextoPipeline")
+    parser.add_argument("--imagens", type=int, default=30, help="quantidade de imagens sintéticas")
+    parser.add_argument("--decodificacao", choices=("full", "reduced"), default="full")
+    parser.add_argument("--limite-kb", type=float, default=64.0,
+                        help="pico máximo aceito por imagem com contexto (KiB)")
+    parser.add_argument("--crescimento-kb", type=float, default=16.0,
+                        help="quanto o pico médio da 2ª metade do lote pode passar o da 1ª (KiB)")
+    parser.add_argument("--retido-kb", type=float, default=2.0,
+                        help="memória retida média máxima por imagem com contexto (KiB)")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    modo = cv2.IMREAD_COLOR if args.decodificacao == "full" else cv2.IMREAD_REDUCED_GRAYSCALE_2
+    with tempfile.TemporaryDirectory(prefix="alocacao_") as tmp:
+        caminhos = gerar_conjunto(tmp, args.imagens, args.semente)
+        imagens = [cv2.imread(c, modo) for c in caminhos]
+
+    sem, _, mascaras_sem, features_sem = medir(imagens, None)
+    com, retidos, mascaras_com, features_com = medir(imagens, ContextoPipeline())
+
+    iguais = (features_sem == features_com
+              and all(np.array_equal(a, b) for a, b in zip(mascaras_sem, mascaras_com)))
+    print(f"Sem contexto: pico médio {sem.mean() / 1024:.1f} KiB por imagem (máx. {sem.max() / 1024:.1f})")
+    print(f"Com contexto: pico médio {com.mean() / 1024:.1f} KiB por imagem (máx. {com.max() / 1024:.1f})")
+    metade = len(com) // 2
+    crescimento = com[metade:].mean() - com[:metade].mean() if metade else 0.0
+    print(f"Com contexto: pico médio 2ª metade - 1ª metade {crescimento / 1024:+.1f} KiB | "
+          f"retido {retidos.mean() / 1024:.2f} KiB por imagem")
+    print(f"Máscaras e características idênticas: {'sim' if iguais else 'NÃO'}")
+
+    # "Plano": nenhum pico passa do limite e não há crescimento ao longo do lote
+    plano = True
+    if com.max() > args.limite_kb * 1024:
+        plano = False
+        print(f"❌ Alocação com contexto acima de {args.limite_kb} KiB por imagem")
+    if crescimento > args.crescimento_kb * 1024:
+        plano = False
+        print(f"❌ Pico com contexto cresce ao longo do lote ({crescimento / 1024:+.1f} KiB)")
+    if retidos.size and retidos.mean() > args.retido_kb * 1024:
+        plano = False
+        print(f"❌ {retidos.mean() / 1024:.2f} KiB retidos por imagem com contexto (vazamento?)")
+    return 0 if iguais and plano else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
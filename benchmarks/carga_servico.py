@@ -0,0 +1,153 @@
+"""Teste de carga do serviço (servico.py) com clientes concorrentes e imagens sintéticas.
+
+Sobe o serviço no próprio processo (pool de workers + servidor HTTP numa
+porta livre), dispara `--concorrencia` conexões keep-alive enviando JPEGs
+sintéticos e mede a latência de ponta a ponta de cada requisição. Confere
+também que as classificações batem com o SkinLesionAnalyzer lendo os mesmos
+arquivos. Sai com código 1 se o p95 passar de `--limite-ms`:
+
+    py benchmarks/carga_servico.py --requisicoes 400 --concorrencia 8 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from desempenho import treinar_modelo_sintetico  # noqa: E402
+from lesion_analyzer import SkinLesionAnalyzer  # noqa: E402
+from servico import ServicoAnalise, MetricasServico, _atender, PERCENTIS  # noqa: E402
+from sinteticas import gerar_conjunto  # noqa: E402
+
+
+async def _requisitar(reader, writer, alvo, corpo=b""):
+    metodo = "POST" if corpo else "GET"
+    writer.write(f"{metodo} {alvo} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(corpo)}\r\n\r\n"
+                 .encode("latin-1") + corpo)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    tamanho = 0
+    while (linha := await reader.readline()) not in (b"\r\n", b""):
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        if nome.strip().lower() == "content-length":
+            tamanho = int(valor)
+    return status, json.loads(await reader.readexactly(tamanho))
+
+
+async def _cliente(porta, fila, conteudos, latencias, respostas):
+    reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+    try:
+        while True:
+            try:
+                i = fila.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            inicio = time.perf_counter()
+            corpo = conteudos[i % len(conteudos)]
+            status, resposta = await _requisitar(reader, writer, f"/analisar?nome={i}", corpo)
+            latencias.append(time.perf_counter() - inicio)
+            respostas[i] = (status, resposta)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def carga(servico, conteudos, requisicoes, concorrencia):
+    """Dispara as requisições com `concorrencia` conexões; devolve latências, respostas e métricas"""
+    servidor = await asyncio.start_server(lambda r, w: _atender(servico, r, w), "127.0.0.1", 0)
+    porta = servidor.sockets[0].getsockname()[1]
+    async with servidor:
+        # Aquecimento: uma requisição por worker fora da medição
+        await asyncio.gather(*(_cliente(porta, _fila(range(servico.workers)), conteudos, [], {})
+                               for _ in range(servico.workers)))
+        servico.metricas = MetricasServico(servico.metricas.janela)
+
+        fila = _fila(range(requisicoes))
+        latencias, respostas = [], {}
+        inicio = time.perf_counter()
+        await asyncio.gather(*(_cliente(porta, fila, conteudos, latencias, respostas)
+                               for _ in range(concorrencia)))
+        segundos = time.perf_counter() - inicio
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+        _, metricas = await _requisitar(reader, writer, "/metricas")
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.sleep(0.05)  # deixa o servidor ver o fim das conexões antes de fechar
+    return np.asarray(latencias) * 1e3, respostas, metricas, segundos
+
+
+def _fila(itens):
+    fila = asyncio.Queue()
+    for item in itens:
+        fila.put_nowait(item)
+    return fila
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latência do serviço de análise sob carga concorrente")
+    parser.add_argument("--imagens", type=int, default=50, help="quantidade de imagens sintéticas distintas")
+    parser.add_argument("--requisicoes", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=8, help="conexões simultâneas")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lote-max", type=int, default=16)
+    parser.add_argument("--decodificacao", choices=("full", "reduced"), default="full")
+    parser.add_argument("--limite-ms", type=float, default=100.0, help="p95 máximo aceito (ms)")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench_servico_") as tmp:
+        caminhos = gerar_conjunto(os.path.join(tmp, "imagens"), args.imagens, args.semente)
+        modelo_path = treinar_modelo_sintetico(os.path.join(tmp, "modelo.pkl"), args.semente)
+        conteudos = []
+        for caminho in caminhos:
+            with open(caminho, "rb") as f:
+                conteudos.append(f.read())
+        esperadas = [SkinLesionAnalyzer(c, modelo_path=modelo_path, report_mode='none',
+                                        decode_mode=args.decodificacao).analyze(verbose=False).classification
+                     for c in caminhos]
+
+        servico = ServicoAnalise(modelo_path, args.workers, args.lote_max, decodificacao=args.decodificacao)
+        servico.iniciar()
+        try:
+            latencias, respostas, metricas, segundos = asyncio.run(
+                carga(servico, conteudos, args.requisicoes, args.concorrencia))
+        finally:
+            servico.encerrar()
+
+    divergentes = sum(1 for i, (status, resposta) in respostas.items()
+                      if status != 200 or resposta.get("classificacao") != esperadas[i % len(esperadas)])
+    resultado = {
+        "requisicoes": args.requisicoes,
+        "concorrencia": args.concorrencia,
+        "workers": args.workers,
+        "requisicoes_s": args.requisicoes / segundos,
+        "latencia_ms": {f"p{p}": float(v) for p, v in zip(PERCENTIS, np.percentile(latencias, PERCENTIS))},
+        "divergentes": divergentes,
+        "metricas_servico": metricas,
+    }
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    print(texto)
+
+    p95 = resultado["latencia_ms"]["p95"]
+    if p95 > args.limite_ms:
+        print(f"❌ p95 de {p95:.1f} ms acima do limite de {args.limite_ms} ms")
+    if divergentes:
+        print(f"❌ {divergentes} respostas diferentes da análise direta")
+    return 0 if p95 <= args.limite_ms and not divergentes else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
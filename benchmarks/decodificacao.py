@@ -0,0 +1,101 @@
+"""Compara a decodificação completa com a reduzida (IMREAD_REDUCED_GRAYSCALE_2).
+
+Mede o tempo de decodificação + conversão para o 256x256 em cinza usado pelo
+pré-processamento e a diferença nas características extraídas entre os dois modos.
+
+    py benchmarks/decodificacao.py --pasta ham10000/teste100 --repeticoes 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lesion_analyzer import SkinLesionAnalyzer, COLUNAS_MODELO  # noqa: E402
+
+
+def decodificar(caminho, modo):
+    """Decodifica e reduz para 256x256 em cinza, como o início de preprocess_image"""
+    if modo == 'full':
+        gray = cv2.cvtColor(cv2.imread(caminho), cv2.COLOR_BGR2GRAY)
+    else:
+        gray = cv2.imread(caminho, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    return cv2.resize(gray, (256, 256))
+
+
+def medir_decodificacao(caminhos, modo, repeticoes):
+    """Tempo médio (ms) de decodificação por imagem"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for caminho in caminhos:
+            decodificar(caminho, modo)
+    return (time.perf_counter() - inicio) * 1000 / (repeticoes * len(caminhos))
+
+
+def extrair(caminho, modo):
+    """Características extraídas pelo analisador no modo de decodificação dado"""
+    analyzer = SkinLesionAnalyzer(caminho, decode_mode=modo, report_mode='none')
+    resultado = analyzer.analyze(verbose=False, classify=False)
+    return resultado.features
+
+
+def comparar_features(caminhos):
+    """Diferença relativa média/máxima por característica entre 'full' e 'reduced'"""
+    diferencas = {nome: [] for nome in COLUNAS_MODELO}
+    falhas = 0
+    for caminho in caminhos:
+        completa, reduzida = extrair(caminho, 'full'), extrair(caminho, 'reduced')
+        if not completa or not reduzida:
+            falhas += 1
+            continue
+        for nome in COLUNAS_MODELO:
+            base = abs(completa[nome]) or 1.0
+            diferencas[nome].append(abs(completa[nome] - reduzida[nome]) / base)
+    resumo = {
+        nome: {"media": float(np.mean(v)), "max": float(np.max(v))} if v else None
+        for nome, v in diferencas.items()
+    }
+    return resumo, falhas
+
+
+def main(argv=None):
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Benchmark da decodificação reduzida de JPEG")
+    parser.add_argument("--pasta", default=os.path.join(raiz, "samples"), help="pasta com imagens .jpg")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--json", help="grava o resultado neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    caminhos = [os.path.join(args.pasta, n) for n in sorted(os.listdir(args.pasta))
+                if n.lower().endswith((".jpg", ".jpeg"))]
+    if not caminhos:
+        parser.error(f"nenhuma imagem .jpg em {args.pasta}")
+
+    tempos = {modo: medir_decodificacao(caminhos, modo, args.repeticoes) for modo in ('full', 'reduced')}
+    diferencas, falhas = comparar_features(caminhos)
+
+    print(f"🔬 {len(caminhos)} imagens, {args.repeticoes} repetições")
+    for modo, ms in tempos.items():
+        print(f"- {modo:8s}: {ms:.2f} ms/imagem")
+    print(f"- ganho   : {tempos['full'] / tempos['reduced']:.2f}x")
+    print("📏 Diferença relativa das características (full x reduced):")
+    for nome, d in diferencas.items():
+        if d:
+            print(f"- {nome:13s}: média {d['media'] * 100:.2f}% | máx {d['max'] * 100:.2f}%")
+    if falhas:
+        print(f"⚠️ {falhas} imagens sem características em algum dos modos")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"imagens": len(caminhos), "ms_por_imagem": tempos,
+                       "diferenca_features": diferencas, "falhas": falhas}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Benchmark reprodutível do pipeline com imagens sintéticas (roda offline, sem a HAM10000).
+
+Mede a latência de cada etapa do SkinLesionAnalyzer e a vazão do lote
+(analisar_lote.run_batch) com 1 e N processos, além do pico de memória (RSS),
+e grava tudo em JSON para comparar commits:
+
+    py benchmarks/desempenho.py --imagens 200 --workers 1 4 --json bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analisar_lote import run_batch  # noqa: E402
+from instrumentacao import Instrumentacao  # noqa: E402
+from lesion_analyzer import SkinLesionAnalyzer, COLUNAS_MODELO  # noqa: E402
+from sinteticas import gerar_conjunto  # noqa: E402
+
+
+def treinar_modelo_sintetico(caminho, semente=0):
+    """Treina uma floresta pequena com características aleatórias (só para o benchmark ter um modelo)"""
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(semente)
+    X = pd.DataFrame(rng.random((500, len(COLUNAS_MODELO))) * [20000, 800, 1, 2, 1],
+                     columns=list(COLUNAS_MODELO.values()))
+    y = np.where(X["circularidade"] < 0.4, "SUSPEITA", "PROVAVELMENTE BENIGNA")
+    modelo = RandomForestClassifier(n_estimators=100, random_state=semente).fit(X, y)
+    joblib.dump(modelo, caminho)
+    return caminho
+
+
+def medir_etapas(caminhos, modelo_path, decodificacao):
+    """Latência por etapa (parede e CPU) rodando o analisador no próprio processo"""
+    instr = Instrumentacao()
+    falhas = 0
+    for caminho in caminhos:
+        analyzer = SkinLesionAnalyzer(caminho, modelo_path=modelo_path, report_mode='none',
+                                      decode_mode=decodificacao, instrumentacao=instr,
+                                      output_dir=os.path.dirname(caminho))
+        if not analyzer.analyze(verbose=False).sucesso:
+            falhas += 1
+    return instr.resumo(), falhas
+
+
+def medir_lote(caminhos, modelo_path, workers, saida, chunksize, decodificacao):
+    """Vazão do lote completo (imagens/s) com `workers` processos"""
+    inicio = time.perf_counter()
+    resumo = run_batch(caminhos, saida, modelo_path=modelo_path, workers=workers, chunksize=chunksize,
+                       progresso=False, modo_relatorio='none', decodificacao=decodificacao)
+    segundos = time.perf_counter() - inicio
+    return {
+        "workers": workers,
+        "segundos": segundos,
+        "imagens_s": len(caminhos) / segundos,
+        "falhas": resumo["falhas"],
+    }
+
+
+def pico_rss_kb():
+    """Pico de memória residente do processo e dos filhos já encerrados (KiB no Linux)"""
+    return {
+        "processo": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "filhos": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=RAIZ, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de análise de lesões")
+    parser.add_argument("--imagens", type=int, default=100, help="quantidade de imagens sintéticas")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="números de processos a medir no lote")
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--decodificacao", choices=("full", "reduced"), default="full")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--json", help="grava o resultado neste arquivo (padrão: só na saída padrão)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench_lesoes_") as tmp:
+        caminhos = gerar_conjunto(os.path.join(tmp, "imagens"), args.imagens, args.semente)
+        modelo_path = treinar_modelo_sintetico(os.path.join(tmp, "modelo.pkl"), args.semente)
+
+        etapas, falhas = medir_etapas(caminhos, modelo_path, args.decodificacao)
+        lotes = [medir_lote(caminhos, modelo_path, w, os.path.join(tmp, f"lote_{w}"), args.chunksize,
+                            args.decodificacao)
+                 for w in dict.fromkeys(args.workers)]
+
+    resultado = {
+        "commit": commit_atual(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "cpus": os.cpu_count(),
+        "imagens": args.imagens,
+        "decodificacao": args.decodificacao,
+        "etapas_ms": etapas,
+        "falhas_etapas": falhas,
+        "lote": lotes,
+        "pico_rss_kb": pico_rss_kb(),
+    }
+
+    texto = json.dumps(resultado, indent=2)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
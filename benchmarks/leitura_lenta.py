@@ -0,0 +1,101 @@
+"""Compara o lote em processos com o lote em esteira (threads) quando a leitura das imagens é lenta.
+
+Simula um disco de rede somando `--latencia-ms` a cada leitura de imagem
+(cv2.imread no modo em processos, leitura dos bytes no modo esteira) e mede a
+vazão de cada modo. Os CSVs têm de sair idênticos; o código de saída é 1 se
+não saírem.
+
+    py benchmarks/leitura_lenta.py --imagens 200 --latencia-ms 20 --workers 1 4 --leitores 8
+"""
+import argparse
+import builtins
+import filecmp
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import analisar_lote  # noqa: E402
+from desempenho import treinar_modelo_sintetico  # noqa: E402
+from sinteticas import gerar_conjunto  # noqa: E402
+
+
+def simular_latencia(segundos):
+    """Atrasa cada leitura de imagem em `segundos` (vale também nos processos filhos criados por fork)"""
+    imread = cv2.imread
+
+    def imread_lento(*args, **kwargs):
+        time.sleep(segundos)
+        return imread(*args, **kwargs)
+
+    def open_lento(arquivo, modo='r', *args, **kwargs):
+        if 'b' in modo and str(arquivo).lower().endswith(('.jpg', '.jpeg')):
+            time.sleep(segundos)
+        return builtins.open(arquivo, modo, *args, **kwargs)
+
+    cv2.imread = imread_lento
+    analisar_lote.open = open_lento  # só a leitora da esteira usa open() para as imagens
+
+
+def medir(caminhos, saida, modelo_path, relatorios, **opcoes):
+    inicio = time.perf_counter()
+    resumo = analisar_lote.run_batch(caminhos, saida, modelo_path=modelo_path, progresso=False,
+                                     modo_relatorio=relatorios, **opcoes)
+    segundos = time.perf_counter() - inicio
+    return resumo, {"segundos": segundos, "imagens_s": len(caminhos) / segundos, "falhas": resumo["falhas"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--imagens", type=int, default=120, help="quantidade de imagens sintéticas")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="atraso simulado por leitura")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="processos do modo em processos")
+    parser.add_argument("--leitores", type=int, default=8, help="threads leitoras da esteira")
+    parser.add_argument("--threads-calculo", type=int, default=None, help="threads de cálculo da esteira")
+    parser.add_argument("--relatorios", default="none", help="modo de relatório dos dois lotes")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminhos = gerar_conjunto(os.path.join(pasta, "imagens"), args.imagens)
+        modelo_path = treinar_modelo_sintetico(os.path.join(pasta, "modelo.pkl"))
+        simular_latencia(args.latencia_ms / 1000)
+
+        resultados = {"imagens": args.imagens, "latencia_ms": args.latencia_ms, "processos": [], "esteira": None}
+        csvs = []
+        for workers in args.workers:
+            resumo, medida = medir(caminhos, os.path.join(pasta, f"processos_{workers}"), modelo_path,
+                                   args.relatorios, workers=workers)
+            resultados["processos"].append(dict(medida, workers=workers))
+            csvs.append(resumo["csv"])
+            print(f"processos={workers}: {medida['imagens_s']:.1f} imagens/s")
+
+        resumo, medida = medir(caminhos, os.path.join(pasta, "esteira"), modelo_path, args.relatorios,
+                               esteira=True, leitores=args.leitores, threads_calculo=args.threads_calculo)
+        resultados["esteira"] = dict(medida, leitores=args.leitores, filas=resumo["filas"])
+        csvs.append(resumo["csv"])
+        print(f"esteira (leitores={args.leitores}): {medida['imagens_s']:.1f} imagens/s")
+        for fila in resumo["filas"]:
+            utilizacao = "-" if fila["utilizacao_pct"] is None else f"{fila['utilizacao_pct']:.0f}%"
+            print(f"   {fila['estagio']:>9}: ocupação média {fila['ocupacao_media_pct']:.0f}%, "
+                  f"cheia {fila['vezes_cheia']}x, estágio ocupado {utilizacao}")
+
+        iguais = all(filecmp.cmp(csvs[0], outro, shallow=False) for outro in csvs[1:])
+        resultados["csv_identico"] = iguais
+        print("✅ CSVs idênticos" if iguais else "❌ CSVs diferentes entre os modos")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    return 0 if iguais else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Mede o armazém de máscaras (armazem_mascaras.py) contra um PNG por máscara.
+
+Gera máscaras 256x256 sintéticas (elipses irregulares), grava no armazém e em
+PNGs, e mede tamanho em disco, acesso aleatório, leitura em lote e extração
+de características direto do armazém. O código de saída é 1 se alguma máscara
+não voltar idêntica ou se o armazém passar de --limite-mb.
+
+    py benchmarks/leitura_mascaras.py --mascaras 10000 --limite-mb 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazem_mascaras import ArmazemMascaras  # noqa: E402
+from extrator_features import extrair_lote  # noqa: E402
+
+
+def gerar_mascara(rng, lado=256):
+    """Elipse com borda ondulada, parecida com uma lesão segmentada"""
+    angulos = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+    raio = rng.uniform(30, 100) * (1 + rng.uniform(0.02, 0.2) * np.sin(rng.integers(2, 7) * angulos))
+    centro = rng.uniform(lado * 0.35, lado * 0.65, 2)
+    pontos = np.stack([centro[0] + raio * np.cos(angulos), centro[1] + raio * rng.uniform(0.6, 1) * np.sin(angulos)],
+                      axis=1)
+    mascara = np.zeros((lado, lado), np.uint8)
+    cv2.fillPoly(mascara, [np.round(pontos).astype(np.int32)], 255)
+    return mascara
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do armazém de máscaras")
+    parser.add_argument("--mascaras", type=int, default=2000)
+    parser.add_argument("--lote", type=int, default=256, help="máscaras por lote na leitura em lote")
+    parser.add_argument("--aleatorias", type=int, default=1000, help="leituras aleatórias medidas")
+    parser.add_argument("--limite-mb", type=float, default=None, help="falha se o armazém passar disto")
+    parser.add_argument("--json", help="grava o resultado neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    mascaras = [gerar_mascara(rng) for _ in range(args.mascaras)]
+    ids = [f"ISIC_{i:07d}" for i in range(args.mascaras)]
+    resultado = {"mascaras": args.mascaras}
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "mascaras.bin")
+        inicio = time.perf_counter()
+        with ArmazemMascaras(caminho) as armazem:
+            for image_id, mascara in zip(ids, mascaras):
+                armazem.adicionar(image_id, mascara)
+        resultado["gravacao_s"] = time.perf_counter() - inicio
+        resultado["armazem_mb"] = (os.path.getsize(caminho) + os.path.getsize(caminho + ".idx")) / 1024 ** 2
+
+        pasta_png = os.path.join(pasta, "png")
+        os.makedirs(pasta_png)
+        for image_id, mascara in zip(ids, mascaras):
+            cv2.imwrite(os.path.join(pasta_png, f"{image_id}_mask.png"), mascara)
+        resultado["png_mb"] = sum(e.stat().st_size for e in os.scandir(pasta_png)) / 1024 ** 2
+
+        armazem = ArmazemMascaras(caminho, somente_leitura=True)
+        sorteadas = rng.integers(0, args.mascaras, args.aleatorias)
+        inicio = time.perf_counter()
+        for i in sorteadas:
+            armazem.obter(ids[i])
+        resultado["aleatoria_us"] = (time.perf_counter() - inicio) * 1e6 / args.aleatorias
+        inicio = time.perf_counter()
+        for i in sorteadas:
+            cv2.imread(os.path.join(pasta_png, f"{ids[i]}_mask.png"), cv2.IMREAD_GRAYSCALE)
+        resultado["png_aleatoria_us"] = (time.perf_counter() - inicio) * 1e6 / args.aleatorias
+
+        inicio = time.perf_counter()
+        lidas = {}
+        for lote_ids, lote in armazem.iterar_lotes(args.lote):
+            lidas.update(zip(lote_ids, lote))
+        resultado["lote_mascaras_s"] = args.mascaras / (time.perf_counter() - inicio)
+        identicas = len(lidas) == args.mascaras and all(
+            np.array_equal(lidas[image_id], mascara) for image_id, mascara in zip(ids, mascaras))
+
+        inicio = time.perf_counter()
+        for _ in armazem.extrair_features(args.lote):
+            pass
+        resultado["features_armazem_mascaras_s"] = args.mascaras / (time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        for comeco in range(0, args.mascaras, args.lote):
+            extrair_lote([cv2.imread(os.path.join(pasta_png, f"{i}_mask.png"), cv2.IMREAD_GRAYSCALE)
+                          for i in ids[comeco:comeco + args.lote]])
+        resultado["features_png_mascaras_s"] = args.mascaras / (time.perf_counter() - inicio)
+        resultado["identicas"] = bool(identicas)
+
+    print(f"🗂️ {args.mascaras} máscaras: armazém {resultado['armazem_mb']:.1f} MB | PNGs {resultado['png_mb']:.1f} MB "
+          f"(gravação do armazém {resultado['gravacao_s']:.2f}s)")
+    print(f"🎯 Acesso aleatório: {resultado['aleatoria_us']:.0f} µs (armazém) x "
+          f"{resultado['png_aleatoria_us']:.0f} µs (PNG)")
+    print(f"📦 Leitura em lote: {resultado['lote_mascaras_s']:.0f} máscaras/s")
+    print(f"📏 Características: {resultado['features_armazem_mascaras_s']:.0f} máscaras/s (armazém) x "
+          f"{resultado['features_png_mascaras_s']:.0f} máscaras/s (PNG)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+    if not identicas:
+        print("❌ Máscaras lidas diferentes das gravadas")
+        return 1
+    if args.limite_mb is not None and resultado["armazem_mb"] > args.limite_mb:
+        print(f"❌ Armazém com {resultado['armazem_mb']:.1f} MB (limite {args.limite_mb} MB)")
+        return 1
+    print("✅ Máscaras idênticas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
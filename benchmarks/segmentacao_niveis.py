@@ -0,0 +1,145 @@
+"""Valida a segmentação em níveis: máscara morfológica (nível 1) x watershed completo.
+
+Para cada imagem calcula as características com as duas máscaras, as medidas
+da verificação barata (lesion_analyzer.medir_mascara) e o tempo de
+segmentação nos modos 'watershed' e 'tiered'. Com os critérios dados, mostra
+quantas imagens dispensariam o watershed, a diferença nas características
+dessas imagens, a concordância da classificação (com --modelo) e o ganho de
+tempo. O código de saída é 1 se a discordância passar de --discordancia-max.
+
+    py benchmarks/segmentacao_niveis.py --pasta ham10000/teste100 --modelo modelo_random_forest.pkl
+    py benchmarks/segmentacao_niveis.py --pasta ham10000/teste100 --preenchimento-min 0.95 --json niveis.json
+    py benchmarks/segmentacao_niveis.py --imagens 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lesion_analyzer import (SkinLesionAnalyzer, COLUNAS_MODELO, CRITERIOS_MASCARA_LIMPA,  # noqa: E402
+                             medir_mascara, mascara_limpa, classificar_lote)
+from registro_modelos import carregar_modelo  # noqa: E402
+from sinteticas import gerar_conjunto  # noqa: E402
+
+FEATURES_COMPARADAS = tuple(COLUNAS_MODELO) + ('asymmetry', 'border_irregularity', 'color_variance', 'diameter')
+
+
+def medir_imagem(caminho, decodificacao):
+    """Medidas da máscara, features nos dois níveis e ms de segmentação nos dois modos (None se falhar)"""
+    analyzer = SkinLesionAnalyzer(caminho, report_mode='none', decode_mode=decodificacao)
+    imagem = analyzer.load_image()
+    if imagem is None:
+        return None
+    closing = analyzer.binarize(analyzer.preprocess_image(imagem))
+    morfologia = analyzer.extract_features(closing, imagem)
+
+    tempos = {}
+    for modo in ('watershed', 'tiered'):
+        resultado = SkinLesionAnalyzer(caminho, report_mode='none', decode_mode=decodificacao,
+                                       segmentation_mode=modo).analyze(save_report=False, verbose=False,
+                                                                       classify=False)
+        if not resultado.sucesso:
+            return None
+        tempos[modo] = resultado.timings['segment_lesion'] * 1e3
+        if modo == 'watershed':
+            watershed = resultado.features
+    return {"imagem": os.path.basename(caminho), "medidas": medir_mascara(closing),
+            "morfologia": morfologia, "watershed": watershed, "ms": tempos}
+
+
+def diferencas(linhas):
+    """Diferença relativa (média, p95, máx.) de cada característica entre os dois níveis"""
+    resumo = {}
+    for nome in FEATURES_COMPARADAS:
+        valores = [abs(l["morfologia"][nome] - l["watershed"][nome]) / (abs(l["watershed"][nome]) or 1.0)
+                   for l in linhas if np.isfinite(l["morfologia"][nome]) and np.isfinite(l["watershed"][nome])]
+        if valores:
+            resumo[nome] = {"media": float(np.mean(valores)), "p95": float(np.percentile(valores, 95)),
+                            "max": float(np.max(valores))}
+    return resumo
+
+
+def concordancia(modelo, linhas):
+    """Fração das imagens com a mesma classificação nos dois níveis (None sem modelo ou sem imagens)"""
+    if modelo is None or not linhas:
+        return None
+    morfologia = classificar_lote(modelo, [l["morfologia"] for l in linhas])
+    watershed = classificar_lote(modelo, [l["watershed"] for l in linhas])
+    return float(np.mean([a == b for a, b in zip(morfologia, watershed)]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validação da segmentação em níveis (morfologia x watershed)")
+    parser.add_argument("--pasta", help="pasta com imagens .jpg (no lugar das sintéticas)")
+    parser.add_argument("--imagens", type=int, default=100, help="quantidade de imagens sintéticas")
+    parser.add_argument("--modelo", help="modelo treinado (.pkl ou .npz) para comparar as classificações")
+    parser.add_argument("--decodificacao", choices=("full", "reduced"), default="full")
+    for nome, valor in CRITERIOS_MASCARA_LIMPA.items():
+        parser.add_argument(f"--{nome.replace('_', '-')}", type=float, default=valor,
+                            help=f"critério da máscara limpa (padrão: {valor})")
+    parser.add_argument("--discordancia-max", type=float, default=None,
+                        help="falha (código 1) se a fração de classificações diferentes nas imagens "
+                             "de nível 1 passar disto")
+    parser.add_argument("--json", help="grava o resultado (com as medidas por imagem) neste arquivo")
+    args = parser.parse_args(argv)
+    criterios = {nome: getattr(args, nome) for nome in CRITERIOS_MASCARA_LIMPA}
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        if args.pasta:
+            caminhos = [os.path.join(args.pasta, n) for n in sorted(os.listdir(args.pasta))
+                        if n.lower().endswith((".jpg", ".jpeg"))]
+        else:
+            caminhos = gerar_conjunto(temporaria, args.imagens)
+        if not caminhos:
+            parser.error(f"nenhuma imagem .jpg em {args.pasta}")
+        linhas = [m for m in (medir_imagem(c, args.decodificacao) for c in caminhos) if m is not None]
+
+    for linha in linhas:
+        linha["nivel"] = "morphology" if mascara_limpa(linha["medidas"], criterios) else "watershed"
+    nivel1 = [l for l in linhas if l["nivel"] == "morphology"]
+    modelo = carregar_modelo(args.modelo) if args.modelo else None
+
+    ms = {modo: float(np.mean([l["ms"][modo] for l in linhas])) for modo in ("watershed", "tiered")}
+    resultado = {
+        "imagens": len(linhas),
+        "falhas": len(caminhos) - len(linhas),
+        "criterios": criterios,
+        "nivel1": len(nivel1),
+        "segmentacao_ms": ms,
+        "diferenca_nivel1": diferencas(nivel1),
+        "diferenca_todas": diferencas(linhas),
+        "concordancia_nivel1": concordancia(modelo, nivel1),
+        "concordancia_todas": concordancia(modelo, linhas),
+    }
+
+    print(f"🔬 {len(linhas)} imagens ({resultado['falhas']} falhas)")
+    print(f"✂️ Nível 1 (sem watershed): {len(nivel1)} imagens ({100 * len(nivel1) / max(len(linhas), 1):.0f}%)")
+    print(f"⏱️ segment_lesion: watershed {ms['watershed']:.2f} ms | tiered {ms['tiered']:.2f} ms "
+          f"({ms['watershed'] / max(ms['tiered'], 1e-9):.2f}x)")
+    print("📏 Diferença relativa nas imagens de nível 1 (morfologia x watershed):")
+    for nome, d in resultado["diferenca_nivel1"].items():
+        print(f"- {nome:19s}: média {d['media'] * 100:.2f}% | p95 {d['p95'] * 100:.2f}% | máx {d['max'] * 100:.2f}%")
+    if resultado["concordancia_nivel1"] is not None:
+        print(f"🏷️ Mesma classificação: {resultado['concordancia_nivel1'] * 100:.1f}% no nível 1 | "
+              f"{resultado['concordancia_todas'] * 100:.1f}% se todas dispensassem o watershed")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(dict(resultado, por_imagem=linhas), f, indent=2, ensure_ascii=False)
+
+    if args.discordancia_max is not None and resultado["concordancia_nivel1"] is not None \
+            and 1 - resultado["concordancia_nivel1"] > args.discordancia_max:
+        print(f"❌ Discordância acima de {args.discordancia_max * 100:.1f}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
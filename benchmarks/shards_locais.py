@@ -0,0 +1,88 @@
+"""Roda o lote em N shards como processos separados nesta máquina, junta e compara com o lote inteiro.
+
+Gera o manifesto (fragmentos.py manifesto), dispara `analisar_lote.py --shard
+i/N` em N processos ao mesmo tempo, junta os CSVs (fragmentos.py juntar
+--exigir-todas) e compara as linhas com as de um lote sem shards. O código de
+saída é 1 se algum passo falhar ou se as linhas diferirem.
+
+    py benchmarks/shards_locais.py --shards 4 --imagens 80
+    py benchmarks/shards_locais.py --shards 3 --pasta ham10000/teste100 --metadata ham10000/metadata/HAM10000_metadata.csv --por-lesao
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from desempenho import treinar_modelo_sintetico  # noqa: E402
+from sinteticas import gerar_conjunto  # noqa: E402
+
+
+def ler_linhas(caminho):
+    with open(caminho, newline="", encoding="utf-8") as f:
+        leitor = csv.reader(f)
+        return next(leitor), sorted(leitor)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--imagens", type=int, default=60, help="quantidade de imagens sintéticas")
+    parser.add_argument("--pasta", help="pasta com imagens reais (no lugar das sintéticas)")
+    parser.add_argument("--metadata", help="HAM10000_metadata.csv (para --por-lesao)")
+    parser.add_argument("--por-lesao", action="store_true")
+    parser.add_argument("--modelo", help="modelo treinado (padrão: modelo sintético)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        imagens = args.pasta or os.path.dirname(gerar_conjunto(os.path.join(pasta, "imagens"), args.imagens)[0])
+        modelo = args.modelo or treinar_modelo_sintetico(os.path.join(pasta, "modelo.pkl"))
+        manifesto = os.path.join(pasta, "manifesto.csv")
+        python = [sys.executable, "-X", "utf8"]
+        comum = ["--imagens", imagens, "--modelo", modelo, "--relatorios", "none", "--workers", "1"]
+
+        comando = python + [os.path.join(RAIZ, "fragmentos.py"), "manifesto", "--imagens", imagens,
+                            "--shards", str(args.shards), "--saida", manifesto]
+        if args.metadata:
+            comando += ["--metadata", args.metadata] + (["--por-lesao"] if args.por_lesao else [])
+        subprocess.run(comando, check=True)
+
+        inicio = time.perf_counter()
+        processos = [subprocess.Popen(python + [os.path.join(RAIZ, "analisar_lote.py"), *comum,
+                                                "--saida", os.path.join(pasta, "shards"),
+                                                "--shard", f"{i}/{args.shards}", "--manifesto", manifesto],
+                                      stdout=subprocess.DEVNULL)
+                     for i in range(1, args.shards + 1)]
+        codigos = [p.wait() for p in processos]
+        segundos_shards = time.perf_counter() - inicio
+        if any(codigos):
+            print(f"❌ Shards com erro (códigos {codigos})")
+            return 1
+
+        juntado = os.path.join(pasta, "shards", "relatorio_lote.csv")
+        juncao = subprocess.run(python + [os.path.join(RAIZ, "fragmentos.py"), "juntar",
+                                          os.path.join(pasta, "shards", f"relatorio_lote_shard_*_de_{args.shards}.csv"),
+                                          "--manifesto", manifesto, "--exigir-todas", "--saida", juntado])
+        if juncao.returncode:
+            return 1
+
+        inicio = time.perf_counter()
+        subprocess.run(python + [os.path.join(RAIZ, "analisar_lote.py"), *comum, "--saida",
+                                 os.path.join(pasta, "inteiro")], check=True, stdout=subprocess.DEVNULL)
+        segundos_inteiro = time.perf_counter() - inicio
+
+        iguais = ler_linhas(juntado) == ler_linhas(os.path.join(pasta, "inteiro", "relatorio_lote.csv"))
+
+    print(f"🧩 {args.shards} shards em paralelo: {segundos_shards:.1f}s | lote inteiro: {segundos_inteiro:.1f}s")
+    print("✅ Junção idêntica ao lote inteiro" if iguais else "❌ Junção diferente do lote inteiro")
+    return 0 if iguais else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
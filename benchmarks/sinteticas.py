@@ -0,0 +1,88 @@
+"""Gerador de imagens sintéticas parecidas com dermatoscopia (lesão escura sobre fundo cor de pele).
+
+Usado pelos benchmarks para rodar sem a base HAM10000:
+
+    py benchmarks/sinteticas.py --saida /tmp/sinteticas --quantidade 200
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Cores em BGR
+COR_PELE = (150, 175, 225)
+COR_LESAO = (45, 65, 115)
+
+
+def gerar_imagem(semente, largura=600, altura=450, raio=90, irregularidade=0.25, ruido=8.0):
+    """Gera uma imagem BGR com uma lesão de contorno irregular sobre fundo cor de pele
+
+    `raio` é o raio médio da lesão em pixels, `irregularidade` a amplitude
+    relativa das ondulações do contorno (0 = círculo) e `ruido` o desvio
+    padrão do ruído gaussiano somado à imagem.
+    """
+    rng = np.random.default_rng(semente)
+
+    # Fundo: cor de pele com leve gradiente de iluminação
+    gradiente = np.linspace(-15, 15, largura, dtype=np.float32)[None, :, None]
+    imagem = np.empty((altura, largura, 3), np.float32)
+    imagem[:] = COR_PELE
+    imagem += gradiente
+
+    # Contorno em coordenadas polares: raio modulado por harmônicos aleatórios
+    angulos = np.linspace(0, 2 * np.pi, 180, endpoint=False)
+    modulacao = np.zeros_like(angulos)
+    for harmonico in range(2, 7):
+        modulacao += rng.uniform(-1, 1) * np.sin(harmonico * angulos + rng.uniform(0, 2 * np.pi)) / harmonico
+    raios = raio * (1 + irregularidade * modulacao)
+    centro = (largura / 2 + rng.uniform(-0.1, 0.1) * largura, altura / 2 + rng.uniform(-0.1, 0.1) * altura)
+    pontos = np.stack([centro[0] + raios * np.cos(angulos), centro[1] + raios * np.sin(angulos)], axis=1)
+
+    mascara = np.zeros((altura, largura), np.uint8)
+    cv2.fillPoly(mascara, [pontos.astype(np.int32)], 255)
+    alfa = cv2.GaussianBlur(mascara, (0, 0), 4).astype(np.float32)[..., None] / 255
+
+    # Lesão com variação interna de pigmentação
+    pigmento = cv2.GaussianBlur(rng.normal(0, 20, (altura, largura)).astype(np.float32), (0, 0), 6)[..., None]
+    lesao = np.array(COR_LESAO, np.float32) + pigmento
+    imagem = imagem * (1 - alfa) + lesao * alfa
+
+    imagem += rng.normal(0, ruido, imagem.shape).astype(np.float32)
+    return np.clip(imagem, 0, 255).astype(np.uint8)
+
+
+def gerar_conjunto(pasta, quantidade, semente=0, **parametros):
+    """Grava `quantidade` imagens JPEG em `pasta` e devolve os caminhos (determinístico pela semente)"""
+    os.makedirs(pasta, exist_ok=True)
+    rng = np.random.default_rng(semente)
+    caminhos = []
+    for i in range(quantidade):
+        # Varia o tamanho e a irregularidade de imagem para imagem
+        params = dict(raio=int(rng.integers(50, 130)), irregularidade=float(rng.uniform(0.05, 0.4)))
+        params.update(parametros)
+        caminho = os.path.join(pasta, f"SINT_{i:05d}.jpg")
+        cv2.imwrite(caminho, gerar_imagem(semente * 100003 + i, **params), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        caminhos.append(caminho)
+    return caminhos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera imagens sintéticas de lesões cutâneas")
+    parser.add_argument("--saida", required=True, help="pasta onde gravar as imagens")
+    parser.add_argument("--quantidade", type=int, default=100)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--largura", type=int, default=600)
+    parser.add_argument("--altura", type=int, default=450)
+    parser.add_argument("--ruido", type=float, default=8.0)
+    args = parser.parse_args(argv)
+
+    caminhos = gerar_conjunto(args.saida, args.quantidade, args.semente, largura=args.largura,
+                              altura=args.altura, ruido=args.ruido)
+    print(f"✅ {len(caminhos)} imagens sintéticas salvas em: {args.saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
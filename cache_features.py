@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import pathlib
+import numpy as np
+
+# Como identificar o conteúdo de uma imagem: hash do arquivo ou tamanho + mtime
+MODOS_CHAVE = ('hash', 'mtime')
+
+
+def chave_arquivo(caminho, modo='hash'):
+    """Chave do conteúdo da imagem: sha1 dos bytes ou (tamanho, mtime) do arquivo"""
+    if modo == 'hash':
+        with open(caminho, 'rb') as f:
+            return hashlib.file_digest(f, 'sha1').hexdigest()
+    if modo == 'mtime':
+        info = os.stat(caminho)
+        return f"{info.st_size}:{info.st_mtime_ns}:{os.path.abspath(caminho)}"
+    raise ValueError(f"Modo de chave inválido: {modo!r} (use um de {', '.join(MODOS_CHAVE)})")
+
+
+def chave_conteudo(conteudo):
+    """Chave de uma imagem já em memória (mesma de chave_arquivo no modo 'hash')"""
+    return hashlib.sha1(conteudo).hexdigest()
+
+
+def compactar_mascara(mask):
+    """Máscara binária -> bytes (1 bit por pixel)"""
+    return np.packbits(mask > 0).tobytes()
+
+
+def descompactar_mascara(dados, forma):
+    """Bytes de compactar_mascara -> máscara uint8 0/255 com a forma dada"""
+    bits = np.unpackbits(np.frombuffer(dados, np.uint8), count=forma[0] * forma[1])
+    return (bits.reshape(forma) * 255).astype(np.uint8)
+
+
+class CacheFeatures:
+    """Cache em disco (SQLite) das características extraídas por imagem
+
+    Cada entrada é indexada pela chave da imagem (ver chave_arquivo) e pela
+    impressão digital dos parâmetros do pipeline
+    (SkinLesionAnalyzer.pipeline_fingerprint). Entradas de outras impressões
+    ficam guardadas (voltar a um modo anterior reaproveita o cache); com
+    `descartar_obsoletas=True` elas são removidas ao abrir. As máscaras são
+    opcionais e ocupam no máximo `limite_mascaras` bytes; as acessadas há mais
+    tempo saem primeiro.
+    """
+
+    def __init__(self, caminho, impressao, limite_mascaras=256 * 1024 * 1024, somente_leitura=False,
+                 descartar_obsoletas=False):
+        self.caminho = caminho
+        self.impressao = impressao
+        self.limite_mascaras = limite_mascaras
+        self.somente_leitura = somente_leitura
+        if somente_leitura:
+            # URI escapada: caminhos com ?, #, % ou letra de unidade do Windows
+            uri = pathlib.Path(caminho).resolve().as_uri() + "?mode=ro"
+            self.conexao = sqlite3.connect(uri, uri=True, timeout=30)
+            return
+
+        pasta = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(pasta, exist_ok=True)
+        self.conexao = sqlite3.connect(caminho, timeout=30)
+        # WAL: os workers leem enquanto o processo principal grava
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self.conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS features (
+                chave TEXT NOT NULL,
+                impressao TEXT NOT NULL,
+                features TEXT,
+                PRIMARY KEY (chave, impressao)
+            );
+            CREATE TABLE IF NOT EXISTS mascaras (
+                chave TEXT NOT NULL,
+                impressao TEXT NOT NULL,
+                altura INTEGER NOT NULL,
+                largura INTEGER NOT NULL,
+                dados BLOB NOT NULL,
+                acesso REAL NOT NULL,
+                PRIMARY KEY (chave, impressao)
+            );
+            CREATE INDEX IF NOT EXISTS mascaras_acesso ON mascaras (acesso);
+        """)
+        if descartar_obsoletas:
+            self.invalidar()
+        self.conexao.commit()
+
+    def invalidar(self):
+        """Remove entradas calculadas com outros parâmetros; devolve quantas saíram"""
+        removidas = 0
+        for tabela in ('features', 'mascaras'):
+            cursor = self.conexao.execute(f"DELETE FROM {tabela} WHERE impressao != ?", (self.impressao,))
+            removidas += cursor.rowcount
+        self.conexao.commit()
+        return removidas
+
+    def obter(self, chave):
+        """(encontrada, features) — features é None se a imagem falhou na extração"""
+        linha = self.conexao.execute(
+            "SELECT features FROM features WHERE chave = ? AND impressao = ?", (chave, self.impressao)
+        ).fetchone()
+        if linha is None:
+            return False, None
+        return True, json.loads(linha[0]) if linha[0] is not None else None
+
+    def gravar_varias(self, entradas):
+        """Grava uma lista de (chave, features, mascara ou None) numa única transação"""
+        mascaras = []
+        with self.conexao:
+            self.conexao.executemany(
+                "INSERT OR REPLACE INTO features (chave, impressao, features) VALUES (?, ?, ?)",
+                [(chave, self.impressao, json.dumps(features) if features is not None else None)
+                 for chave, features, _ in entradas])
+            agora = time.time()
+            for chave, _, mask in entradas:
+                if mask is not None:
+                    mascaras.append((chave, self.impressao, mask.shape[0], mask.shape[1],
+                                     compactar_mascara(mask), agora))
+            if mascaras:
+                self.conexao.executemany(
+                    "INSERT OR REPLACE INTO mascaras (chave, impressao, altura, largura, dados, acesso) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", mascaras)
+        if mascaras:
+            self.despejar_mascaras()
+
+    def gravar(self, chave, features, mask=None):
+        self.gravar_varias([(chave, features, mask)])
+
+    def obter_mascara(self, chave):
+        """Máscara em cache (ou None), marcando o acesso para a política LRU"""
+        linha = self.conexao.execute(
+            "SELECT altura, largura, dados FROM mascaras WHERE chave = ? AND impressao = ?",
+            (chave, self.impressao)
+        ).fetchone()
+        if linha is None:
+            return None
+        if not self.somente_leitura:
+            with self.conexao:
+                self.conexao.execute("UPDATE mascaras SET acesso = ? WHERE chave = ? AND impressao = ?",
+                                     (time.time(), chave, self.impressao))
+        return descompactar_mascara(linha[2], (linha[0], linha[1]))
+
+    def despejar_mascaras(self):
+        """Remove as máscaras menos usadas até caber em `limite_mascaras` bytes"""
+        total = self.conexao.execute("SELECT COALESCE(SUM(LENGTH(dados)), 0) FROM mascaras").fetchone()[0]
+        if total <= self.limite_mascaras:
+            return 0
+        removidas = 0
+        with self.conexao:
+            for chave, impressao, tamanho in self.conexao.execute(
+                    "SELECT chave, impressao, LENGTH(dados) FROM mascaras ORDER BY acesso").fetchall():
+                if total <= self.limite_mascaras:
+                    break
+                self.conexao.execute("DELETE FROM mascaras WHERE chave = ? AND impressao = ?", (chave, impressao))
+                total -= tamanho
+                removidas += 1
+        return removidas
+
+    def __len__(self):
+        return self.conexao.execute("SELECT COUNT(*) FROM features WHERE impressao = ?",
+                                    (self.impressao,)).fetchone()[0]
+
+    def fechar(self):
+        self.conexao.close()
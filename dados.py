@@ -0,0 +1,135 @@
+"""Camada de dados compartilhada: metadata da HAM10000, resultados do lote e a base juntada
+
+    py preparar_dados.py --resultados results_lote/relatorio_lote.csv --saida base_treinamento.parquet
+
+A base juntada (resultados do lote + metadata + rótulo binário) é gravada num
+formato colunar (Parquet/Feather) e lida por treinar_modelo.py e
+graficos_estatisticos.py, sem repetir a leitura e o merge dos CSVs.
+"""
+import os
+
+import pandas as pd
+
+# Diagnóstico da HAM10000 -> rótulo binário usado pelo classificador
+MAPA_DIAGNOSTICO = {
+    "akiec": "SUSPEITA",
+    "bcc": "SUSPEITA",
+    "mel": "SUSPEITA",
+    "bkl": "PROVAVELMENTE BENIGNA",
+    "df": "PROVAVELMENTE BENIGNA",
+    "nv": "PROVAVELMENTE BENIGNA",
+    "vasc": "PROVAVELMENTE BENIGNA",
+}
+
+ROTULOS = pd.CategoricalDtype(["SUSPEITA", "PROVAVELMENTE BENIGNA"])
+
+# Tipos explícitos do HAM10000_metadata.csv (categorias em vez de strings soltas)
+TIPOS_METADATA = {
+    "lesion_id": "category",
+    "image_id": "string",
+    "dx": pd.CategoricalDtype(sorted(MAPA_DIAGNOSTICO)),
+    "dx_type": "category",
+    "age": "float32",
+    "sex": "category",
+    "localization": "category",
+}
+
+COLUNAS_METADATA = ("lesion_id", "image_id", "dx", "age", "sex", "localization")
+
+# Formatos aceitos para a base juntada, pela extensão do arquivo
+FORMATOS = {".parquet": "parquet", ".feather": "feather", ".pkl": "pickle", ".csv": "csv"}
+
+
+def carregar_metadata(caminho, colunas=COLUNAS_METADATA):
+    """Lê o metadata só com as `colunas` pedidas, indexado por image_id, com o rótulo binário"""
+    colunas = list(dict.fromkeys(("image_id",) + tuple(colunas)))
+    metadata = pd.read_csv(caminho, usecols=colunas, dtype={c: TIPOS_METADATA[c] for c in colunas})
+    metadata = metadata.set_index("image_id", verify_integrity=True)
+    if "dx" in metadata:
+        metadata["diagnostico_real"] = metadata["dx"].map(MAPA_DIAGNOSTICO).astype(ROTULOS)
+    return metadata
+
+
+def carregar_resultados(caminho):
+    """Lê o relatorio_lote.csv (nome da imagem sem extensão, classificação como categoria)"""
+    resultados = pd.read_csv(caminho, dtype={"imagem": "string", "classificacao": ROTULOS})
+    resultados["imagem"] = resultados["imagem"].str.removesuffix(".jpg")
+    return resultados
+
+
+def juntar(resultados, metadata):
+    """Junta resultados e metadata pelo índice image_id (só imagens presentes nos dois)"""
+    return resultados.join(metadata, on="imagem", how="inner").reset_index(drop=True)
+
+
+def _formato(caminho):
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in FORMATOS:
+        raise ValueError(f"Formato de tabela não suportado: {caminho} (use {', '.join(FORMATOS)})")
+    return FORMATOS[extensao]
+
+
+def _alternativo(caminho):
+    """Arquivo usado quando não há pyarrow para Parquet/Feather"""
+    return os.path.splitext(caminho)[0] + ".pkl"
+
+
+def salvar_tabela(df, caminho):
+    """Grava a tabela no formato da extensão; sem pyarrow, cai para .pkl ao lado. Retorna o caminho gravado"""
+    formato = _formato(caminho)
+    try:
+        if formato == "parquet":
+            df.to_parquet(caminho, index=False)
+        elif formato == "feather":
+            df.to_feather(caminho)
+        elif formato == "pickle":
+            df.to_pickle(caminho)
+        else:
+            df.to_csv(caminho, index=False)
+    except ImportError:
+        caminho = _alternativo(caminho)
+        print(f"⚠️ pyarrow não instalado: tabela gravada em {caminho}")
+        df.to_pickle(caminho)
+    return caminho
+
+
+def caminho_gravado(caminho):
+    """Arquivo que salvar_tabela realmente gravou para `caminho` (o .pkl alternativo, se for o caso)"""
+    if _formato(caminho) in ("parquet", "feather") and not os.path.exists(caminho) \
+            and os.path.exists(_alternativo(caminho)):
+        return _alternativo(caminho)
+    return caminho
+
+
+def ler_tabela(caminho, colunas=None):
+    """Lê uma tabela gravada por salvar_tabela (só as `colunas` pedidas, quando o formato permite)"""
+    caminho = caminho_gravado(caminho)
+    formato = _formato(caminho)
+    colunas = list(colunas) if colunas is not None else None
+    if formato == "parquet":
+        return pd.read_parquet(caminho, columns=colunas)
+    if formato == "feather":
+        return pd.read_feather(caminho, columns=colunas)
+    if formato == "pickle":
+        df = pd.read_pickle(caminho)
+        return df[[c for c in colunas if c in df]] if colunas is not None else df
+    return pd.read_csv(caminho, usecols=(lambda c: c in colunas) if colunas is not None else None)
+
+
+def _atualizada(destino, fontes):
+    destino = caminho_gravado(destino)
+    return os.path.exists(destino) and all(os.path.getmtime(destino) >= os.path.getmtime(f) for f in fontes)
+
+
+def base_juntada(csv_resultados, csv_metadata, destino=None):
+    """Base juntada dos resultados com o metadata, reaproveitando `destino` se estiver atualizado
+
+    Com `destino` (ex.: base_treinamento.parquet), a junção só é refeita se
+    um dos CSVs for mais novo que o arquivo gravado.
+    """
+    if destino and _atualizada(destino, (csv_resultados, csv_metadata)):
+        return ler_tabela(destino)
+    df = juntar(carregar_resultados(csv_resultados), carregar_metadata(csv_metadata))
+    if destino:
+        salvar_tabela(df, destino)
+    return df
@@ -0,0 +1,91 @@
+import os
+import io
+import csv
+import time
+
+
+class ColunasIncompativeis(ValueError):
+    """O CSV a retomar foi gravado com outras colunas (ex.: por uma versão anterior do lote)"""
+
+
+class EscritorCSVIncremental:
+    """Grava o CSV do lote aos poucos, em blocos, para que uma execução interrompida possa ser retomada
+
+    As linhas ficam num buffer e são gravadas em blocos de `tamanho_bloco`
+    linhas (ou a cada `intervalo` segundos), cada bloco numa única escrita
+    seguida de fsync. Assim o arquivo no disco só contém linhas completas; se o
+    processo morrer no meio de uma escrita, a linha cortada é descartada ao
+    reabrir com `retomar=True`. A primeira coluna identifica a imagem e é
+    usada para saber o que já foi concluído.
+    """
+
+    def __init__(self, caminho, colunas, retomar=False, tamanho_bloco=50, intervalo=5.0):
+        self.caminho = caminho
+        self.colunas = list(colunas)
+        self.tamanho_bloco = tamanho_bloco
+        self.intervalo = intervalo
+        self.concluidas = set()
+        self._buffer = []
+        self._ultima_gravacao = time.monotonic()
+
+        if retomar and os.path.exists(caminho):
+            self._recuperar()
+        else:
+            # Cabeçalho gravado num temporário e trocado atomicamente
+            temporario = caminho + ".tmp"
+            with open(temporario, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(self.colunas)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, caminho)
+
+        self._fd = os.open(caminho, os.O_WRONLY | os.O_APPEND)
+
+    def _recuperar(self):
+        """Descarta uma linha final incompleta e lê os identificadores já gravados"""
+        with open(self.caminho, 'rb+') as f:
+            conteudo = f.read()
+            fim = conteudo.rfind(b"\n") + 1
+            if fim < len(conteudo):
+                f.truncate(fim)
+                conteudo = conteudo[:fim]
+        linhas = list(csv.reader(io.StringIO(conteudo.decode('utf-8'))))
+        if not linhas:
+            with open(self.caminho, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(self.colunas)
+            return
+        if linhas[0] != self.colunas:
+            raise ColunasIncompativeis(
+                f"{self.caminho} tem {len(linhas[0])} colunas ({', '.join(linhas[0])}), mas o lote grava "
+                f"{len(self.colunas)}; não é possível retomar")
+        self.concluidas = {linha[0] for linha in linhas[1:] if linha}
+
+    def adicionar(self, linha):
+        """Enfileira uma linha; grava o bloco quando ele enche ou o intervalo passa"""
+        self._buffer.append(linha)
+        self.concluidas.add(str(linha[0]))
+        if len(self._buffer) >= self.tamanho_bloco or time.monotonic() - self._ultima_gravacao >= self.intervalo:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava o bloco pendente numa única escrita e força a ida ao disco"""
+        self._ultima_gravacao = time.monotonic()
+        if not self._buffer:
+            return
+        texto = io.StringIO()
+        csv.writer(texto).writerows(self._buffer)
+        dados = memoryview(texto.getvalue().encode('utf-8'))
+        while dados:
+            dados = dados[os.write(self._fd, dados):]
+        os.fsync(self._fd)
+        self._buffer.clear()
+
+    def fechar(self):
+        self.descarregar()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
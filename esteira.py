@@ -0,0 +1,257 @@
+"""Esteira de threads: estágios ligados por filas limitadas, com métricas de ocupação
+
+Cada estágio tem um pool de threads que tira itens da sua fila de entrada
+(até `lote` por vez, sem esperar completar) e coloca as saídas na fila do
+próximo. As filas são limitadas: quando um estágio fica para trás, o anterior
+bloqueia no `put` (contrapressão) em vez de acumular imagens na memória. Vale
+para trabalho que solta o GIL (leitura de arquivo, OpenCV, codificação PNG).
+
+    esteira = Esteira([Estagio("leitura", ler, threads=4), Estagio("calculo", calcular, lote=8)])
+    for saidas in esteira.executar(itens):
+        ...
+"""
+import queue
+import threading
+from dataclasses import dataclass
+from time import perf_counter
+
+# Marca de fim de fila: cada thread de um estágio consome exatamente uma
+_FIM = object()
+
+
+class Interrompida(Exception):
+    """A esteira foi parada (erro em outro estágio ou interrupção do chamador)"""
+
+
+class FilaMedida(queue.Queue):
+    """queue.Queue limitada que mede a própria ocupação
+
+    Acumula a ocupação média ponderada pelo tempo, o máximo atingido, e quanto
+    tempo os produtores passaram bloqueados com a fila cheia (contrapressão:
+    o consumidor é o gargalo) e os consumidores com a fila vazia (o produtor é
+    o gargalo).
+    """
+
+    def __init__(self, nome, maxsize):
+        super().__init__(maxsize)
+        self.nome = nome
+        self.inicio = self._ultima = perf_counter()
+        self._area = 0.0
+        self.maximo = 0
+        self.espera_put = 0.0
+        self.espera_get = 0.0
+        self.cheia = 0
+
+    def _integrar(self):
+        # Chamado com self.mutex adquirido (dentro de _put/_get)
+        agora = perf_counter()
+        self._area += len(self.queue) * (agora - self._ultima)
+        self._ultima = agora
+
+    def _put(self, item):
+        self._integrar()
+        super()._put(item)
+        self.maximo = max(self.maximo, len(self.queue))
+
+    def _get(self):
+        self._integrar()
+        return super()._get()
+
+    def colocar(self, item, parar):
+        """put que desiste se `parar` for sinalizado (levanta Interrompida)"""
+        try:
+            self.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        inicio = perf_counter()
+        while True:
+            try:
+                self.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if parar.is_set():
+                    raise Interrompida()
+        with self.mutex:
+            self.espera_put += perf_counter() - inicio
+            self.cheia += 1
+
+    def tirar(self, parar):
+        """get que desiste se `parar` for sinalizado (levanta Interrompida)"""
+        inicio = perf_counter()
+        while True:
+            try:
+                item = self.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if parar.is_set():
+                    raise Interrompida()
+        with self.mutex:
+            self.espera_get += perf_counter() - inicio
+        return item
+
+    def metricas(self):
+        """Ocupação média/máxima (itens e fração da capacidade) e segundos bloqueados"""
+        with self.mutex:
+            self._integrar()
+            decorrido = max(self._ultima - self.inicio, 1e-9)
+            media = self._area / decorrido
+            return {
+                "fila": self.nome,
+                "capacidade": self.maxsize,
+                "ocupacao_media": media,
+                "ocupacao_media_pct": 100.0 * media / self.maxsize if self.maxsize else None,
+                "ocupacao_maxima": self.maximo,
+                "vezes_cheia": self.cheia,
+                "espera_put_s": self.espera_put,
+                "espera_get_s": self.espera_get,
+            }
+
+
+@dataclass
+class Estagio:
+    """Um estágio da esteira
+
+    `funcao(estado, itens)` recebe uma lista de até `lote` itens e devolve as
+    saídas (uma lista; no último estágio elas vão para o chamador).
+    `inicializar()` cria o estado de cada thread (ex.: um ContextoPipeline ou
+    uma conexão SQLite, que não podem ser compartilhados) e `finalizar(estado)`
+    o libera. `fila` é a capacidade da fila de entrada do estágio.
+    """
+    nome: str
+    funcao: callable
+    threads: int = 1
+    fila: int = 32
+    lote: int = 1
+    inicializar: callable = None
+    finalizar: callable = None
+
+
+class Esteira:
+    """Executa os estágios em threads, com uma FilaMedida limitada na entrada de cada um"""
+
+    def __init__(self, estagios, fila_saida=32):
+        self.estagios = list(estagios)
+        self.filas = [FilaMedida(e.nome, max(1, e.fila)) for e in self.estagios]
+        self.filas.append(FilaMedida("saida", max(1, fila_saida)))
+        self.ocupado = {e.nome: 0.0 for e in self.estagios}
+        self.inicio = None
+        self.fim = None
+        self._parar = threading.Event()
+        self._erro = None
+        self._lock = threading.Lock()
+
+    def _tirar_lote(self, fila, tamanho):
+        """Até `tamanho` itens: espera o primeiro e pega os demais só se já estiverem na fila"""
+        item = fila.tirar(self._parar)
+        if item is _FIM:
+            return [], True
+        itens = [item]
+        while len(itens) < tamanho:
+            try:
+                item = fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is _FIM:
+                return itens, True
+            itens.append(item)
+        return itens, False
+
+    def _rodar(self, indice):
+        estagio = self.estagios[indice]
+        entrada, saida = self.filas[indice], self.filas[indice + 1]
+        estado = estagio.inicializar() if estagio.inicializar else None
+        ocupado = 0.0
+        try:
+            fim = False
+            while not fim:
+                itens, fim = self._tirar_lote(entrada, max(1, estagio.lote))
+                if not itens:
+                    continue
+                inicio = perf_counter()
+                saidas = estagio.funcao(estado, itens)
+                ocupado += perf_counter() - inicio
+                for item in saidas or ():
+                    saida.colocar(item, self._parar)
+        except Interrompida:
+            pass
+        except BaseException as e:
+            with self._lock:
+                self._erro = self._erro or e
+            self._parar.set()
+        finally:
+            with self._lock:
+                self.ocupado[estagio.nome] += ocupado
+            if estagio.finalizar:
+                estagio.finalizar(estado)
+
+    def _alimentar(self, itens):
+        """Thread da fonte: coloca os itens na primeira fila e encerra cada estágio na ordem"""
+        try:
+            for item in itens:
+                self.filas[0].colocar(item, self._parar)
+            for indice in range(len(self.estagios)):
+                for _ in self._threads[indice]:
+                    self.filas[indice].colocar(_FIM, self._parar)
+                for thread in self._threads[indice]:
+                    thread.join()
+            self.filas[-1].colocar(_FIM, self._parar)
+        except Interrompida:
+            pass
+        except BaseException as e:
+            with self._lock:
+                self._erro = self._erro or e
+            self._parar.set()
+
+    def executar(self, itens):
+        """Gera as listas de saídas do último estágio, na ordem em que ficam prontas
+
+        Um erro em qualquer estágio (ou na iteração de `itens`) para a esteira
+        e é relançado aqui; se o chamador sair antes do fim (exceção,
+        KeyboardInterrupt, `break`), as threads são paradas e aguardadas.
+        """
+        self.inicio = perf_counter()
+        self._threads = [[threading.Thread(target=self._rodar, args=(i,), name=f"{e.nome}-{n}", daemon=True)
+                          for n in range(max(1, e.threads))] for i, e in enumerate(self.estagios)]
+        fonte = threading.Thread(target=self._alimentar, args=(itens,), name="fonte", daemon=True)
+        for grupo in self._threads:
+            for thread in grupo:
+                thread.start()
+        fonte.start()
+        try:
+            while True:
+                try:
+                    saidas = self.filas[-1].tirar(self._parar)
+                except Interrompida:
+                    break
+                if saidas is _FIM:
+                    break
+                yield saidas
+        finally:
+            self._parar.set()
+            fonte.join()
+            for grupo in self._threads:
+                for thread in grupo:
+                    thread.join()
+            self.fim = perf_counter()
+        if self._erro is not None:
+            raise self._erro
+
+    def metricas(self):
+        """Por fila: ocupação e esperas (FilaMedida.metricas) e a utilização do estágio que a consome
+
+        `utilizacao_pct` é o tempo dentro de `funcao` dividido por
+        threads x duração: perto de 100% no gargalo; a fila antes dele
+        vive cheia e a depois dele, vazia.
+        """
+        duracao = max((self.fim or perf_counter()) - (self.inicio or perf_counter()), 1e-9)
+        linhas = []
+        for estagio, fila in zip(self.estagios, self.filas):
+            linha = fila.metricas()
+            linha.update(estagio=estagio.nome, threads=estagio.threads,
+                         utilizacao_pct=100.0 * self.ocupado[estagio.nome] / (max(1, estagio.threads) * duracao))
+            linhas.append(linha)
+        linha = self.filas[-1].metricas()
+        linha.update(estagio="chamador", threads=1, utilizacao_pct=None)
+        linhas.append(linha)
+        return linhas
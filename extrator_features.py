@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+
+# Características de forma usadas pelo modelo (mesmos nomes do dicionário de extract_features)
+CAMPOS_BASICOS = ('area', 'perimeter', 'circularity', 'aspect_ratio', 'solidity')
+
+# Descritores no estilo ABCD (assimetria, borda, cor, diâmetro)
+CAMPOS_ABCD = ('asymmetry', 'border_irregularity', 'color_variance', 'diameter')
+
+CAMPOS_FEATURES = CAMPOS_BASICOS + CAMPOS_ABCD
+
+# Uma linha por lesão; `valida` é False quando a máscara não tem contorno
+DTYPE_FEATURES = np.dtype([(nome, np.float64) for nome in CAMPOS_FEATURES] + [('valida', np.bool_)])
+
+# Medidas brutas tiradas do maior contorno de cada máscara (uma coluna cada)
+_MEDIDAS = ('area', 'perimeter', 'largura', 'altura', 'hull_area', 'hull_perimeter', 'diameter',
+            'mu20', 'mu11', 'mu02', 'mu30', 'mu21', 'mu12', 'mu03', 'color_variance')
+
+
+def alocar_features(n):
+    """Array estruturado (DTYPE_FEATURES) para `n` lesões"""
+    return np.zeros(n, dtype=DTYPE_FEATURES)
+
+
+def _diametro(hull):
+    """Maior distância entre dois pontos do fecho convexo (diâmetro de Feret)"""
+    pontos = hull.reshape(-1, 2)
+    # Coordenadas inteiras: as matrizes k x k de diferenças ficam pequenas (k ~ dezenas de pontos)
+    dx = np.subtract.outer(pontos[:, 0], pontos[:, 0])
+    dy = np.subtract.outer(pontos[:, 1], pontos[:, 1])
+    dx *= dx
+    dy *= dy
+    dx += dy
+    return float(np.sqrt(dx.max()))
+
+
+def _medir(mascara, imagem, linha):
+    """Preenche `linha` com as medidas do maior contorno; devolve False se não houver contorno"""
+    contours, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return False
+
+    cnt = max(contours, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(cnt)
+    hull = cv2.convexHull(cnt)
+    momentos = cv2.moments(cnt)
+
+    linha[0] = cv2.contourArea(cnt)
+    linha[1] = cv2.arcLength(cnt, True)
+    linha[2], linha[3] = w, h
+    linha[4] = cv2.contourArea(hull)
+    linha[5] = cv2.arcLength(hull, True)
+    linha[6] = _diametro(hull)
+    for j, nome in enumerate(('mu20', 'mu11', 'mu02', 'mu30', 'mu21', 'mu12', 'mu03'), start=7):
+        linha[j] = momentos[nome]
+
+    # Variância de cor dos pixels da máscara no retângulo da lesão (soma das variâncias dos canais B, G, R);
+    # sem imagem colorida (ex.: decodificação 'reduced', em cinza) fica NaN em vez de virar outra medida
+    if imagem is None or imagem.ndim != 3:
+        linha[14] = np.nan
+    else:
+        _, desvio = cv2.meanStdDev(_recorte(imagem, mascara.shape, x, y, w, h), mask=mascara[y:y + h, x:x + w])
+        linha[14] = float(np.square(desvio).sum())
+    return True
+
+
+def _recorte(imagem, forma, x, y, w, h):
+    """Retângulo (x, y, w, h) da máscara recortado da imagem, que pode estar em outra resolução
+
+    Se a imagem for maior que a máscara (ex.: a original 600x450 e a máscara
+    256x256), só o recorte da lesão é redimensionado para a escala da máscara.
+    """
+    altura, largura = imagem.shape[:2]
+    if (altura, largura) == forma:
+        return imagem[y:y + h, x:x + w]
+    ey, ex = altura / forma[0], largura / forma[1]
+    recorte = imagem[int(y * ey):int(np.ceil((y + h) * ey)), int(x * ex):int(np.ceil((x + w) * ex))]
+    return cv2.resize(recorte, (w, h))
+
+
+def _dividir(a, b):
+    """a / b elemento a elemento, com 0 onde b <= 0"""
+    return np.divide(a, b, out=np.zeros_like(a), where=b > 0)
+
+
+def _girar(a, b, momentos, binomiais):
+    """Momento central de ordem k ao longo do eixo a*x + b*y, a partir de (mu_k0, ..., mu_0k)"""
+    k = len(binomiais) - 1
+    expoentes = np.arange(k + 1)
+    coeficientes = a[..., None] ** (k - expoentes) * b[..., None] ** expoentes * binomiais
+    return (coeficientes * momentos).sum(axis=-1)
+
+
+def _assimetria(medidas):
+    """Assimetria pelos momentos: média do |skewness| ao longo dos dois eixos principais
+
+    Os momentos centrais de 2ª e 3ª ordem são girados para os eixos principais
+    (ângulo dado pelos de 2ª ordem); uma forma simétrica em relação aos dois
+    eixos tem assimetria 0.
+    """
+    segunda = medidas[:, 7:10]     # mu20, mu11, mu02
+    terceira = medidas[:, 10:14]   # mu30, mu21, mu12, mu03
+    theta = 0.5 * np.arctan2(2 * segunda[:, 1], segunda[:, 0] - segunda[:, 2])
+    c, s = np.cos(theta), np.sin(theta)
+    # Eixos u = c*x + s*y e v = -s*x + c*y empilhados na primeira dimensão
+    a, b = np.stack([c, -s]), np.stack([s, c])
+    variancia = np.abs(_girar(a, b, segunda, (1, 2, 1)))
+    terceiro = np.abs(_girar(a, b, terceira, (1, 3, 3, 1)))
+    skewness = _dividir(terceiro * np.sqrt(np.abs(medidas[:, 0])), variancia ** 1.5)
+    return skewness.mean(axis=0)
+
+
+def extrair_lote(mascaras, imagens=None, saida=None):
+    """Extrai as características de uma pilha de máscaras (e imagens) de uma vez
+
+    `mascaras` é uma sequência/pilha de máscaras uint8 (0/255); `imagens`, se
+    dada, traz a imagem de cada máscara (BGR, no tamanho da máscara ou na
+    resolução original) usada na variância de cor; imagens em cinza deixam a
+    variância de cor em NaN. Os contornos são obtidos máscara a máscara
+    (OpenCV); as características derivadas são calculadas de forma vetorizada sobre o
+    lote. O resultado é gravado em `saida` (array DTYPE_FEATURES já alocado,
+    ex.: reaproveitado entre blocos) ou num array novo, que é devolvido.
+    """
+    n = len(mascaras)
+    if saida is None:
+        saida = alocar_features(n)
+    elif len(saida) < n:
+        raise ValueError(f"saida tem {len(saida)} linhas; são necessárias {n}")
+    saida = saida[:n]
+
+    medidas = np.zeros((n, len(_MEDIDAS)), dtype=np.float64)
+    for i in range(n):
+        saida['valida'][i] = _medir(mascaras[i], None if imagens is None else imagens[i], medidas[i])
+    m = dict(zip(_MEDIDAS, medidas.T))
+
+    area, perimeter = m['area'], m['perimeter']
+    saida['area'] = area
+    saida['perimeter'] = perimeter
+    saida['circularity'] = _dividir(4 * np.pi * area, perimeter ** 2)
+    saida['aspect_ratio'] = _dividir(m['largura'], m['altura'])
+    saida['solidity'] = _dividir(area, m['hull_area'])
+    saida['asymmetry'] = _assimetria(medidas)
+    saida['border_irregularity'] = _dividir(perimeter, m['hull_perimeter'])
+    saida['color_variance'] = m['color_variance']
+    saida['diameter'] = m['diameter']
+    return saida
+
+
+def como_dicionario(linha):
+    """Converte uma linha de DTYPE_FEATURES no dicionário de características (None se inválida)"""
+    if not linha['valida']:
+        return None
+    return {nome: float(linha[nome]) for nome in CAMPOS_FEATURES}
@@ -0,0 +1,194 @@
+"""Floresta aleatória exportada para arrays NumPy (.npz), avaliada sem scikit-learn
+
+    py floresta_nativa.py modelo_random_forest.pkl modelo_random_forest.npz
+"""
+import argparse
+import sys
+import warnings
+
+import numpy as np
+
+# Atributos opcionais do modelo copiados para o .npz quando existem
+ATRIBUTOS_OPCIONAIS = ('feature_names_in_', 'limiar_suspeita_', 'colunas_features_')
+
+
+class FlorestaNativa:
+    """Avaliador de floresta em NumPy puro, com a mesma interface de predict_proba/predict do sklearn
+
+    Todas as árvores ficam concatenadas em arrays contíguos (feature,
+    threshold, filhos e probabilidade de cada nó). As folhas apontam para si
+    mesmas, então a avaliação desce todas as árvores para todas as linhas ao
+    mesmo tempo, até `profundidade` níveis, sem desvios por linha. Feita para
+    poucas linhas (uma imagem ou um bloco do lote); para milhares de linhas o
+    predict_proba do sklearn continua mais rápido.
+    """
+
+    def __init__(self, feature, threshold, esquerda, direita, proba, raizes, classes, profundidade,
+                 n_features, **opcionais):
+        self.feature = feature
+        self.threshold = threshold
+        self.esquerda = esquerda
+        self.direita = direita
+        self.proba = proba
+        self.raizes = raizes
+        self.classes_ = classes
+        self.profundidade = int(profundidade)
+        self.n_features_in_ = int(n_features)
+        for nome, valor in opcionais.items():
+            setattr(self, nome, valor)
+
+    @property
+    def n_estimators(self):
+        return len(self.raizes)
+
+    def folhas(self, X):
+        """Índice da folha alcançada em cada árvore (matriz árvores x linhas)"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Esperado um array (n, {self.n_features_in_}); recebido {X.shape}")
+        linhas = np.arange(X.shape[0])
+        nos = np.repeat(self.raizes[:, None], X.shape[0], axis=1)
+        for _ in range(self.profundidade):
+            # Mesma regra do sklearn: X (float32) <= threshold (float64) vai para a esquerda
+            esquerda = X[linhas, self.feature[nos]] <= self.threshold[nos]
+            proximos = np.where(esquerda, self.esquerda[nos], self.direita[nos])
+            if np.array_equal(proximos, nos):
+                break  # todas as linhas já estão em folhas
+            nos = proximos
+        return nos
+
+    def predict_proba(self, X):
+        """Média das probabilidades das folhas (colunas na ordem de `classes_`)"""
+        # Soma ao longo das árvores na mesma ordem do RandomForestClassifier
+        return self.proba[self.folhas(X)].sum(axis=0) / self.n_estimators
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def salvar(self, caminho):
+        """Grava os arrays num .npz (sem pickle)"""
+        opcionais = {nome: getattr(self, nome) for nome in ATRIBUTOS_OPCIONAIS if hasattr(self, nome)}
+        np.savez(caminho, feature=self.feature, threshold=self.threshold, esquerda=self.esquerda,
+                 direita=self.direita, proba=self.proba, raizes=self.raizes, classes=self.classes_,
+                 profundidade=self.profundidade, n_features=self.n_features_in_, **opcionais)
+        return caminho
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho, allow_pickle=False) as dados:
+            arrays = {nome: dados[nome] for nome in dados.files}
+        for nome in ('profundidade', 'n_features', 'limiar_suspeita_'):
+            if nome in arrays:
+                arrays[nome] = arrays[nome].item()
+        return cls(**arrays)
+
+
+def de_sklearn(modelo):
+    """Achata as árvores de um RandomForestClassifier (já treinado) numa FlorestaNativa"""
+    arvores = [estimador.tree_ for estimador in modelo.estimators_]
+    total = sum(arvore.node_count for arvore in arvores)
+    n_classes = len(modelo.classes_)
+
+    feature = np.zeros(total, np.int32)
+    threshold = np.zeros(total, np.float64)
+    esquerda = np.empty(total, np.int32)
+    direita = np.empty(total, np.int32)
+    proba = np.empty((total, n_classes), np.float64)
+    raizes = np.empty(len(arvores), np.int32)
+
+    inicio = 0
+    for t, arvore in enumerate(arvores):
+        fim = inicio + arvore.node_count
+        indices = np.arange(inicio, fim, dtype=np.int32)
+        folha = arvore.children_left == -1
+        raizes[t] = inicio
+        # Folhas apontam para si mesmas (feature 0, limiar qualquer)
+        feature[inicio:fim] = np.where(folha, 0, arvore.feature)
+        threshold[inicio:fim] = np.where(folha, 0.0, arvore.threshold)
+        esquerda[inicio:fim] = np.where(folha, indices, arvore.children_left + inicio)
+        direita[inicio:fim] = np.where(folha, indices, arvore.children_right + inicio)
+        # Probabilidade de cada nó normalizada como em DecisionTreeClassifier.predict_proba
+        valores = arvore.value[:, 0, :n_classes]
+        normalizador = valores.sum(axis=1, keepdims=True)
+        normalizador[normalizador == 0.0] = 1.0
+        proba[inicio:fim] = valores / normalizador
+        inicio = fim
+
+    opcionais = {}
+    if hasattr(modelo, 'feature_names_in_'):
+        opcionais['feature_names_in_'] = np.asarray(modelo.feature_names_in_, dtype=str)
+    if getattr(modelo, 'limiar_suspeita_', None) is not None:
+        opcionais['limiar_suspeita_'] = float(modelo.limiar_suspeita_)
+    if getattr(modelo, 'colunas_features_', None) is not None:
+        opcionais['colunas_features_'] = np.asarray(modelo.colunas_features_, dtype=str)
+    return FlorestaNativa(feature, threshold, esquerda, direita, proba, raizes,
+                          np.asarray(modelo.classes_, dtype=str), max(a.max_depth for a in arvores),
+                          modelo.n_features_in_, **opcionais)
+
+
+def amostras_paridade(floresta, n=2000, semente=0):
+    """Linhas sintéticas que exercitam os limiares da floresta (valores sorteados entre eles)"""
+    rng = np.random.default_rng(semente)
+    X = np.empty((n, floresta.n_features_in_), np.float32)
+    internos = floresta.esquerda != np.arange(len(floresta.esquerda))
+    for j in range(floresta.n_features_in_):
+        limiares = floresta.threshold[internos & (floresta.feature == j)]
+        if len(limiares) == 0:
+            X[:, j] = rng.random(n)
+            continue
+        # Metade exatamente sobre limiares (testa o <=), metade espalhada em volta
+        X[: n // 2, j] = rng.choice(limiares, n // 2)
+        margem = (limiares.max() - limiares.min()) * 0.1 + 1.0
+        X[n // 2:, j] = rng.uniform(limiares.min() - margem, limiares.max() + margem, n - n // 2)
+    return X
+
+
+def verificar_paridade(modelo, floresta, X=None, tolerancia=1e-9):
+    """Compara predict_proba da floresta nativa com o do sklearn; levanta ValueError se divergir
+
+    Sem `X`, usa amostras sintéticas sobre os limiares. Retorna a maior
+    diferença absoluta encontrada.
+    """
+    X = amostras_paridade(floresta) if X is None else np.asarray(X, dtype=np.float32)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        esperado = modelo.predict_proba(X)
+    obtido = floresta.predict_proba(X)
+    diferenca = float(np.abs(esperado - obtido).max()) if len(X) else 0.0
+    if diferenca > tolerancia or list(floresta.classes_) != [str(c) for c in modelo.classes_]:
+        raise ValueError(f"Floresta exportada diverge do modelo original (diferença máxima {diferenca:.3g})")
+    return diferenca
+
+
+def exportar_floresta(modelo, caminho, X=None):
+    """Exporta o modelo para .npz depois de conferir a paridade com predict_proba
+
+    `X` (opcional) são linhas reais para a verificação, além das sintéticas.
+    Retorna a maior diferença absoluta observada.
+    """
+    floresta = de_sklearn(modelo)
+    diferenca = verificar_paridade(modelo, floresta)
+    if X is not None:
+        diferenca = max(diferenca, verificar_paridade(modelo, floresta, X))
+    floresta.salvar(caminho)
+    return diferenca
+
+
+def carregar_floresta(caminho):
+    return FlorestaNativa.carregar(caminho)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta o modelo treinado (.pkl) para o formato nativo .npz")
+    parser.add_argument("modelo", help="modelo treinado (joblib .pkl)")
+    parser.add_argument("saida", help="arquivo .npz de saída")
+    args = parser.parse_args(argv)
+
+    import joblib
+    diferenca = exportar_floresta(joblib.load(args.modelo), args.saida)
+    print(f"✅ Floresta exportada para: {args.saida} (diferença máxima para o sklearn: {diferenca:.2g})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
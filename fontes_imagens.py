@@ -0,0 +1,140 @@
+import os
+import posixpath
+import random
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from fnmatch import fnmatch
+
+# Padrões padrão de imagens (comparação sem diferenciar maiúsculas)
+PADROES_IMAGEM = ("*.jpg", "*.jpeg")
+
+# Arquivos compactados lidos direto, sem extrair para o disco
+EXTENSOES_COMPACTADAS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+@dataclass(frozen=True)
+class ImagemEmMemoria:
+    """Imagem lida de um arquivo compactado: caminho lógico (arquivo.zip/membro) e bytes do JPEG"""
+    caminho: str
+    conteudo: bytes
+
+
+def caminho_item(item):
+    """Caminho de um item do lote (caminho de arquivo ou ImagemEmMemoria)"""
+    return item.caminho if isinstance(item, ImagemEmMemoria) else item
+
+
+def eh_compactado(caminho):
+    return os.path.isfile(caminho) and caminho.lower().endswith(EXTENSOES_COMPACTADAS)
+
+
+def _casa(nome, padroes):
+    nome = nome.lower()
+    return any(fnmatch(nome, padrao.lower()) for padrao in padroes)
+
+
+def iterar_imagens(raizes, incluir=PADROES_IMAGEM, excluir=(), recursivo=True, ordenar=False, ler=True):
+    """Gera os caminhos das imagens de uma ou mais pastas, à medida que são encontradas
+
+    Usa `os.scandir`, então o lote começa a processar antes de a varredura
+    terminar. `incluir`/`excluir` são padrões glob aplicados ao nome do
+    arquivo (ex.: "ISIC_00*.jpg"). Com `ordenar=True` cada pasta é percorrida
+    em ordem alfabética (só a listagem daquela pasta fica em memória). Raízes
+    que são .zip/.tar viram ImagemEmMemoria (ver iterar_compactado); com
+    `ler=False` viram só o caminho lógico (arquivo.zip/membro), sem ler os bytes.
+    """
+    if isinstance(raizes, (str, os.PathLike)):
+        raizes = [raizes]
+    pendentes = [os.fspath(r) for r in reversed(list(raizes))]
+    while pendentes:
+        pasta = pendentes.pop()
+        if eh_compactado(pasta):
+            yield from iterar_compactado(pasta, incluir, excluir, ler)
+            continue
+        with os.scandir(pasta) as entradas:
+            if ordenar:
+                entradas = sorted(entradas, key=lambda e: e.name)
+            subpastas = []
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    if recursivo:
+                        subpastas.append(entrada.path)
+                elif _casa(entrada.name, incluir) and not _casa(entrada.name, excluir):
+                    yield entrada.path
+        pendentes.extend(reversed(subpastas))
+
+
+def selecionar_por_metadata(csv_metadata, dx=None, localizacao=None, um_por_lesao=False, amostra=None,
+                            semente=42):
+    """Escolhe image_ids a partir do HAM10000_metadata.csv
+
+    Filtra por diagnóstico (`dx`) e `localizacao` (listas de valores), mantém
+    opcionalmente uma imagem por `lesion_id` e, com `amostra=N`, sorteia N
+    imagens estratificadas por `dx` (proporcional ao tamanho de cada classe).
+    Retorna o conjunto de image_ids escolhidos.
+    """
+    from dados import carregar_metadata  # pandas só quando há seleção pelo metadata
+
+    metadata = carregar_metadata(csv_metadata, colunas=("lesion_id", "dx", "localization")).reset_index()
+    if dx:
+        metadata = metadata[metadata["dx"].isin(dx)]
+    if localizacao:
+        metadata = metadata[metadata["localization"].isin(localizacao)]
+    if um_por_lesao:
+        metadata = metadata.sort_values("image_id").drop_duplicates("lesion_id", keep="first")
+    if amostra is not None and amostra < len(metadata):
+        metadata = _amostra_estratificada(metadata, amostra, semente)
+    return set(metadata["image_id"])
+
+
+def _amostra_estratificada(metadata, n, semente):
+    """Sorteia n linhas mantendo a proporção de cada `dx` (maiores restos recebem as sobras)"""
+    grupos = metadata.groupby("dx", observed=True)
+    cotas = {dx: len(g) * n / len(metadata) for dx, g in grupos}
+    inteiras = {dx: int(c) for dx, c in cotas.items()}
+    sobras = n - sum(inteiras.values())
+    for dx in sorted(cotas, key=lambda d: cotas[d] - inteiras[d], reverse=True)[:sobras]:
+        inteiras[dx] += 1
+    rng = random.Random(semente)
+    escolhidos = []
+    for dx, grupo in grupos:
+        ids = sorted(grupo["image_id"])
+        escolhidos.extend(rng.sample(ids, inteiras[dx]))
+    return metadata[metadata["image_id"].isin(escolhidos)]
+
+
+def iterar_compactado(caminho, incluir=PADROES_IMAGEM, excluir=(), ler=True):
+    """Gera uma ImagemEmMemoria por membro de um .zip/.tar que casa com os padrões, sem extrair
+
+    Os membros são lidos na ordem em que estão gravados, numa única passada
+    sequencial pelo arquivo: em vez de abrir milhares de arquivos pequenos
+    (custo de metadados alto em disco de rede), o lote lê um arquivo grande.
+    O .tar é aberto em modo stream (inclusive .tar.gz), sem voltar atrás.
+    Com `ler=False` gera só os caminhos lógicos, sem ler o conteúdo dos membros
+    (no .zip, só o diretório central).
+    """
+    def casa(membro):
+        nome = os.path.basename(membro)
+        return _casa(nome, incluir) and not _casa(nome, excluir)
+
+    if caminho.lower().endswith(".zip"):
+        with zipfile.ZipFile(caminho) as arquivo:
+            for info in sorted(arquivo.infolist(), key=lambda i: i.header_offset):
+                if not info.is_dir() and casa(info.filename):
+                    logico = f"{caminho}/{posixpath.normpath(info.filename)}"
+                    yield ImagemEmMemoria(logico, arquivo.read(info)) if ler else logico
+        return
+    with tarfile.open(caminho, mode="r|*") as arquivo:
+        for membro in arquivo:
+            if membro.isfile() and casa(membro.name):
+                logico = f"{caminho}/{posixpath.normpath(membro.name)}"
+                # Sem ler, o stream só pula os dados do membro até o próximo cabeçalho
+                yield ImagemEmMemoria(logico, arquivo.extractfile(membro).read()) if ler else logico
+
+
+def filtrar_ids(caminhos, ids):
+    """Mantém só as imagens cujo nome (sem extensão) está em `ids`"""
+    for item in caminhos:
+        if os.path.splitext(os.path.basename(caminho_item(item)))[0] in ids:
+            yield item
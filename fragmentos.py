@@ -0,0 +1,232 @@
+"""Divisão do lote em shards para rodar em várias máquinas, e junção validada dos resultados
+
+    py fragmentos.py manifesto --metadata ham10000/metadata/HAM10000_metadata.csv --shards 4 --por-lesao
+    py analisar_lote.py --shard 1/4 --manifesto manifesto_shards.csv      (em cada máquina, i = 1..4)
+    py fragmentos.py juntar results_lote/relatorio_lote_shard_*_de_4.csv --manifesto manifesto_shards.csv
+
+O shard de cada imagem é crc32(chave) % N, com chave = image_id (ou
+lesion_id, para manter todas as imagens de uma lesão no mesmo shard):
+determinístico, igual em qualquer máquina e versão do Python. Cada shard
+grava o próprio `relatorio_lote_shard_<i>_de_<N>.csv`; a junção confere
+cabeçalhos, shards faltando, imagens repetidas ou no shard errado e grava um
+`relatorio_lote.csv` ordenado por imagem.
+"""
+import argparse
+import csv
+import glob
+import os
+import re
+import sys
+import zlib
+
+from fontes_imagens import iterar_imagens, caminho_item, PADROES_IMAGEM
+
+COLUNAS_MANIFESTO = ["image_id", "lesion_id", "shard", "shards"]
+
+# relatorio_lote_shard_<i>_de_<N>.csv
+_PADRAO_ARQUIVO = re.compile(r"_shard_(\d+)_de_(\d+)\.csv$")
+
+
+def interpretar_shard(valor):
+    """'i/N' (1 <= i <= N) -> (i, N)"""
+    try:
+        i, n = (int(parte) for parte in valor.split("/"))
+    except ValueError:
+        i = n = 0
+    if not 1 <= i <= n:
+        raise ValueError(f"Shard inválido: {valor!r} (use i/N com 1 <= i <= N, ex.: 2/4)")
+    return i, n
+
+
+def nome_csv_shard(i, n, base="relatorio_lote"):
+    return f"{base}_shard_{i}_de_{n}.csv"
+
+
+def shard_de(chave, n):
+    """Shard (1..n) de uma chave: crc32 dos bytes UTF-8, estável entre máquinas"""
+    return zlib.crc32(str(chave).encode("utf-8")) % n + 1
+
+
+def _id(item):
+    return os.path.splitext(os.path.basename(caminho_item(item)))[0]
+
+
+def gerar_manifesto(image_ids, n, lesoes=None):
+    """Linhas do manifesto [image_id, lesion_id, shard, n], ordenadas por image_id
+
+    Com `lesoes` (image_id -> lesion_id), a chave do shard é a lesão; imagens
+    sem lesion_id usam o próprio image_id.
+    """
+    linhas = []
+    for image_id in sorted(set(image_ids)):
+        lesao = (lesoes or {}).get(image_id) or ""
+        linhas.append([image_id, lesao, shard_de(lesao or image_id, n), n])
+    return linhas
+
+
+def gravar_manifesto(linhas, caminho):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUNAS_MANIFESTO)
+        writer.writerows(linhas)
+    os.replace(temporario, caminho)
+    return caminho
+
+
+def ler_manifesto(caminho):
+    """image_id -> shard e o número de shards do manifesto"""
+    shards, total = {}, None
+    with open(caminho, newline="", encoding="utf-8") as f:
+        leitor = csv.reader(f)
+        if next(leitor, None) != COLUNAS_MANIFESTO:
+            raise ValueError(f"{caminho} não é um manifesto de shards (colunas {', '.join(COLUNAS_MANIFESTO)})")
+        for image_id, _, shard, n in leitor:
+            if total is not None and int(n) != total:
+                raise ValueError(f"{caminho} mistura números de shards ({total} e {n})")
+            total = int(n)
+            shards[image_id] = int(shard)
+    return shards, total
+
+
+def filtrar_shard(imagens, i, n, manifesto=None):
+    """Mantém só as imagens do shard i de n (pelo manifesto, se houver; senão pelo hash do image_id)
+
+    Com manifesto, imagens que não estão nele são descartadas.
+    """
+    if manifesto is None:
+        return (item for item in imagens if shard_de(_id(item), n) == i)
+    shards, total = ler_manifesto(manifesto)
+    if total != n:
+        raise ValueError(f"O manifesto {manifesto} tem {total} shards, não {n}")
+    return (item for item in imagens if shards.get(_id(item)) == i)
+
+
+def juntar_shards(arquivos, destino, manifesto=None, exigir_todas=False):
+    """Valida os CSVs dos shards e grava a junção em `destino`, ordenada por imagem
+
+    Levanta ValueError se: os cabeçalhos diferirem; os arquivos forem de
+    números de shards diferentes; faltar algum shard; uma imagem aparecer
+    duas vezes; (com manifesto) uma imagem estiver fora dele ou num shard que
+    não é o dela. Imagens do manifesto sem linha (falhas na análise) só
+    são erro com `exigir_todas=True`. Retorna um resumo da junção.
+    """
+    if not arquivos:
+        raise ValueError("Nenhum arquivo de shard informado")
+    esperado, total = ler_manifesto(manifesto) if manifesto else (None, None)
+
+    cabecalho, linhas, origem, vistos = None, {}, {}, {}
+    for arquivo in sorted(arquivos):
+        combinacao = _PADRAO_ARQUIVO.search(os.path.basename(arquivo))
+        if not combinacao:
+            raise ValueError(f"{arquivo}: nome fora do padrão {nome_csv_shard('i', 'N')}")
+        i, n = int(combinacao.group(1)), int(combinacao.group(2))
+        if total is not None and n != total:
+            raise ValueError(f"{arquivo}: shard de {n}, mas o lote tem {total} shards")
+        total = n
+        if i in vistos:
+            raise ValueError(f"Shard {i} repetido: {vistos[i]} e {arquivo}")
+        vistos[i] = arquivo
+
+        with open(arquivo, newline="", encoding="utf-8") as f:
+            leitor = csv.reader(f)
+            atual = next(leitor, None)
+            if cabecalho is not None and atual != cabecalho:
+                raise ValueError(f"{arquivo}: colunas diferentes das de {vistos[min(vistos)]}")
+            cabecalho = atual
+            for linha in leitor:
+                if not linha:
+                    continue
+                image_id = linha[0]  # já sem extensão (analisar_lote.id_imagem)
+                if image_id in linhas:
+                    raise ValueError(f"{image_id} aparece duas vezes ({origem[image_id]} e {arquivo})")
+                if esperado is not None:
+                    dono = esperado.get(image_id)
+                    if dono is None:
+                        raise ValueError(f"{arquivo}: {image_id} não está no manifesto")
+                    if dono != i:
+                        raise ValueError(f"{arquivo}: {image_id} pertence ao shard {dono}, não ao {i}")
+                linhas[image_id] = linha
+                origem[image_id] = arquivo
+
+    faltando_shards = sorted(set(range(1, total + 1)) - set(vistos))
+    if faltando_shards:
+        raise ValueError(f"Faltam os shards {', '.join(map(str, faltando_shards))} de {total}")
+    faltando = sorted(set(esperado) - set(linhas)) if esperado is not None else []
+    if faltando and exigir_todas:
+        raise ValueError(f"{len(faltando)} imagens do manifesto sem resultado (ex.: {', '.join(faltando[:5])})")
+
+    temporario = destino + ".tmp"
+    with open(temporario, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(cabecalho)
+        writer.writerows(linhas[image_id] for image_id in sorted(linhas))
+    os.replace(temporario, destino)
+    return {"csv": destino, "shards": total, "imagens": len(linhas), "faltando": faltando}
+
+
+def _arquivos(padroes):
+    """Expande os padrões glob (o cmd do Windows não expande *)"""
+    arquivos = []
+    for padrao in padroes:
+        arquivos.extend(sorted(glob.glob(padrao)) or [padrao])
+    return list(dict.fromkeys(arquivos))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shards do lote: manifesto e junção dos resultados")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p = comandos.add_parser("manifesto", help="divide as imagens em N shards determinísticos")
+    p.add_argument("--shards", type=int, required=True, help="número de shards (máquinas/processos)")
+    p.add_argument("--imagens", nargs="+", help="pastas ou .zip/.tar com as imagens")
+    p.add_argument("--metadata", help="HAM10000_metadata.csv (fonte dos image_ids e dos lesion_ids)")
+    p.add_argument("--por-lesao", action="store_true", help="mantém as imagens de um lesion_id no mesmo shard")
+    p.add_argument("--saida", default="manifesto_shards.csv", help="arquivo do manifesto")
+
+    j = comandos.add_parser("juntar", help="valida os CSVs dos shards e grava o relatorio_lote.csv")
+    j.add_argument("arquivos", nargs="+", help="relatorio_lote_shard_<i>_de_<N>.csv (aceita *)")
+    j.add_argument("--manifesto", help="manifesto usado nos shards (confere imagens e atribuição)")
+    j.add_argument("--saida", help="CSV juntado (padrão: relatorio_lote.csv na pasta do primeiro shard)")
+    j.add_argument("--exigir-todas", action="store_true", help="falha se alguma imagem do manifesto não tiver linha")
+    args = parser.parse_args(argv)
+
+    if args.comando == "manifesto":
+        if args.shards < 1:
+            parser.error("--shards deve ser >= 1")
+        if not args.imagens and not args.metadata:
+            parser.error("informe --imagens e/ou --metadata")
+        if args.por_lesao and not args.metadata:
+            parser.error("--por-lesao exige --metadata")
+        lesoes = None
+        if args.metadata:
+            from dados import carregar_metadata
+            metadata = carregar_metadata(args.metadata, colunas=("lesion_id",))
+            lesoes = dict(zip(metadata.index, metadata["lesion_id"].astype(str)))
+        if args.imagens:
+            # Só os nomes: nos .zip/.tar o conteúdo dos membros não é lido
+            ids = [_id(item) for item in iterar_imagens(args.imagens, incluir=PADROES_IMAGEM, ler=False)]
+        else:
+            ids = list(lesoes)
+        linhas = gerar_manifesto(ids, args.shards, lesoes if args.por_lesao else None)
+        gravar_manifesto(linhas, args.saida)
+        contagem = [sum(1 for linha in linhas if linha[2] == i) for i in range(1, args.shards + 1)]
+        print(f"✅ Manifesto salvo em: {args.saida} ({len(linhas)} imagens)")
+        print(f"📦 Imagens por shard: {', '.join(f'{i}: {c}' for i, c in enumerate(contagem, 1))}")
+        return 0
+
+    arquivos = _arquivos(args.arquivos)
+    destino = args.saida or os.path.join(os.path.dirname(arquivos[0]), "relatorio_lote.csv")
+    try:
+        resumo = juntar_shards(arquivos, destino, args.manifesto, args.exigir_todas)
+    except (ValueError, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {resumo['shards']} shards juntados em: {resumo['csv']} ({resumo['imagens']} imagens)")
+    if resumo["faltando"]:
+        print(f"⚠️ {len(resumo['faltando'])} imagens do manifesto sem resultado (falhas na análise?)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
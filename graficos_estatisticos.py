@@ -1,7 +1,21 @@
-import pandas as pd
+"""Relatórios estatísticos do lote (métricas, gráficos e pairplot), sem janela e em paralelo
+
+    py graficos_estatisticos.py --resultados results_lote/relatorio_lote.csv --saida results_lote/graficos
+    py graficos_estatisticos.py --base base_treinamento.parquet --saidas pairplot --dispersao hexbin
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import matplotlib
+matplotlib.use("Agg")  # só gera arquivos: nunca abre janela (roda em servidor e nos workers)
+
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import os
 from sklearn.metrics import (
     confusion_matrix,
     accuracy_score,
@@ -12,34 +26,31 @@ from sklearn.metrics import (
 )
 from matplotlib.backends.backend_pdf import PdfPages
 
+from dados import ROTULOS, base_juntada, ler_tabela
+from metricas_incrementais import MetricasIncrementais
+
 # ==================== Configurações ====================
 csv_resultados = r"C:\Users\DettCloud2\Downloads\tcc\results_lote_0707_ml_balanced\relatorio_lote.csv"
 csv_metadata = r"C:\Users\DettCloud2\Downloads\tcc\ham10000\metadata\HAM10000_metadata.csv"
 output_folder = r"C:\Users\DettCloud2\Downloads\tcc\results_lote_0707_ml_balanced\graficos"
 
-os.makedirs(output_folder, exist_ok=True)
+FEATURES_MORFOLOGIA = ["area", "perimetro", "circularidade", "aspect_ratio", "solidez"]
+
+# Saídas que o CLI sabe gerar, na ordem de envio ao pool (a mais lenta primeiro)
+SAIDAS = ("pairplot", "graficos", "desempenho", "matriz", "comparacao")
+
+# Acima deste número de linhas, dispersões e pairplot usam amostra (ou hexbin)
+MAX_PONTOS_PADRAO = 2000
+MODOS_DISPERSAO = ("amostra", "hexbin")
+
+# Curvas KDE já calculadas neste processo (chave -> (x, densidade))
+_kdes = {}
 
 # ==================== Funções Utilitárias ====================
 
 def carregar_dados(csv_resultados, csv_metadata):
-    """Carregar dados de resultados e metadados."""
-    resultados = pd.read_csv(csv_resultados)
-    metadata = pd.read_csv(csv_metadata)
-    resultados["imagem"] = resultados["imagem"].str.replace(".jpg", "", regex=False)
-    df = pd.merge(resultados, metadata[["image_id", "dx"]], left_on="imagem", right_on="image_id")
-
-    mapa = {
-        "akiec": "SUSPEITA",
-        "bcc": "SUSPEITA",
-        "mel": "SUSPEITA",
-        "bkl": "PROVAVELMENTE BENIGNA",
-        "df": "PROVAVELMENTE BENIGNA",
-        "nv": "PROVAVELMENTE BENIGNA",
-        "vasc": "PROVAVELMENTE BENIGNA",
-    }
-    df["diagnostico_real"] = df["dx"].map(mapa)
-    
-    return df
+    """Carregar dados de resultados e metadados (junção e rótulos de dados.py)."""
+    return base_juntada(csv_resultados, csv_metadata)
 
 def calcular_metricas(y_true, y_pred):
     """Calcular as métricas de desempenho do modelo."""
@@ -49,15 +60,64 @@ def calcular_metricas(y_true, y_pred):
     f1 = f1_score(y_true, y_pred, pos_label="SUSPEITA")
     return acc, prec, rec, f1
 
-def gerar_matriz_confusao(y_true, y_pred):
-    """Gerar e exibir a matriz de confusão."""
+def gerar_matriz_confusao(y_true, y_pred, output_folder=None):
+    """Calcular a matriz de confusão (e salvar a figura em PNG se houver pasta de saída)."""
     cm = confusion_matrix(y_true, y_pred, labels=["SUSPEITA", "PROVAVELMENTE BENIGNA"])
-    disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=["SUSPEITA", "PROVAVELMENTE BENIGNA"])
-    disp.plot(cmap=plt.cm.Blues)
-    plt.title("Matriz de Confusão")
-    plt.show()
+    if output_folder:
+        disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=["SUSPEITA", "PROVAVELMENTE BENIGNA"])
+        disp.plot(cmap=plt.cm.Blues)
+        plt.title("Matriz de Confusão")
+        output_path = os.path.join(output_folder, "matriz_confusao.png")
+        plt.savefig(output_path, bbox_inches="tight")
+        plt.close()
+        print(f"✅ Matriz de confusão salva em: {output_path}")
     return cm
 
+def amostrar(df, max_pontos, coluna="classificacao", semente=42):
+    """Amostra de até `max_pontos` linhas mantendo a proporção de cada classe de `coluna`."""
+    if max_pontos is None or len(df) <= max_pontos:
+        return df
+    fracao = max_pontos / len(df)
+    return df.groupby(coluna, observed=True, group_keys=False).sample(frac=fracao, random_state=semente)
+
+def _classes(df, coluna="classificacao"):
+    """Classes presentes em `coluna`, na ordem fixa dos rótulos."""
+    presentes = set(df[coluna].dropna())
+    return [c for c in ROTULOS.categories if c in presentes] + sorted(presentes - set(ROTULOS.categories))
+
+def curva_kde(valores, pasta_cache=None, pontos=200, corte=3):
+    """Curva KDE gaussiana (bandwidth de Scott, como o seaborn) de `valores`, com cache
+
+    O resultado fica guardado no processo e, com `pasta_cache`, num .npz
+    identificado pelo hash dos dados: o histograma e o pairplot (em workers
+    diferentes, ou em outra execução) reaproveitam a mesma curva.
+    """
+    from scipy.stats import gaussian_kde
+
+    valores = np.ascontiguousarray(valores, dtype=np.float64)
+    valores = valores[np.isfinite(valores)]
+    chave = hashlib.sha1(valores.tobytes() + f":{pontos}:{corte}".encode()).hexdigest()[:20]
+    if chave in _kdes:
+        return _kdes[chave]
+    arquivo = os.path.join(pasta_cache, f"kde_{chave}.npz") if pasta_cache else None
+    if arquivo and os.path.exists(arquivo):
+        with np.load(arquivo) as dados:
+            curva = dados["x"], dados["densidade"]
+    else:
+        if len(valores) < 2 or np.ptp(valores) == 0:
+            return np.array([]), np.array([])
+        kde = gaussian_kde(valores)
+        largura = kde.factor * valores.std(ddof=1)
+        x = np.linspace(valores.min() - corte * largura, valores.max() + corte * largura, pontos)
+        curva = x, kde(x)
+        if arquivo:
+            os.makedirs(pasta_cache, exist_ok=True)
+            temporario = arquivo + ".tmp.npz"
+            np.savez(temporario, x=curva[0], densidade=curva[1])
+            os.replace(temporario, arquivo)
+    _kdes[chave] = curva
+    return curva
+
 def gerar_relatorio_pdf(acc, prec, rec, f1, cm, output_folder):
     """Gerar um relatório em PDF com as métricas e a matriz de confusão."""
     pdf_path = os.path.join(output_folder, "relatorio_desempenho.pdf")
@@ -67,7 +127,7 @@ def gerar_relatorio_pdf(acc, prec, rec, f1, cm, output_folder):
     plt.figure(figsize=(8.5, 11))
     plt.axis("off")
     plt.title("Relatório de Desempenho do Modelo", fontsize=16, pad=20, weight="bold")
-    
+
     texto = (
         f"📊 Avaliação Quantitativa\n\n"
         f"- Acurácia: {acc*100:.2f}%\n"
@@ -84,7 +144,7 @@ def gerar_relatorio_pdf(acc, prec, rec, f1, cm, output_folder):
         f"- O recall alto é importante para não deixar lesões SUSPEITAS passarem.\n"
     )
     plt.text(0, 1, texto, fontsize=12, va="top")
-    
+
     pdf.savefig()
     plt.close()
 
@@ -110,43 +170,71 @@ def salvar_comparacao(df, output_folder):
     output_csv = os.path.join(output_folder, "comparacao.csv")
     df[['imagem', 'diagnostico_real', 'classificacao']].to_csv(output_csv, index=False)
     print(f"✅ CSV de comparação salvo em: {output_csv}")
-    
-def gerar_pairplot_morfologia(df, output_folder):
-    """Gerar gráfico de dispersão em pares (pairplot) dos atributos morfológicos"""
-    import seaborn as sns
 
-    features = ["area", "perimetro", "circularidade", "aspect_ratio", "solidez"]
-    df_plot = df[features + ["classificacao"]].copy()
+def gerar_pairplot_morfologia(df, output_folder, max_pontos=MAX_PONTOS_PADRAO, dispersao="amostra",
+                              pasta_kde=None, dpi=300):
+    """Gerar gráfico de dispersão em pares (pairplot) dos atributos morfológicos
+
+    Com mais de `max_pontos` linhas, os painéis fora da diagonal usam uma
+    amostra estratificada (`dispersao="amostra"`) ou hexbin de todas as
+    linhas (`"hexbin"`). As curvas da diagonal são sempre calculadas sobre
+    todas as linhas, com o cache de curva_kde.
+    """
+    classes = _classes(df)
+    cores = dict(zip(classes, sns.color_palette("Set1", len(classes))))
+    hexbin = dispersao == "hexbin" and len(df) > max_pontos
+    df_plot = df[FEATURES_MORFOLOGIA + ["classificacao"]]
+    if not hexbin:
+        df_plot = amostrar(df_plot, max_pontos)
+
+    def diagonal(x, label=None, **kwargs):
+        # Com hue o seaborn chama uma vez por classe; no hexbin, uma vez só (desenha todas)
+        ax = plt.gca()
+        for classe in ([label] if label in cores else classes):
+            xs, densidade = curva_kde(df.loc[df["classificacao"] == classe, x.name], pasta_kde)
+            ax.fill_between(xs, densidade, color=cores[classe], alpha=0.25, linewidth=0)
+            ax.plot(xs, densidade, color=cores[classe], linewidth=1.5)
 
     sns.set(style="whitegrid", font_scale=1.1)
-    g = sns.pairplot(
-        df_plot,
-        hue="classificacao",
-        palette="Set1",
-        diag_kind="kde",
-        markers=["o", "s"],
-        plot_kws={'alpha': 0.6, 's': 35}
-    )
-
-    g.fig.suptitle("Gráfico de Dispersão dos Atributos Morfológicos", fontsize=16, y=1.03)
+    if hexbin:
+        g = sns.PairGrid(df_plot, vars=FEATURES_MORFOLOGIA, diag_sharey=False)
+        g.map_offdiag(plt.hexbin, gridsize=40, mincnt=1, cmap="Greys", bins="log", linewidths=0)
+        g.map_diag(diagonal)
+        g.fig.legend(handles=[plt.Line2D([], [], color=cores[c], linewidth=2) for c in classes],
+                     labels=classes, title="classificacao", loc="center left", bbox_to_anchor=(1.0, 0.5))
+    else:
+        g = sns.PairGrid(df_plot, vars=FEATURES_MORFOLOGIA, hue="classificacao", hue_order=classes,
+                         palette=cores, diag_sharey=False, hue_kws={"marker": ["o", "s"][:len(classes)]})
+        g.map_offdiag(plt.scatter, alpha=0.6, s=35, edgecolor="white", linewidth=0.5)
+        g.map_diag(diagonal)
+        g.add_legend()
+
+    titulo = "Gráfico de Dispersão dos Atributos Morfológicos"
+    if len(df_plot) < len(df):
+        titulo += f" (amostra de {len(df_plot)} de {len(df)})"
+    g.fig.suptitle(titulo, fontsize=16, y=1.03)
     output_path = os.path.join(output_folder, "pairplot_morfologia.png")
-    plt.savefig(output_path, dpi=300, bbox_inches="tight")
-    plt.close()
+    plt.savefig(output_path, dpi=dpi, bbox_inches="tight")
+    plt.close("all")
     print(f"✅ Pairplot salvo em: {output_path}")
 
 
 # ==================== Análise Estatística e Geração de Gráficos ====================
 
-def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder):
+def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder, max_pontos=MAX_PONTOS_PADRAO, dispersao="amostra",
+                   pasta_kde=None):
     # Gerar gráficos para análise estatística
     pdf_path = os.path.join(output_folder, "relatorio_geral.pdf")
     pdf = PdfPages(pdf_path)
+    classes = _classes(df)
 
     # 1. Distribuição das Classificações
     plt.figure(figsize=(8, 5))
     sns.countplot(
         data=df,
         x="classificacao",
+        hue="classificacao",
+        legend=False,
         palette="pastel",  # Usando uma paleta suave
         edgecolor="black",  # Bordas discretas
         linewidth=0.8
@@ -170,6 +258,8 @@ def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder):
     sns.countplot(
         data=df,
         x="diagnostico_real",
+        hue="diagnostico_real",
+        legend=False,
         palette="muted",  # Paleta mais neutra
         edgecolor="black",  # Bordas discretas
         linewidth=0.8
@@ -190,17 +280,24 @@ def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder):
 
     # 3. Histograma de Área
     plt.figure(figsize=(10, 6))
-    sns.histplot(
+    cores = dict(zip(classes, sns.color_palette("pastel", len(classes))))
+    ax = sns.histplot(
         data=df,
         x="area",
         hue="classificacao",
+        hue_order=classes,
         bins=20,  # Ajustando o número de bins
-        kde=True,  # Linha de densidade
-        palette="pastel",  # Paleta suave
+        palette=cores,  # Paleta suave
         multiple="stack",
         edgecolor="black",
         linewidth=0.8
     )
+    # Linha de densidade (curva em cache), na escala de contagem do histograma
+    largura_bin = (df["area"].max() - df["area"].min()) / 20
+    for classe in classes:
+        valores = df.loc[df["classificacao"] == classe, "area"]
+        xs, densidade = curva_kde(valores, pasta_kde)
+        ax.plot(xs, densidade * len(valores) * largura_bin, color=cores[classe], linewidth=1.5)
     plt.title("Distribuição da Área das Lesões por Classificação", fontsize=14, weight="bold")
     plt.xlabel("Área", fontsize=12)
     plt.ylabel("Frequência", fontsize=12)
@@ -210,20 +307,37 @@ def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder):
     plt.close()
 
     # 4. Scatterplot Área vs Circularidade
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(
-        data=df,
-        x="area",
-        y="circularidade",
-        hue="classificacao",
-        palette="muted",  # Paleta suave
-        edgecolor="black",  # Bordas discretas
-        linewidth=0.6,
-        s=50  # Ajuste no tamanho dos pontos
-    )
-    plt.title("Relação: Área vs Circularidade", fontsize=14, weight="bold")
-    plt.xlabel("Área", fontsize=12)
-    plt.ylabel("Circularidade", fontsize=12)
+    if dispersao == "hexbin" and len(df) > max_pontos:
+        # Um painel por classe, com todas as linhas agregadas em hexágonos
+        fig, eixos = plt.subplots(1, len(classes), figsize=(10, 6), sharex=True, sharey=True, squeeze=False)
+        for ax, classe in zip(eixos[0], classes):
+            parte = df[df["classificacao"] == classe]
+            ax.hexbin(parte["area"], parte["circularidade"], gridsize=40, mincnt=1, cmap="Blues", bins="log",
+                      linewidths=0)
+            ax.set_title(classe, fontsize=12)
+            ax.set_xlabel("Área", fontsize=12)
+        eixos[0][0].set_ylabel("Circularidade", fontsize=12)
+        fig.suptitle("Relação: Área vs Circularidade", fontsize=14, weight="bold")
+    else:
+        df_plot = amostrar(df, max_pontos)
+        plt.figure(figsize=(10, 6))
+        sns.scatterplot(
+            data=df_plot,
+            x="area",
+            y="circularidade",
+            hue="classificacao",
+            hue_order=classes,
+            palette="muted",  # Paleta suave
+            edgecolor="black",  # Bordas discretas
+            linewidth=0.6,
+            s=50  # Ajuste no tamanho dos pontos
+        )
+        titulo = "Relação: Área vs Circularidade"
+        if len(df_plot) < len(df):
+            titulo += f" (amostra de {len(df_plot)} de {len(df)})"
+        plt.title(titulo, fontsize=14, weight="bold")
+        plt.xlabel("Área", fontsize=12)
+        plt.ylabel("Circularidade", fontsize=12)
 
     plt.tight_layout()
     pdf.savefig()
@@ -235,6 +349,8 @@ def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder):
         data=df,
         x="classificacao",
         y="circularidade",
+        hue="classificacao",
+        legend=False,
         palette="coolwarm",  # Paleta suave
         linewidth=1.2
     )
@@ -248,34 +364,105 @@ def gerar_graficos(df, acc, prec, rec, f1, cm, output_folder):
 
     # Fechar PDF
     pdf.close()
+    print(f"✅ Gráficos salvos em: {pdf_path}")
+
+# ==================== Geração em Paralelo ====================
+
+# Estado de cada processo do pool (definido em _inicializar_worker)
+_df = None
+_opcoes = None
+
+
+def _inicializar_worker(df, opcoes):
+    """Recebe a tabela e as opções uma vez por processo"""
+    global _df, _opcoes
+    _df = df
+    _opcoes = opcoes
+
+
+def _gerar_saida(nome):
+    """Gera uma saída independente (executado no worker); retorna (nome, segundos)"""
+    inicio = time.perf_counter()
+    df, opcoes = _df, _opcoes
+    pasta = opcoes["saida"]
+    if nome == "pairplot":
+        gerar_pairplot_morfologia(df, pasta, opcoes["max_pontos"], opcoes["dispersao"], opcoes["pasta_kde"],
+                                  opcoes["dpi"])
+    elif nome == "comparacao":
+        salvar_comparacao(df, pasta)
+    else:
+        y_true, y_pred = df["diagnostico_real"], df["classificacao"]
+        if nome == "matriz":
+            gerar_matriz_confusao(y_true, y_pred, pasta)
+        else:
+            acc, prec, rec, f1 = calcular_metricas(y_true, y_pred)
+            cm = gerar_matriz_confusao(y_true, y_pred)
+            if nome == "desempenho":
+                gerar_relatorio_pdf(acc, prec, rec, f1, cm, pasta)
+            else:
+                gerar_graficos(df, acc, prec, rec, f1, cm, pasta, opcoes["max_pontos"], opcoes["dispersao"],
+                               opcoes["pasta_kde"])
+    return nome, time.perf_counter() - inicio
+
+
+def gerar_relatorios(df, saida, saidas=SAIDAS, workers=None, max_pontos=MAX_PONTOS_PADRAO, dispersao="amostra",
+                     pasta_kde=None, dpi=300):
+    """Gera as `saidas` pedidas em `saida`, cada uma num processo do pool
+
+    Retorna {saida: segundos}. Com workers=1 tudo roda no próprio processo.
+    """
+    os.makedirs(saida, exist_ok=True)
+    opcoes = {"saida": saida, "max_pontos": max_pontos, "dispersao": dispersao, "pasta_kde": pasta_kde, "dpi": dpi}
+    pedidas = [nome for nome in SAIDAS if nome in saidas]
+    workers = min(workers or os.cpu_count() or 1, len(pedidas))
+    if workers <= 1:
+        _inicializar_worker(df, opcoes)
+        return dict(map(_gerar_saida, pedidas))
+    with Pool(processes=workers, initializer=_inicializar_worker, initargs=(df, opcoes)) as pool:
+        return dict(pool.imap_unordered(_gerar_saida, pedidas))
 
 # ==================== Execução Principal ====================
 
-def main():
-    # Carregar dados
-    df = carregar_dados(csv_resultados, csv_metadata)
-
-    # Labels reais e preditos
-    y_true = df['diagnostico_real']
-    y_pred = df['classificacao']
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera métricas, gráficos e pairplot a partir do relatório do lote")
+    parser.add_argument("--resultados", default=csv_resultados, help="relatorio_lote.csv gerado pelo analisar_lote.py")
+    parser.add_argument("--metadata", default=csv_metadata, help="HAM10000_metadata.csv")
+    parser.add_argument("--base", help="base já juntada pelo preparar_dados.py (dispensa --resultados/--metadata)")
+    parser.add_argument("--saida", default=output_folder, help="pasta dos relatórios e gráficos")
+    parser.add_argument("--saidas", nargs="+", choices=SAIDAS, default=list(SAIDAS),
+                        help="quais saídas gerar (padrão: todas)")
+    parser.add_argument("--workers", type=int, default=None, help="processos em paralelo (padrão: núcleos)")
+    parser.add_argument("--max-pontos", type=int, default=MAX_PONTOS_PADRAO,
+                        help="acima disto, dispersões e pairplot usam amostra ou hexbin")
+    parser.add_argument("--dispersao", choices=MODOS_DISPERSAO, default="amostra",
+                        help="como desenhar muitas linhas: amostra estratificada ou hexbin de todas")
+    parser.add_argument("--cache-kde", default=None,
+                        help="pasta do cache das curvas KDE (padrão: <saida>/cache_kde)")
+    parser.add_argument("--dpi", type=int, default=300, help="resolução do pairplot em PNG")
+    args = parser.parse_args(argv)
 
-    # Calcular métricas
-    acc, prec, rec, f1 = calcular_metricas(y_true, y_pred)
+    # Carregar dados
+    df = ler_tabela(args.base) if args.base else carregar_dados(args.resultados, args.metadata)
 
-    # Mostrar no terminal
+    # Calcular métricas (geral e por dx/localização/idade) e mostrar no terminal
+    metricas = MetricasIncrementais.de_tabela(df)
+    geral = metricas.metricas()
     print("📊 Avaliação do Desempenho:")
-    print(f"Acurácia: {acc*100:.2f}%")
-    print(f"Precisão (SUSPEITA): {prec*100:.2f}%")
-    print(f"Recall/Sensibilidade (SUSPEITA): {rec*100:.2f}%")
-    print(f"F1-Score: {f1*100:.2f}%")
-
-    # Gerar matriz de confusão
-    cm = gerar_matriz_confusao(y_true, y_pred)
+    print(f"Acurácia: {geral['acuracia']*100:.2f}%")
+    print(f"Precisão (SUSPEITA): {geral['precisao']*100:.2f}%")
+    print(f"Recall/Sensibilidade (SUSPEITA): {geral['recall']*100:.2f}%")
+    print(f"F1-Score: {geral['f1']*100:.2f}%")
+    os.makedirs(args.saida, exist_ok=True)
+    print(f"✅ Métricas por dx, localização e idade salvas em: {metricas.gravar(os.path.join(args.saida, 'metricas.json'))}")
 
     # Gerar relatórios e gráficos
-    gerar_relatorio_pdf(acc, prec, rec, f1, cm, output_folder)
-    gerar_graficos(df, acc, prec, rec, f1, cm, output_folder)
-    salvar_comparacao(df, output_folder)
-    gerar_pairplot_morfologia(df, output_folder)
+    pasta_kde = args.cache_kde or os.path.join(args.saida, "cache_kde")
+    tempos = gerar_relatorios(df, args.saida, args.saidas, args.workers, args.max_pontos, args.dispersao,
+                              pasta_kde, args.dpi)
+    for nome, segundos in sorted(tempos.items(), key=lambda item: -item[1]):
+        print(f"⏱️ {nome}: {segundos:.1f}s")
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
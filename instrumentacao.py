@@ -0,0 +1,161 @@
+import os
+import csv
+import zlib
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter_ns, process_time_ns, thread_time_ns
+
+import numpy as np
+
+PERCENTIS = (50, 95, 99)
+# Relógios de CPU: 'processo' soma todas as threads do processo (inclusive as
+# internas do OpenCV); 'thread' só a thread que executa a etapa (modo esteira)
+RELOGIOS_CPU = {'processo': process_time_ns, 'thread': thread_time_ns}
+
+
+class _Cronometro:
+    """Mede uma etapa: tempo de parede sempre, CPU e ganchos só com a instrumentação ativa"""
+    __slots__ = ('instr', 'nome', 'tempos', 'tempos_cpu', 'inicio', 'inicio_cpu')
+
+    def __init__(self, instr, nome, tempos, tempos_cpu):
+        self.instr = instr
+        self.nome = nome
+        self.tempos = tempos
+        self.tempos_cpu = tempos_cpu
+
+    def __enter__(self):
+        if self.instr.ativo:
+            self.inicio_cpu = self.instr.relogio()
+        self.inicio = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        parede = perf_counter_ns() - self.inicio
+        if self.tempos is not None:
+            self.tempos[self.nome] = self.tempos.get(self.nome, 0.0) + parede / 1e9
+        if self.instr.ativo:
+            cpu = self.instr.relogio() - self.inicio_cpu
+            if self.tempos_cpu is not None:
+                self.tempos_cpu[self.nome] = self.tempos_cpu.get(self.nome, 0.0) + cpu / 1e9
+            self.instr._finalizar_etapa(self.nome, parede, cpu)
+        return False
+
+
+class Instrumentacao:
+    """Cronômetros por etapa do pipeline, ganchos e captura de perfis por amostragem
+
+    Desativada (`ativo=False`), cada etapa custa só duas leituras de
+    perf_counter_ns para preencher `ResultadoAnalise.timings`. Ativa, também
+    mede o tempo de CPU da etapa com o relógio `relogio_cpu` (ver
+    RELOGIOS_CPU; `resumo()` e `gravar_csv` informam qual foi usado), chama
+    cada gancho `gancho(etapa, parede_ns, cpu_ns)` e, com `acumular=True`,
+    guarda as amostras para os percentis p50/p95/p99 de `resumo()`. Nos
+    workers do lote `acumular=False`: os tempos voltam no resultado de cada
+    imagem e são somados no processo principal com `registrar`.
+    """
+
+    def __init__(self, ativo=True, ganchos=(), perfil_amostra=0, memoria_amostra=0, pasta_perfis=None,
+                 acumular=True, relogio_cpu='processo'):
+        if relogio_cpu not in RELOGIOS_CPU:
+            raise ValueError(f"Relógio de CPU inválido: {relogio_cpu!r} (use {', '.join(RELOGIOS_CPU)})")
+        self.ativo = ativo
+        self.acumular = acumular
+        self.ganchos = list(ganchos)
+        self.perfil_amostra = perfil_amostra      # cProfile em 1 a cada N imagens (0 = nunca)
+        self.memoria_amostra = memoria_amostra    # tracemalloc em 1 a cada N imagens (0 = nunca)
+        self.pasta_perfis = pasta_perfis
+        self.relogio_cpu = relogio_cpu
+        self.relogio = RELOGIOS_CPU[relogio_cpu]
+        self.parede = {}
+        self.cpu = {}
+
+    def etapa(self, nome, tempos=None, tempos_cpu=None):
+        """Context manager que cronometra a etapa `nome` (somando em `tempos`/`tempos_cpu`, em segundos)"""
+        return _Cronometro(self, nome, tempos, tempos_cpu)
+
+    def adicionar_gancho(self, gancho):
+        self.ganchos.append(gancho)
+
+    def _finalizar_etapa(self, nome, parede_ns, cpu_ns):
+        if self.acumular:
+            self.parede.setdefault(nome, []).append(parede_ns)
+            self.cpu.setdefault(nome, []).append(cpu_ns)
+        for gancho in self.ganchos:
+            gancho(nome, parede_ns, cpu_ns)
+
+    def registrar(self, tempos, tempos_cpu=None):
+        """Acumula tempos (em segundos) medidos em outro processo, ex.: vindos dos workers"""
+        for nome, segundos in tempos.items():
+            self.parede.setdefault(nome, []).append(int(segundos * 1e9))
+        for nome, segundos in (tempos_cpu or {}).items():
+            self.cpu.setdefault(nome, []).append(int(segundos * 1e9))
+
+    def _sorteada(self, nome_imagem, n):
+        return n > 0 and zlib.crc32(nome_imagem.encode('utf-8')) % n == 0
+
+    @contextmanager
+    def perfilar(self, nome_imagem):
+        """Captura cProfile e/ou tracemalloc se esta imagem cair na amostragem"""
+        perfil = self.ativo and self._sorteada(nome_imagem, self.perfil_amostra)
+        memoria = self.ativo and self._sorteada(nome_imagem, self.memoria_amostra) and not tracemalloc.is_tracing()
+        if not (perfil or memoria):
+            yield
+            return
+
+        pasta = self.pasta_perfis or "."
+        os.makedirs(pasta, exist_ok=True)
+        profiler = cProfile.Profile() if perfil else None
+        if memoria:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(pasta, f"{nome_imagem}.prof"))
+            if memoria:
+                foto = tracemalloc.take_snapshot()
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                with open(os.path.join(pasta, f"{nome_imagem}_memoria.txt"), 'w', encoding='utf-8') as f:
+                    f.write(f"Pico de memória alocada (tracemalloc): {pico / 1024:.1f} KiB\n\n")
+                    for estatistica in foto.statistics('lineno')[:25]:
+                        f.write(f"{estatistica}\n")
+
+    def resumo(self):
+        """Estatísticas por etapa: n, média, total e percentis (em ms; CPU média em ms e o relógio usado)"""
+        linhas = {}
+        for nome, amostras in self.parede.items():
+            valores = np.asarray(amostras, dtype=np.float64) / 1e6
+            linha = {
+                "n": len(valores),
+                "media_ms": float(valores.mean()),
+                "total_s": float(valores.sum() / 1e3),
+            }
+            for p, v in zip(PERCENTIS, np.percentile(valores, PERCENTIS)):
+                linha[f"p{p}_ms"] = float(v)
+            cpu = self.cpu.get(nome)
+            linha["cpu_media_ms"] = float(np.mean(cpu) / 1e6) if cpu else None
+            linha["relogio_cpu"] = self.relogio_cpu if cpu else None
+            linhas[nome] = linha
+        return linhas
+
+    def gravar_csv(self, caminho):
+        """Grava o resumo por etapa (uma linha por etapa)"""
+        colunas = ["etapa", "n", "media_ms"] + [f"p{p}_ms" for p in PERCENTIS] + ["cpu_media_ms", "relogio_cpu", "total_s"]
+        with open(caminho, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(colunas)
+            for nome, linha in self.resumo().items():
+                writer.writerow([nome] + [
+                    "" if linha[c] is None else (round(linha[c], 3) if isinstance(linha[c], float) else linha[c])
+                    for c in colunas[1:]
+                ])
+        return caminho
+
+
+# Instrumentação padrão dos analisadores: só o tempo de parede de cada etapa
+DESATIVADA = Instrumentacao(ativo=False)
@@ -1,30 +1,487 @@
 import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from functools import cached_property
+import zlib
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-from skimage import measure
-from skimage.segmentation import watershed
-import joblib
-import pandas as pd
+import warnings
+from registro_modelos import MODELO_PADRAO, REGISTRO
+from instrumentacao import DESATIVADA
+from relatorio_visual import RENDERIZADORES, renderizar_matplotlib, renderizar_opencv, sobreposicao
+from extrator_features import extrair_lote, alocar_features, como_dicionario
+
+# Características extraídas -> colunas usadas no treinamento (na ordem do modelo)
+COLUNAS_MODELO = {
+    'area': 'area',
+    'perimeter': 'perimetro',
+    'circularity': 'circularidade',
+    'aspect_ratio': 'aspect_ratio',
+    'solidity': 'solidez',
+}
+
+# Descritores ABCD -> colunas do CSV; só entram no modelo com treinar_modelo.py --features estendidas
+COLUNAS_ABCD = {
+    'asymmetry': 'assimetria',
+    'border_irregularity': 'irregularidade_borda',
+    'color_variance': 'variancia_cor',
+    'diameter': 'diametro',
+}
+
+# Conjuntos de características aceitos no treinamento
+CONJUNTOS_FEATURES = {'basicas': COLUNAS_MODELO, 'estendidas': {**COLUNAS_MODELO, **COLUNAS_ABCD}}
+
+
+def features_do_modelo(modelo):
+    """Características (nomes de extract_features) que o modelo recebe, na ordem das colunas
+
+    Modelos treinados por treinar_modelo.py guardam as colunas em
+    `colunas_features_`; sem o atributo (modelos antigos), valem as de COLUNAS_MODELO.
+    """
+    colunas = getattr(modelo, 'colunas_features_', None)
+    if colunas is None:
+        return tuple(COLUNAS_MODELO)
+    por_coluna = {coluna: nome for nome, coluna in CONJUNTOS_FEATURES['estendidas'].items()}
+    return tuple(por_coluna[str(coluna)] for coluna in colunas)
+
+
+def verificar_decodificacao(modelo, decode_mode):
+    """Levanta ValueError se o modelo usar a variância de cor e a decodificação não tiver cor"""
+    if decode_mode != 'full' and 'color_variance' in features_do_modelo(modelo):
+        raise ValueError(f"O modelo usa a variância de cor, que não existe com decode_mode={decode_mode!r} "
+                         "(imagem em cinza); use a decodificação 'full'")
+
+
+def montar_entrada(features_list, nomes=tuple(COLUNAS_MODELO)):
+    """Empilha as características `nomes` num array float32 contíguo (uma linha por lesão)"""
+    entrada = np.empty((len(features_list), len(nomes)), dtype=np.float32)
+    for i, features in enumerate(features_list):
+        for j, nome in enumerate(nomes):
+            entrada[i, j] = features[nome]
+    if np.isnan(entrada).any():
+        faltando = sorted({nome for j, nome in enumerate(nomes) if np.isnan(entrada[:, j]).any()})
+        raise ValueError(f"Características indisponíveis para o modelo: {', '.join(faltando)}")
+    return entrada
+
+
+# Classe positiva do classificador (a que recebe o limiar ajustado no treinamento)
+CLASSE_SUSPEITA = 'SUSPEITA'
+
+
+def rotulos_com_limiar(modelo, proba):
+    """Rótulos a partir das probabilidades
+
+    Se o modelo tiver `limiar_suspeita_` (ver treinar_modelo.py), a lesão é
+    SUSPEITA quando P(SUSPEITA) >= limiar; senão vence a maior probabilidade.
+    """
+    indices = np.argmax(proba, axis=1)
+    limiar = getattr(modelo, 'limiar_suspeita_', None)
+    classes = list(modelo.classes_)
+    if limiar is not None and CLASSE_SUSPEITA in classes:
+        j = classes.index(CLASSE_SUSPEITA)
+        outras = proba.copy()
+        outras[:, j] = -np.inf
+        indices = np.where(proba[:, j] >= limiar, j, np.argmax(outras, axis=1))
+    return modelo.classes_.take(indices)
+
+
+def classificar_matriz(modelo, entrada, return_proba=False):
+    """Classifica as linhas de um array (colunas na ordem de features_do_modelo) com um único predict_proba"""
+    with warnings.catch_warnings():
+        # O modelo foi treinado com um DataFrame; o array segue a mesma ordem de colunas
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        proba = modelo.predict_proba(entrada)
+    rotulos = list(rotulos_com_limiar(modelo, proba))
+    return (rotulos, proba) if return_proba else rotulos
+
+
+def classificar_lote(modelo, features_list, return_proba=False):
+    """Classifica uma lista de características com uma única chamada predict_proba
+
+    Retorna a lista de rótulos ou, com `return_proba=True`, também a matriz de
+    probabilidades (colunas na ordem de `modelo.classes_`).
+    """
+    if not features_list:
+        return ([], np.empty((0, 0))) if return_proba else []
+    return classificar_matriz(modelo, montar_entrada(features_list, features_do_modelo(modelo)), return_proba)
+
+# Parâmetros do pré-processamento e da segmentação (entram na impressão do cache de features)
+PARAMETROS_PIPELINE = {
+    'tamanho': 256,              # lado da imagem redimensionada
+    'mediana_kernel': 5,         # medianBlur
+    'clahe_clip': 2.0,           # CLAHE clipLimit
+    'clahe_grade': 8,            # CLAHE tileGridSize
+    'gauss_kernel': 5,           # GaussianBlur
+    'morfologia_kernel': 3,      # elemento estruturante quadrado
+    'abertura_iteracoes': 2,
+    'fechamento_iteracoes': 2,
+    'dilatacao_iteracoes': 3,    # fundo "certo" do watershed
+    'watershed_fator': 0.7,      # fração do máximo da distância para o primeiro plano "certo"
+}
+
+# Aumentar quando o código do pipeline mudar de forma que altere as características
+VERSAO_PIPELINE = 3
+
+# Segmentação: watershed sempre, ou em níveis (watershed só quando a máscara morfológica é ambígua)
+MODOS_SEGMENTACAO = ('watershed', 'tiered')
+
+# Quando a máscara de Otsu + morfologia já é "limpa" o bastante para dispensar o watershed
+# (segmentation_mode='tiered'; ver avaliar_mascara e benchmarks/segmentacao_niveis.py)
+CRITERIOS_MASCARA_LIMPA = {
+    'area_min': 0.01,            # fração da imagem coberta pelo maior componente
+    'secundario_max': 0.05,      # área do 2º maior componente / área do maior
+    'preenchimento_min': 0.98,   # 1 - área dos buracos do maior componente / área dele
+    'contato_borda_max': 0.02,   # fração da moldura da imagem coberta pela máscara
+}
+
+
+def impressao_pipeline(parametros=None, decode_mode='full', segmentation_mode='watershed'):
+    """Impressão digital (sha1) dos parâmetros que determinam as características"""
+    conteudo = dict(PARAMETROS_PIPELINE, **(parametros or {}))
+    conteudo.update(decode_mode=decode_mode, versao=VERSAO_PIPELINE)
+    if segmentation_mode != 'watershed':
+        # Só entra na impressão fora do padrão: caches antigos (sempre watershed) continuam válidos
+        conteudo.update(segmentation_mode=segmentation_mode, criterios=CRITERIOS_MASCARA_LIMPA)
+    return hashlib.sha1(json.dumps(conteudo, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def medir_mascara(mascara):
+    """Medidas baratas de uma máscara binária: área, componentes, buracos e contato com a borda
+
+    Um findContours (RETR_CCOMP: contornos externos e seus buracos) e a
+    contagem de pixels da moldura; custa uma fração do watershed.
+    """
+    altura, largura = mascara.shape[:2]
+    contornos, hierarquia = cv2.findContours(mascara, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    medidas = {'area': 0.0, 'secundario': 0.0, 'preenchimento': 0.0, 'contato_borda': 0.0, 'componentes': 0}
+    if not contornos:
+        return medidas
+    areas = np.array([cv2.contourArea(c) for c in contornos])
+    externos = np.flatnonzero(hierarquia[0, :, 3] < 0)
+    ordem = externos[np.argsort(areas[externos])[::-1]]
+    maior = ordem[0]
+    buracos = areas[hierarquia[0, :, 3] == maior].sum()
+    moldura = (np.count_nonzero(mascara[0]) + np.count_nonzero(mascara[-1])
+               + np.count_nonzero(mascara[1:-1, 0]) + np.count_nonzero(mascara[1:-1, -1]))
+    medidas.update(
+        area=float(areas[maior] / (altura * largura)),
+        secundario=float(areas[ordem[1]] / areas[maior]) if len(ordem) > 1 and areas[maior] > 0 else 0.0,
+        preenchimento=float(1.0 - buracos / areas[maior]) if areas[maior] > 0 else 0.0,
+        contato_borda=float(moldura / (2 * (altura + largura) - 4)),
+        componentes=int(len(externos)),
+    )
+    return medidas
+
+
+def mascara_limpa(medidas, criterios=None):
+    """True se as medidas (ver medir_mascara) atendem aos CRITERIOS_MASCARA_LIMPA"""
+    c = dict(CRITERIOS_MASCARA_LIMPA, **(criterios or {}))
+    return (medidas['area'] >= c['area_min'] and medidas['secundario'] <= c['secundario_max']
+            and medidas['preenchimento'] >= c['preenchimento_min']
+            and medidas['contato_borda'] <= c['contato_borda_max'])
+
+
+class ContextoPipeline:
+    """Objetos do OpenCV e buffers de trabalho reaproveitados entre imagens (um por worker)
+
+    Guarda o CLAHE, o elemento estruturante e os buffers `tamanho x tamanho`
+    de cada etapa; com ele as etapas escrevem nos buffers via `dst=` e o
+    processamento em regime não aloca arrays grandes por imagem (só a
+    decodificação). As saídas das etapas passam a ser views desses buffers,
+    sobrescritas pela próxima imagem: quem for guardá-las deve copiar (ver
+    EtapasLesao.desacoplar). Um contexto não deve ser usado por duas threads
+    ao mesmo tempo.
+    """
+
+    def __init__(self, parametros=None):
+        p = self.parametros = dict(PARAMETROS_PIPELINE, **(parametros or {}))
+        lado = (p['tamanho'], p['tamanho'])
+        self.clahe = cv2.createCLAHE(clipLimit=p['clahe_clip'], tileGridSize=(p['clahe_grade'], p['clahe_grade']))
+        self.kernel = np.ones((p['morfologia_kernel'], p['morfologia_kernel']), np.uint8)
+        self.buffers = {nome: np.empty(lado, np.uint8) for nome in (
+            'resized', 'denoised', 'equalized', 'smoothed', 'binary', 'opening', 'closing',
+            'sure_fg', 'sure_bg', 'unknown', 'mask', 'edges')}
+        self.buffers.update(
+            distancia=np.empty(lado, np.float32),
+            sure_fg_float=np.empty(lado, np.float32),
+            markers=np.empty(lado, np.int32),
+            selecao=np.empty(lado, np.bool_),
+            bgr=np.empty(lado + (3,), np.uint8),
+        )
+        self.cinza = None
+        self.features = alocar_features(1)
+
+    def buffer_cinza(self, forma):
+        """Buffer da conversão para cinza no tamanho original (recriado só se o tamanho mudar)"""
+        if self.cinza is None or self.cinza.shape != forma:
+            self.cinza = np.empty(forma, np.uint8)
+        return self.cinza
+
+
+# Decodificação: imagem colorida completa ou cinza a 1/2 da resolução (IMREAD_REDUCED_GRAYSCALE_2)
+MODOS_DECODIFICACAO = ('full', 'reduced')
+
+def decodificar(dados, color=True):
+    """Decodifica os bytes de uma imagem (JPEG/PNG) sem copiá-los; `color=False` lê em cinza a 1/2 da resolução"""
+    flags = cv2.IMREAD_COLOR if color else cv2.IMREAD_REDUCED_GRAYSCALE_2
+    # frombuffer sobre o memoryview: sem copiar os bytes recebidos
+    return cv2.imdecode(np.frombuffer(memoryview(dados), np.uint8), flags)
+
+
+# Modos de relatório: nenhum, só texto, PNG + texto, 1 a cada N imagens, só falhas
+MODOS_RELATORIO = ('none', 'text', 'png', 'sampled:N', 'on-failure')
+
+
+def interpretar_modo_relatorio(modo):
+    """Converte 'none' | 'text' | 'png' | 'sampled:N' | 'on-failure' em (tipo, N)"""
+    if modo in ('none', 'text', 'png', 'on-failure'):
+        return modo, 1
+    if modo.startswith('sampled:'):
+        try:
+            n = int(modo.split(':', 1)[1])
+        except ValueError:
+            n = 0
+        if n >= 1:
+            return 'sampled', n
+    raise ValueError(f"Modo de relatório inválido: {modo!r} (use um de {', '.join(MODOS_RELATORIO)})")
+
+
+@dataclass
+class ResultadoAnalise:
+    """Resultado em memória de uma análise (características, classificação e tempos)"""
+    image_path: str
+    features: dict = None
+    classification: str = None
+    timings: dict = field(default_factory=dict)       # segundos de parede por etapa
+    cpu_timings: dict = field(default_factory=dict)   # segundos de CPU por etapa (instrumentação ativa)
+    mask: np.ndarray = None
+    erro: str = None
+    segmentation_tier: str = None  # 'morphology' (watershed dispensado) ou 'watershed'
+    etapas: 'EtapasLesao' = field(default=None, repr=False)  # relatório pendente (ver write_report)
+
+    @property
+    def sucesso(self):
+        return self.erro is None and self.features is not None
+
+    def linha_csv(self, nome):
+        """Linha no formato de relatorio_lote.csv (valores com 2 casas, como no relatório em texto)"""
+        f = self.features
+        return [nome, round(f['area'], 2), round(f['perimeter'], 2), round(f['circularity'], 2),
+                round(f['aspect_ratio'], 2), round(f['solidity'], 2), round(f['asymmetry'], 2),
+                round(f['border_irregularity'], 2), round(f['color_variance'], 2), round(f['diameter'], 2),
+                self.classification]
+
+
+class EtapasLesao:
+    """Saídas intermediárias da análise de uma imagem, calculadas só quando alguém as pede
+
+    Cada atributo é avaliado na primeira leitura e guardado: as características
+    só precisam de `entrada` -> `processed` -> `closing` -> `mask`, enquanto
+    `edges` (Canny), `original` colorida e `overlay` só são calculadas se um
+    relatório (ou outro consumidor) as ler. Valores já conhecidos podem ser
+    passados no construtor (ex.: `processed=imagem`). No modo 'tiered',
+    `mask` é a própria `closing` quando ela passa na verificação barata
+    (`segmentation_tier` diz qual nível foi usado).
+    """
+
+    def __init__(self, analyzer, **conhecidas):
+        self.analyzer = analyzer
+        self.erro_watershed = None
+        self.segmentation_tier = None
+        self.__dict__.update(conhecidas)
+
+    @cached_property
+    def entrada(self):
+        """Imagem decodificada conforme `decode_mode` (None se a leitura falhar)"""
+        with self.analyzer._etapa('load_image'):
+            return self.analyzer.load_image()
+
+    @cached_property
+    def original(self):
+        """Cópia colorida em resolução total (só é lida de novo no modo 'reduced')"""
+        if self.entrada is not None and self.entrada.ndim == 3:
+            return self.entrada
+        with self.analyzer._etapa('load_image.color'):
+            return self.analyzer.load_image(color=True)
+
+    @cached_property
+    def processed(self):
+        with self.analyzer._etapa('preprocess_image'):
+            return self.analyzer.preprocess_image(self.entrada)
+
+    @cached_property
+    def closing(self):
+        """Máscara de Otsu após abertura e fechamento"""
+        processed = self.processed
+        with self.analyzer._etapa('segment_lesion.morphology'):
+            return self.analyzer.binarize(processed)
+
+    @cached_property
+    def dist_transform(self):
+        closing = self.closing
+        with self.analyzer._etapa('segment_lesion.distance'):
+            return cv2.distanceTransform(closing, cv2.DIST_L2, 5, dst=self.analyzer._buffer('distancia'))
+
+    @cached_property
+    def bgr(self):
+        """Imagem pré-processada em 3 canais, exigida pelo cv2.watershed"""
+        return cv2.cvtColor(self.processed, cv2.COLOR_GRAY2BGR, dst=self.analyzer._buffer('bgr'))
+
+    @cached_property
+    def medidas_mascara(self):
+        """Medidas da máscara morfológica usadas para decidir se o watershed é necessário"""
+        closing = self.closing
+        with self.analyzer._etapa('segment_lesion.check'):
+            return medir_mascara(closing)
+
+    @cached_property
+    def mask(self):
+        """Máscara final (watershed; em caso de erro, ou se a morfológica já for limpa no modo 'tiered', ela)"""
+        with self.analyzer._etapa('segment_lesion'):
+            closing = self.closing
+            if self.analyzer.segmentation_mode == 'tiered' and mascara_limpa(self.medidas_mascara):
+                self.segmentation_tier = 'morphology'
+                return closing
+            try:
+                dist_transform, bgr = self.dist_transform, self.bgr
+                with self.analyzer._etapa('segment_lesion.watershed'):
+                    mascara = self.analyzer.watershed_mask(closing, dist_transform, bgr)
+                self.segmentation_tier = 'watershed'
+                return mascara
+            except Exception as e:
+                print(f"Erro no watershed: {str(e)}")
+                self.erro_watershed = str(e)
+                self.segmentation_tier = 'morphology'
+                return closing
+
+    @cached_property
+    def edges(self):
+        processed = self.processed
+        with self.analyzer._etapa('segment_lesion.canny'):
+            return self.analyzer.compute_edges(processed)
+
+    @cached_property
+    def overlay(self):
+        return sobreposicao(self.original, self.mask)
+
+    @cached_property
+    def features(self):
+        mask = self.mask
+        with self.analyzer._etapa('extract_features'):
+            return self.analyzer.extract_features(mask, self.entrada)
+
+    def desacoplar(self):
+        """Copia as saídas já calculadas que vivem nos buffers do ContextoPipeline
+
+        Necessário antes de guardar as etapas enquanto o analisador processa
+        outras imagens (ex.: relatório adiado no lote).
+        """
+        if self.analyzer.contexto is None:
+            return self
+        for nome in ('processed', 'closing', 'dist_transform', 'bgr', 'mask', 'edges'):
+            valor = self.__dict__.get(nome)
+            if isinstance(valor, np.ndarray):
+                self.__dict__[nome] = valor.copy()
+        return self
+
 
 class SkinLesionAnalyzer:
-    def __init__(self, image_path, circularity_threshold=0.4, aspect_ratio_threshold=0.5, area_threshold=10000):
-        """Inicializa o analisador com uma imagem específica e parâmetros ajustáveis"""
-        os.makedirs('results', exist_ok=True)
+    def __init__(self, image_path, circularity_threshold=0.4, aspect_ratio_threshold=0.5, area_threshold=10000,
+                 modelo=None, modelo_path=MODELO_PADRAO, registro=None,
+                 output_dir='results', report_name='lesion', report_mode='png', renderer='matplotlib',
+                 decode_mode='full', parametros=None, instrumentacao=None, contexto=None, conteudo=None,
+                 segmentation_mode='watershed'):
+        """Inicializa o analisador com uma imagem específica e parâmetros ajustáveis
+
+        `modelo` aceita um classificador já carregado; sem ele, o modelo é obtido
+        do `registro` (cache por processo) apenas na primeira classificação.
+        Os relatórios são gravados em `output_dir` como `<report_name>_analysis.png`
+        e `<report_name>_report.txt`, conforme `report_mode` (ver MODOS_RELATORIO);
+        `renderer='opencv'` compõe o PNG sem matplotlib. `decode_mode='reduced'`
+        decodifica o JPEG em escala de cinza a 1/2 da resolução (ver load_image).
+        `parametros` sobrescreve valores de PARAMETROS_PIPELINE. `instrumentacao`
+        (instrumentacao.Instrumentacao) recebe os tempos de cada etapa.
+        `contexto` (ContextoPipeline com os mesmos parâmetros) reaproveita o
+        CLAHE, os kernels e os buffers entre imagens. `conteudo` é a imagem já
+        em memória: bytes do arquivo (JPEG/PNG; bytes, memoryview ou array
+        uint8 1-D), decodificados sem gravar nada, ou um array já decodificado
+        (BGR ou cinza), usado como está. Com ele, `image_path` serve só de nome.
+        `segmentation_mode='tiered'` só roda o watershed quando a máscara
+        morfológica não passa em CRITERIOS_MASCARA_LIMPA.
+        """
+        if decode_mode not in MODOS_DECODIFICACAO:
+            raise ValueError(f"Modo de decodificação inválido: {decode_mode!r} "
+                             f"(use um de {', '.join(MODOS_DECODIFICACAO)})")
+        if renderer not in RENDERIZADORES:
+            raise ValueError(f"Renderizador inválido: {renderer!r} (use um de {', '.join(RENDERIZADORES)})")
+        if segmentation_mode not in MODOS_SEGMENTACAO:
+            raise ValueError(f"Modo de segmentação inválido: {segmentation_mode!r} "
+                             f"(use um de {', '.join(MODOS_SEGMENTACAO)})")
         self.image_path = image_path
-        self.modelo_path = r"C:\Users\DettCloud2\Downloads\tcc\modelo_random_forest.pkl"
-        self.modelo = joblib.load(self.modelo_path)
+        self.conteudo = conteudo
+        self.output_dir = output_dir
+        self.report_name = report_name
+        self.report_mode = interpretar_modo_relatorio(report_mode)
+        self.renderer = renderer
+        self.decode_mode = decode_mode
+        self.segmentation_mode = segmentation_mode
+        self.parametros = dict(PARAMETROS_PIPELINE, **(parametros or {}))
+        if contexto is not None and contexto.parametros != self.parametros:
+            raise ValueError("O ContextoPipeline foi criado com parâmetros diferentes dos do analisador")
+        self.contexto = contexto
+        self.instrumentacao = instrumentacao if instrumentacao is not None else DESATIVADA
+        self._tempos = self._tempos_cpu = None
+        self.modelo_path = modelo_path
+        self.registro = registro if registro is not None else REGISTRO
+        self._modelo = modelo
 
-        
         # Parâmetros de classificação
         self.circularity_threshold = circularity_threshold
         self.aspect_ratio_threshold = aspect_ratio_threshold
         self.area_threshold = area_threshold
 
-    def load_image(self):
-        """Carrega a imagem local"""
+    @property
+    def modelo(self):
+        """Modelo carregado sob demanda (uma vez por processo via registro)"""
+        if self._modelo is None:
+            self._modelo = self.registro.obter(self.modelo_path)
+        return self._modelo
+
+    def _etapa(self, nome):
+        """Cronometra uma etapa da análise em andamento (ver instrumentacao.py)"""
+        return self.instrumentacao.etapa(nome, self._tempos, self._tempos_cpu)
+
+    def _buffer(self, nome):
+        """Buffer de trabalho do contexto (None faz o OpenCV alocar a saída)"""
+        return None if self.contexto is None else self.contexto.buffers[nome]
+
+    def _kernel(self):
+        if self.contexto is not None:
+            return self.contexto.kernel
+        p = self.parametros
+        return np.ones((p['morfologia_kernel'], p['morfologia_kernel']), np.uint8)
+
+    def pipeline_fingerprint(self):
+        """Impressão digital (sha1) dos parâmetros que determinam as características"""
+        return impressao_pipeline(self.parametros, self.decode_mode, self.segmentation_mode)
+
+    def load_image(self, color=None):
+        """Carrega a imagem local (ou decodifica `conteudo`, se houver)
+
+        No modo 'reduced' (e sem `color=True`) a imagem é decodificada direto em
+        escala de cinza pela metade da resolução (redução no domínio DCT do JPEG),
+        já que o pré-processamento descarta a cor e reduz para 256x256.
+        """
+        if color is None:
+            color = self.decode_mode == 'full'
         try:
-            image = cv2.imread(self.image_path)
+            if isinstance(self.conteudo, np.ndarray) and self.conteudo.ndim > 1:
+                image = self.conteudo  # já decodificada
+            elif self.conteudo is not None:
+                image = decodificar(self.conteudo, color)
+            else:
+                image = cv2.imread(self.image_path, cv2.IMREAD_COLOR if color else cv2.IMREAD_REDUCED_GRAYSCALE_2)
             if image is None:
                 raise ValueError(f"Não foi possível carregar a imagem em {self.image_path}")
             return image
@@ -34,157 +491,156 @@ class SkinLesionAnalyzer:
 
     def preprocess_image(self, image):
         """Pré-processamento da imagem"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        resized = cv2.resize(gray, (256, 256))
+        p = self.parametros
+        if image.ndim == 2:
+            gray = image
+        else:
+            destino = None if self.contexto is None else self.contexto.buffer_cinza(image.shape[:2])
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=destino)
+        resized = cv2.resize(gray, (p['tamanho'], p['tamanho']), dst=self._buffer('resized'))
 
         # Remoção de ruído local (pontual)
-        denoised = cv2.medianBlur(resized, 5)
+        denoised = cv2.medianBlur(resized, p['mediana_kernel'], dst=self._buffer('denoised'))
 
         # Equalização de histograma
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        equalized = clahe.apply(denoised)
+        if self.contexto is not None:
+            clahe = self.contexto.clahe
+        else:
+            clahe = cv2.createCLAHE(clipLimit=p['clahe_clip'], tileGridSize=(p['clahe_grade'], p['clahe_grade']))
+        equalized = clahe.apply(denoised, dst=self._buffer('equalized'))
 
         # Suavização global (bordas e fundo)
-        smoothed = cv2.GaussianBlur(equalized, (5, 5), 0)
+        smoothed = cv2.GaussianBlur(equalized, (p['gauss_kernel'], p['gauss_kernel']), 0,
+                                    dst=self._buffer('smoothed'))
 
         return smoothed
 
-    def segment_lesion(self, image):
-        """Segmenta a lesão usando binarização, morfologia e watershed"""
-        _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    def binarize(self, image):
+        """Otsu + abertura/fechamento: máscara inicial da lesão"""
+        p = self.parametros
+        _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU,
+                                  dst=self._buffer('binary'))
 
-        kernel = np.ones((3, 3), np.uint8)
+        kernel = self._kernel()
 
         # Abertura para remover ruídos
-        opening = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=2)
+        opening = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, dst=self._buffer('opening'),
+                                   iterations=p['abertura_iteracoes'])
 
         # Fechamento para preencher buracos
-        closing = cv2.morphologyEx(opening, cv2.MORPH_CLOSE, kernel, iterations=2)
-
-        # Bordas para visualização (não influencia na segmentação final)
-        edges = cv2.Canny(image, 100, 200)
-
-        try:
-            dist_transform = cv2.distanceTransform(closing, cv2.DIST_L2, 5)
-            _, sure_fg = cv2.threshold(dist_transform, 0.7 * dist_transform.max(), 255, 0)
-            sure_fg = np.uint8(sure_fg)
-
-            sure_bg = cv2.dilate(closing, kernel, iterations=3)
-            unknown = cv2.subtract(sure_bg, sure_fg)
-
-            _, markers = cv2.connectedComponents(sure_fg)
-            markers += 1
-            markers[unknown == 255] = 0
-
-            markers = cv2.watershed(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), markers)
-            mask = np.zeros_like(image, dtype=np.uint8)
-            mask[markers > 1] = 255
-
-            return mask, edges
-        except Exception as e:
-            print(f"Erro no watershed: {str(e)}")
-            return closing, edges
-
-    def extract_features(self, mask):
-        """Extrai características da lesão segmentada"""
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if not contours:
-            return None
-
-        cnt = max(contours, key=cv2.contourArea)
-
-        area = cv2.contourArea(cnt)
-        perimeter = cv2.arcLength(cnt, True)
-        circularity = (4 * np.pi * area) / (perimeter ** 2) if perimeter > 0 else 0
-
-        _, _, w, h = cv2.boundingRect(cnt)
-        aspect_ratio = float(w) / h if h > 0 else 0
-
-        hull = cv2.convexHull(cnt)
-        hull_area = cv2.contourArea(hull)
-        solidity = float(area) / hull_area if hull_area > 0 else 0
-
-        return {
-            'area': area,
-            'perimeter': perimeter,
-            'circularity': circularity,
-            'aspect_ratio': aspect_ratio,
-            'solidity': solidity
-        }
+        closing = cv2.morphologyEx(opening, cv2.MORPH_CLOSE, kernel, dst=self._buffer('closing'),
+                                   iterations=p['fechamento_iteracoes'])
+        return closing
+
+    def compute_edges(self, image):
+        """Bordas para visualização (não influencia na segmentação final)"""
+        return cv2.Canny(image, 100, 200, edges=self._buffer('edges'))
+
+    def watershed_mask(self, closing, dist_transform, bgr):
+        """Refina a máscara com watershed a partir da transformada de distância"""
+        p = self.parametros
+        kernel = self._kernel()
+
+        _, sure_fg_float = cv2.threshold(dist_transform, p['watershed_fator'] * dist_transform.max(), 255, 0,
+                                         dst=self._buffer('sure_fg_float'))
+        sure_fg = self._buffer('sure_fg')
+        if sure_fg is None:
+            sure_fg = np.uint8(sure_fg_float)
+        else:
+            np.copyto(sure_fg, sure_fg_float, casting='unsafe')
+
+        sure_bg = cv2.dilate(closing, kernel, dst=self._buffer('sure_bg'), iterations=p['dilatacao_iteracoes'])
+        unknown = cv2.subtract(sure_bg, sure_fg, dst=self._buffer('unknown'))
+
+        _, markers = cv2.connectedComponents(sure_fg, labels=self._buffer('markers'))
+        markers += 1
+        np.putmask(markers, np.equal(unknown, 255, out=self._buffer('selecao')), 0)
+
+        markers = cv2.watershed(bgr, markers)
+        # 255 onde o rótulo é de uma região (> 1); fundo e fronteiras (-1) ficam 0
+        return cv2.compare(markers, 1, cv2.CMP_GT, dst=self._buffer('mask'))
+
+    def segment_lesion(self, image, compute_edges=True):
+        """Segmenta a lesão usando binarização, morfologia e watershed
+
+        Retorna (máscara, bordas); as bordas (Canny) só são calculadas com
+        `compute_edges=True`, senão vêm como None. No modo 'tiered' o
+        watershed só roda para máscaras ambíguas.
+        """
+        etapas = EtapasLesao(self, processed=image)
+        return etapas.mask, (etapas.edges if compute_edges else None)
+
+    def extract_features(self, mask, image=None):
+        """Extrai características da lesão segmentada
+
+        Além das cinco usadas pelo modelo, calcula os descritores ABCD
+        (extrator_features.CAMPOS_ABCD); `image` (a imagem carregada) é usada na
+        variância de cor, que só existe com a imagem em BGR (modo 'full'): em
+        cinza (modo 'reduced') ou sem imagem ela fica NaN.
+        """
+        saida = None if self.contexto is None else self.contexto.features
+        linha = extrair_lote([mask], None if image is None else [image], saida=saida)[0]
+        return como_dicionario(linha)
 
     def classify_lesion(self, features):
         """Classifica usando o modelo treinado, com nomes consistentes"""
-        entrada = pd.DataFrame([{
-            'area': features['area'],
-            'perimetro': features['perimeter'],
-            'circularidade': features['circularity'],
-            'aspect_ratio': features['aspect_ratio'],
-            'solidez': features['solidity'],
-        }])
-        return self.modelo.predict(entrada)[0]
-
-
-    def generate_report(self, original, processed, mask, edges, features, classification):
-        """Gera relatório visual e textual"""
-        plt.figure(figsize=(15, 10))
-
-        # Imagem original
-        plt.subplot(2, 3, 1)
-        plt.imshow(cv2.cvtColor(original, cv2.COLOR_BGR2RGB))
-        plt.title('Original')
-        plt.axis('off')
-
-        # Pré-processada
-        plt.subplot(2, 3, 2)
-        plt.imshow(processed, cmap='gray')
-        plt.title('Pré-processada')
-        plt.axis('off')
-
-        # Máscara segmentada
-        plt.subplot(2, 3, 3)
-        plt.imshow(mask, cmap='gray')
-        plt.title('Segmentação')
-        plt.axis('off')
-
-        # Bordas
-        plt.subplot(2, 3, 4)
-        plt.imshow(edges, cmap='gray')
-        plt.title('Bordas (Canny)')
-        plt.axis('off')
-
-        # Sobreposição
-        plt.subplot(2, 3, 5)
-        overlay = cv2.addWeighted(
-            cv2.cvtColor(cv2.resize(original, (256, 256)), cv2.COLOR_BGR2RGB), 0.7,
-            cv2.cvtColor(mask, cv2.COLOR_GRAY2RGB), 0.3, 0
-        )
-        plt.imshow(overlay)
-        plt.title('Sobreposição')
-        plt.axis('off')
-
-        # Texto das características
-        plt.subplot(2, 3, 6)
-        plt.text(0.1, 0.5,
-                 f"Área: {features['area']:.2f}\n"
-                 f"Perímetro: {features['perimeter']:.2f}\n"
-                 f"Circularidade: {features['circularity']:.2f}\n"
-                 f"Aspect Ratio: {features['aspect_ratio']:.2f}\n"
-                 f"Solidez: {features['solidity']:.2f}\n\n"
-                 f"Classificação:\n{classification}",
-                 fontsize=10)
-        plt.axis('off')
-
-        plt.suptitle("Análise da Lesão Cutânea", fontsize=16)
-        plt.savefig("results/lesion_analysis.png", bbox_inches='tight')
-        plt.close()
+        return classificar_lote(self.modelo, [features])[0]
+
+    def classify_batch(self, features_list, return_proba=False):
+        """Classifica várias lesões com uma única chamada ao modelo"""
+        return classificar_lote(self.modelo, features_list, return_proba=return_proba)
+
+
+    def report_outputs(self, sucesso=True):
+        """Saídas (png, texto) que o modo de relatório pede para esta imagem"""
+        tipo, n = self.report_mode
+        if tipo == 'on-failure':
+            return (not sucesso, not sucesso)
+        if not sucesso or tipo == 'none':
+            return (False, False)
+        if tipo == 'text':
+            return (False, True)
+        if tipo == 'sampled':
+            # Amostragem determinística pelo nome: independe da ordem e do worker
+            sorteada = zlib.crc32(self.report_name.encode('utf-8')) % n == 0
+            return (sorteada, sorteada)
+        return (True, True)
+
+    def generate_report(self, original, processed, mask, edges, features, classification, png=True, text=True,
+                        erro=None, segmentation_tier=None):
+        """Gera relatório visual e textual (features=None gera o relatório de falha)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if features is not None:
+            resumo = (f"Área: {features['area']:.2f}\n"
+                      f"Perímetro: {features['perimeter']:.2f}\n"
+                      f"Circularidade: {features['circularity']:.2f}\n"
+                      f"Aspect Ratio: {features['aspect_ratio']:.2f}\n"
+                      f"Solidez: {features['solidity']:.2f}\n\n"
+                      f"Classificação:\n{classification}")
+        else:
+            resumo = f"Falha na análise:\n{erro}"
+
+        if png:
+            caminho_png = os.path.join(self.output_dir, f"{self.report_name}_analysis.png")
+            renderizar = renderizar_opencv if self.renderer == 'opencv' else renderizar_matplotlib
+            renderizar(caminho_png, original, processed, mask, edges, resumo)
+
+        if not text:
+            return
 
         # Relatório em texto
-        with open("results/lesion_report.txt", 'w', encoding='utf-8') as f:
+        with open(os.path.join(self.output_dir, f"{self.report_name}_report.txt"), 'w', encoding='utf-8') as f:
             f.write("RELATÓRIO DE ANÁLISE DE LESÃO CUTÂNEA\n")
             f.write("=" * 50 + "\n")
+            if features is None:
+                f.write(f"IMAGEM: {self.image_path}\n")
+                f.write(f"FALHA: {erro}\n")
+                return
             f.write("CARACTERÍSTICAS:\n")
             for k, v in features.items():
                 f.write(f"- {k}: {v:.2f}\n")
+            if segmentation_tier is not None:
+                f.write(f"- segmentação: {segmentation_tier}\n")
             f.write(f"\nCLASSIFICAÇÃO: {classification}\n")
             f.write("\nOBSERVAÇÕES:\n")
             f.write("Recomenda-se avaliação dermatológica.\n" if classification == "SUSPEITA"
@@ -194,22 +650,82 @@ class SkinLesionAnalyzer:
             f.write(f"- Aspect Ratio > {self.aspect_ratio_threshold}\n")
             f.write(f"- Área > {self.area_threshold}\n")
 
-    def analyze(self):
-        """Executa o pipeline completo de análise"""
-        print("\nIniciando análise da imagem...")
-
-        original = self.load_image()
-        if original is None:
-            return
-
-        processed = self.preprocess_image(original)
-        mask, edges = self.segment_lesion(processed)
-        features = self.extract_features(mask)
+    def _report_from_stages(self, etapas, features, classification, png, text, erro=None):
+        """Gera o relatório lendo das etapas só o que cada saída usa (o PNG puxa bordas e cor)"""
+        if png:
+            self.generate_report(etapas.original, etapas.processed, etapas.mask, etapas.edges, features,
+                                 classification, png=True, text=text, erro=erro,
+                                 segmentation_tier=etapas.segmentation_tier)
+        elif text:
+            self.generate_report(None, None, None, None, features, classification, png=False, text=True,
+                                 erro=erro, segmentation_tier=etapas.segmentation_tier)
+
+    def write_report(self, resultado):
+        """Grava o relatório pendente de um resultado classificado depois (ex.: em lote)"""
+        png, text = self.report_outputs(resultado.sucesso)
+        with self.instrumentacao.etapa('generate_report', resultado.timings, resultado.cpu_timings):
+            self._report_from_stages(resultado.etapas, resultado.features, resultado.classification, png, text)
+        resultado.etapas = None
+
+    def analyze(self, save_report=True, keep_mask=False, verbose=True, classify=True, entrada=None):
+        """Executa o pipeline completo de análise e devolve um ResultadoAnalise
+
+        Os relatórios seguem `report_mode`; com `save_report=False` nada é gravado
+        em disco e as características e a classificação voltam apenas no objeto
+        retornado. `keep_mask=True` anexa a máscara segmentada ao resultado. As
+        etapas intermediárias (EtapasLesao) só são calculadas se algo as consome:
+        sem relatório em PNG não há Canny nem releitura colorida. Com
+        `classify=False` a classificação fica para o chamador (ex.:
+        `classify_batch` por bloco) e, se houver relatório, as etapas ficam em
+        `resultado.etapas` para `write_report`. `entrada` é a imagem já
+        decodificada conforme `decode_mode` (ex.: pela thread leitora do lote
+        em esteira); sem ela, a imagem é carregada aqui.
+        """
+        if verbose:
+            print("\nIniciando análise da imagem...")
+        resultado = ResultadoAnalise(image_path=self.image_path)
+        self._tempos, self._tempos_cpu = resultado.timings, resultado.cpu_timings
+        etapas = EtapasLesao(self) if entrada is None else EtapasLesao(self, entrada=entrada)
+
+        if etapas.entrada is None:
+            resultado.erro = "Falha ao carregar a imagem"
+            # Sem imagem não há PNG: o relatório de falha sai só em texto
+            png, text = self.report_outputs(sucesso=False) if save_report else (False, False)
+            if png or text:
+                with self._etapa('generate_report'):
+                    self._report_from_stages(etapas, None, None, False, True, erro=resultado.erro)
+            return resultado
+
+        features = etapas.features
+        resultado.segmentation_tier = etapas.segmentation_tier
+        if keep_mask:
+            resultado.mask = etapas.mask if self.contexto is None else etapas.mask.copy()
 
         if not features:
-            print("Falha na extração de características")
-            return
-
-        classification = self.classify_lesion(features)
-        self.generate_report(original, processed, mask, edges, features, classification)
-        print("Análise concluída! Verifique a pasta 'results'.")
+            if verbose:
+                print("Falha na extração de características")
+            resultado.erro = "Falha na extração de características"
+            png, text = self.report_outputs(sucesso=False) if save_report else (False, False)
+            if png or text:
+                with self._etapa('generate_report'):
+                    self._report_from_stages(etapas, None, None, png, text, erro=resultado.erro)
+            return resultado
+        resultado.features = features
+
+        png, text = self.report_outputs(sucesso=True) if save_report else (False, False)
+        if not classify:
+            if png or text:
+                resultado.etapas = etapas.desacoplar()
+            return resultado
+
+        with self._etapa('classify_lesion'):
+            resultado.classification = self.classify_lesion(features)
+
+        if png or text:
+            with self._etapa('generate_report'):
+                self._report_from_stages(etapas, features, resultado.classification, png, text)
+            if verbose:
+                print(f"Análise concluída! Verifique a pasta '{self.output_dir}'.")
+        elif verbose:
+            print("Análise concluída!")
+        return resultado
@@ -1,6 +1,10 @@
+import os
 from lesion_analyzer import SkinLesionAnalyzer
+from registro_modelos import MODELO_PADRAO, MODELO_NATIVO_PADRAO
 
 if __name__ == "__main__":
     image_path = r"samples/lpele5.jpg" 
-    analyzer = SkinLesionAnalyzer(image_path)
+    # A floresta exportada (.npz) carrega sem sklearn e classifica uma imagem bem mais rápido
+    modelo_path = MODELO_NATIVO_PADRAO if os.path.exists(MODELO_NATIVO_PADRAO) else MODELO_PADRAO
+    analyzer = SkinLesionAnalyzer(image_path, modelo_path=modelo_path)
     analyzer.analyze()
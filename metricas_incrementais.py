@@ -0,0 +1,287 @@
+"""Métricas do classificador acumuladas linha a linha, por dx, localização e faixa etária
+
+    py analisar_lote.py --metadata ham10000/metadata/HAM10000_metadata.csv --metricas-ao-vivo results_lote/metricas.json
+    py metricas_incrementais.py results_lote/metricas.json
+    py metricas_incrementais.py results_lote/metricas_shard_*.json --saida metricas.json
+    py metricas_incrementais.py --resultados results_lote/relatorio_lote.csv --metadata HAM10000_metadata.csv
+
+Guarda só matrizes de confusão 2x2 (real x predito, SUSPEITA primeiro): uma
+geral e uma por valor de cada grupo. Atualizar custa algumas somas por
+linha, duas contagens de shards/workers se juntam somando as matrizes, e o
+snapshot JSON tem poucos KB. Acurácia, precisão, recall e F1 saem das
+contagens a qualquer momento, sem reler o CSV.
+"""
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from dados import MAPA_DIAGNOSTICO, ROTULOS
+
+CLASSES = tuple(ROTULOS.categories)  # SUSPEITA é a classe positiva
+GRUPOS = ("dx", "localization", "faixa_etaria")
+# Limites das faixas etárias: 0-19, 20-39, 40-59, 60-79, 80+
+LIMITES_IDADE = (20, 40, 60, 80)
+VERSAO_SNAPSHOT = 1
+
+
+def faixa_etaria(idade):
+    """Faixa de 20 anos da idade ('desconhecida' se faltar)"""
+    try:
+        idade = float(idade)
+    except (TypeError, ValueError):
+        return "desconhecida"
+    if math.isnan(idade):
+        return "desconhecida"
+    inicio = 0
+    for limite in LIMITES_IDADE:
+        if idade < limite:
+            return f"{inicio}-{limite - 1}"
+        inicio = limite
+    return f"{inicio}+"
+
+
+def calcular(matriz):
+    """Acurácia, precisão, recall e F1 (SUSPEITA positiva) de uma matriz 2x2; 0 quando indefinidas, como no sklearn"""
+    (vp, fn), (fp, vn) = np.asarray(matriz).tolist()
+    total = vp + fn + fp + vn
+    precisao = vp / (vp + fp) if vp + fp else 0.0
+    recall = vp / (vp + fn) if vp + fn else 0.0
+    return {
+        "n": total,
+        "acuracia": (vp + vn) / total if total else 0.0,
+        "precisao": precisao,
+        "recall": recall,
+        "f1": 2 * precisao * recall / (precisao + recall) if precisao + recall else 0.0,
+    }
+
+
+class MetricasIncrementais:
+    """Matrizes de confusão acumuladas: geral e por valor de cada grupo (dx, localização, faixa etária)
+
+    `atualizar` soma uma linha; `juntar` soma outra instância (de outro shard
+    ou worker); `para_dict`/`gravar` produzem o snapshot JSON e
+    `de_dict`/`carregar` o leem de volta.
+    """
+
+    def __init__(self):
+        self.geral = np.zeros((2, 2), np.int64)
+        self.grupos = {grupo: {} for grupo in GRUPOS}
+        self.ignoradas = 0  # linhas sem rótulo real ou com classe desconhecida
+
+    def atualizar(self, real, predito, dx=None, localization=None, faixa_etaria=None):
+        """Soma uma linha (rótulos de CLASSES); devolve False se ela for ignorada"""
+        if real not in CLASSES or predito not in CLASSES:
+            self.ignoradas += 1
+            return False
+        celula = (CLASSES.index(real), CLASSES.index(predito))
+        self.geral[celula] += 1
+        for grupo, valor in zip(GRUPOS, (dx, localization, faixa_etaria)):
+            if valor is not None:
+                matriz = self.grupos[grupo].get(valor)
+                if matriz is None:
+                    matriz = self.grupos[grupo][valor] = np.zeros((2, 2), np.int64)
+                matriz[celula] += 1
+        return True
+
+    def juntar(self, outra):
+        """Soma as contagens de `outra` nesta instância (a ordem das junções não muda o resultado)"""
+        self.geral += outra.geral
+        for grupo, valores in outra.grupos.items():
+            for valor, matriz in valores.items():
+                atual = self.grupos.setdefault(grupo, {}).get(valor)
+                self.grupos[grupo][valor] = matriz.copy() if atual is None else atual + matriz
+        self.ignoradas += outra.ignoradas
+        return self
+
+    @property
+    def linhas(self):
+        return int(self.geral.sum())
+
+    def metricas(self, grupo=None, valor=None):
+        """Métricas gerais, ou de um valor de um grupo (ex.: grupo='dx', valor='mel')"""
+        return calcular(self.geral if grupo is None else self.grupos[grupo][valor])
+
+    def para_dict(self):
+        """Snapshot serializável: contagens (para juntar depois) e as métricas já calculadas"""
+        return {
+            "versao": VERSAO_SNAPSHOT,
+            "classes": list(CLASSES),
+            "linhas": self.linhas,
+            "ignoradas": self.ignoradas,
+            "geral": {"matriz": self.geral.tolist(), **calcular(self.geral)},
+            "grupos": {grupo: {valor: {"matriz": matriz.tolist(), **calcular(matriz)}
+                               for valor, matriz in sorted(valores.items())}
+                       for grupo, valores in self.grupos.items()},
+        }
+
+    @classmethod
+    def de_dict(cls, dados):
+        if dados.get("versao") != VERSAO_SNAPSHOT or tuple(dados.get("classes", ())) != CLASSES:
+            raise ValueError(f"Snapshot de métricas incompatível (versão {VERSAO_SNAPSHOT}, classes {CLASSES})")
+        metricas = cls()
+        metricas.geral = np.array(dados["geral"]["matriz"], np.int64)
+        for grupo, valores in dados["grupos"].items():
+            metricas.grupos[grupo] = {valor: np.array(m["matriz"], np.int64) for valor, m in valores.items()}
+        metricas.ignoradas = dados["ignoradas"]
+        return metricas
+
+    def gravar(self, caminho):
+        """Grava o snapshot JSON (troca atômica: quem lê nunca vê um arquivo pela metade)"""
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.para_dict(), f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        return caminho
+
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, encoding="utf-8") as f:
+            return cls.de_dict(json.load(f))
+
+    @classmethod
+    def de_tabela(cls, df):
+        """Acumula uma tabela já juntada (colunas diagnostico_real, classificacao e, se houver, dx/localization/age)"""
+        metricas = cls()
+        colunas = [df[c] if c in df else [None] * len(df) for c in ("dx", "localization")]
+        idades = map(faixa_etaria, df["age"]) if "age" in df else [None] * len(df)
+        for real, predito, dx, local, faixa in zip(df["diagnostico_real"], df["classificacao"], *colunas, idades):
+            metricas.atualizar(real, predito, _texto(dx), _texto(local), faixa)
+        return metricas
+
+
+def _texto(valor):
+    return None if valor is None or (isinstance(valor, float) and math.isnan(valor)) else str(valor)
+
+
+class MetricasAoVivo:
+    """Acompanha as métricas durante o lote: cruza cada linha com o metadata e grava snapshots
+
+    `registrar(imagem, classificacao)` é chamado pelo run_batch a cada linha
+    do CSV. A cada `intervalo` linhas com rótulo o snapshot é regravado em
+    `caminho`. Com `minimos` (ex.: {"recall": 0.8}), `motivo_parada()` indica
+    quando, depois de `apos` linhas com rótulo, alguma métrica geral ficou
+    abaixo do mínimo, para o lote parar cedo.
+    """
+
+    def __init__(self, metadata, caminho=None, intervalo=100, minimos=None, apos=200):
+        # image_id -> (dx, localização, faixa etária), só com o necessário por imagem
+        self.rotulos = {image_id: (_texto(dx), _texto(local), faixa_etaria(idade))
+                        for image_id, dx, local, idade in zip(metadata.index, metadata["dx"],
+                                                              metadata["localization"], metadata["age"])}
+        self.caminho = caminho
+        self.intervalo = max(1, intervalo)
+        self.minimos = dict(minimos or {})
+        self.apos = apos
+        self.metricas = MetricasIncrementais()
+        self.sem_metadata = 0
+        self._desde_snapshot = 0
+
+    @classmethod
+    def do_csv_metadata(cls, csv_metadata, **opcoes):
+        from dados import carregar_metadata
+        return cls(carregar_metadata(csv_metadata, colunas=("dx", "localization", "age")), **opcoes)
+
+    def registrar(self, imagem, classificacao):
+        """Soma uma linha do CSV; `imagem` é o image_id da coluna imagem (já sem extensão)"""
+        rotulos = self.rotulos.get(imagem)
+        if rotulos is None:
+            self.sem_metadata += 1
+            return
+        dx = rotulos[0]
+        if self.metricas.atualizar(MAPA_DIAGNOSTICO.get(dx), classificacao, *rotulos):
+            self._desde_snapshot += 1
+            if self.caminho and self._desde_snapshot >= self.intervalo:
+                self.gravar()
+
+    def acumular_csv(self, caminho):
+        """Soma as linhas de um relatorio_lote.csv já existente (ex.: ao retomar um lote)"""
+        with open(caminho, newline="", encoding="utf-8") as f:
+            leitor = csv.reader(f)
+            cabecalho = next(leitor, None)
+            if not cabecalho:
+                return
+            coluna = cabecalho.index("classificacao")
+            for linha in leitor:
+                if linha:
+                    self.registrar(linha[0], linha[coluna])
+
+    def gravar(self):
+        self._desde_snapshot = 0
+        if self.caminho:
+            self.metricas.gravar(self.caminho)
+        return self.caminho
+
+    def motivo_parada(self):
+        """Descrição da métrica abaixo do mínimo (ou None enquanto o lote deve seguir)"""
+        if not self.minimos or self.metricas.linhas < self.apos:
+            return None
+        atuais = self.metricas.metricas()
+        for nome, minimo in self.minimos.items():
+            if atuais[nome] < minimo:
+                return f"{nome} {atuais[nome] * 100:.1f}% < {minimo * 100:.1f}% após {self.metricas.linhas} imagens"
+        return None
+
+
+def interpretar_minimo(valor):
+    """'metrica=valor' (ex.: recall=0.8) -> (metrica, valor)"""
+    nome, _, numero = valor.partition("=")
+    if nome not in ("acuracia", "precisao", "recall", "f1"):
+        raise ValueError(f"Métrica desconhecida: {nome!r} (use acuracia, precisao, recall ou f1)")
+    try:
+        return nome, float(numero)
+    except ValueError:
+        raise ValueError(f"Valor inválido em {valor!r} (ex.: recall=0.8)")
+
+
+def imprimir(metricas, grupos=GRUPOS):
+    geral = metricas.metricas()
+    print(f"📊 {metricas.linhas} imagens com rótulo ({metricas.ignoradas} ignoradas)")
+    print(f"Acurácia: {geral['acuracia'] * 100:.2f}% | Precisão (SUSPEITA): {geral['precisao'] * 100:.2f}% | "
+          f"Recall (SUSPEITA): {geral['recall'] * 100:.2f}% | F1: {geral['f1'] * 100:.2f}%")
+    for grupo in grupos:
+        if not metricas.grupos.get(grupo):
+            continue
+        print(f"\n{grupo:<16} {'n':>6} {'acurácia':>9} {'precisão':>9} {'recall':>9} {'f1':>9}")
+        for valor in sorted(metricas.grupos[grupo]):
+            m = metricas.metricas(grupo, valor)
+            print(f"{valor:<16} {m['n']:>6} {m['acuracia'] * 100:>8.1f}% {m['precisao'] * 100:>8.1f}% "
+                  f"{m['recall'] * 100:>8.1f}% {m['f1'] * 100:>8.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Junta e mostra snapshots de métricas incrementais")
+    parser.add_argument("snapshots", nargs="*", help="snapshots JSON (de shards ou workers; aceita *)")
+    parser.add_argument("--resultados", help="relatorio_lote.csv para acumular (exige --metadata)")
+    parser.add_argument("--metadata", help="HAM10000_metadata.csv")
+    parser.add_argument("--saida", help="grava o snapshot juntado neste JSON")
+    args = parser.parse_args(argv)
+    if not args.snapshots and not args.resultados:
+        parser.error("informe snapshots JSON e/ou --resultados")
+    if args.resultados and not args.metadata:
+        parser.error("--resultados exige --metadata")
+
+    metricas = MetricasIncrementais()
+    for padrao in args.snapshots:
+        for caminho in sorted(glob.glob(padrao)) or [padrao]:
+            metricas.juntar(MetricasIncrementais.carregar(caminho))
+    if args.resultados:
+        ao_vivo = MetricasAoVivo.do_csv_metadata(args.metadata)
+        ao_vivo.acumular_csv(args.resultados)
+        metricas.juntar(ao_vivo.metricas)
+        if ao_vivo.sem_metadata:
+            print(f"⚠️ {ao_vivo.sem_metadata} imagens sem linha no metadata")
+
+    imprimir(metricas)
+    if args.saida:
+        print(f"\n✅ Snapshot salvo em: {metricas.gravar(args.saida)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,36 @@
-import pandas as pd
+"""Monta a base de treinamento: resultados do lote + metadata da HAM10000 + rótulo binário
 
-# === 1. Caminhos dos arquivos ===
+    py preparar_dados.py --resultados results_lote/relatorio_lote.csv --saida base_treinamento.parquet
+"""
+import argparse
+import sys
+
+from dados import base_juntada, salvar_tabela
+
+# === Caminhos padrão ===
 csv_resultados = r"C:\Users\DettCloud2\Downloads\tcc\results_lote_2506\relatorio_lote.csv"
 csv_metadata = r"C:\Users\DettCloud2\Downloads\tcc\ham10000\metadata\HAM10000_metadata.csv"
+caminho_saida = r"C:\Users\DettCloud2\Downloads\tcc\base_treinamento.parquet"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Junta o relatório do lote com o metadata da HAM10000")
+    parser.add_argument("--resultados", default=csv_resultados, help="relatorio_lote.csv gerado pelo analisar_lote.py")
+    parser.add_argument("--metadata", default=csv_metadata, help="HAM10000_metadata.csv")
+    parser.add_argument("--saida", default=caminho_saida,
+                        help="base juntada (.parquet, .feather, .pkl ou .csv; sem pyarrow vira .pkl)")
+    args = parser.parse_args(argv)
+
+    print("🔄 Lendo arquivos...")
+    df = base_juntada(args.resultados, args.metadata)
+
+    print("✅ Exemplo de dados preparados:")
+    print(df.head())
+
+    caminho = salvar_tabela(df, args.saida)
+    print(f"✅ Arquivo final salvo em: {caminho} ({len(df)} imagens)")
+    return 0
+
 
-# === 2. Carregar os CSVs ===
-print("🔄 Lendo arquivos...")
-resultados = pd.read_csv(csv_resultados)
-metadata = pd.read_csv(csv_metadata)
-
-# === 3. Limpar nomes de imagem para bater com metadata ===
-resultados["imagem"] = resultados["imagem"].str.replace(".jpg", "", regex=False)
-
-# === 4. Mapear dx → rotulo binário ===
-mapa_diagnostico = {
-    "akiec": "SUSPEITA",
-    "bcc": "SUSPEITA",
-    "mel": "SUSPEITA",
-    "bkl": "PROVAVELMENTE BENIGNA",
-    "df": "PROVAVELMENTE BENIGNA",
-    "nv": "PROVAVELMENTE BENIGNA",
-    "vasc": "PROVAVELMENTE BENIGNA"
-}
-metadata["diagnostico_real"] = metadata["dx"].map(mapa_diagnostico)
-
-# === 5. Juntar os dois datasets ===
-df_merged = pd.merge(resultados, metadata[["image_id", "diagnostico_real"]],
-                     left_on="imagem", right_on="image_id")
-
-# === 6. Verificar as primeiras linhas ===
-print("✅ Exemplo de dados preparados:")
-print(df_merged.head())
-
-# === 7. Salvar CSV preparado ===
-caminho_saida = r"C:\Users\DettCloud2\Downloads\tcc\base_treinamento.csv"
-df_merged.to_csv(caminho_saida, index=False)
-print(f"✅ Arquivo final salvo em: {caminho_saida}")
+if __name__ == "__main__":
+    sys.exit(main())
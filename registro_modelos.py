@@ -0,0 +1,59 @@
+import os
+import threading
+
+# Caminho padrão do modelo treinado (gerado por treinar_modelo.py)
+MODELO_PADRAO = r"C:\Users\DettCloud2\Downloads\tcc\modelo_random_forest.pkl"
+
+# Mesma floresta exportada em arrays NumPy (floresta_nativa.py): carrega sem sklearn
+MODELO_NATIVO_PADRAO = os.path.splitext(MODELO_PADRAO)[0] + ".npz"
+
+
+def ler_modelo(caminho, mmap_mode=None):
+    """Desserializa um modelo: .npz vira FlorestaNativa (sem sklearn), o resto passa pelo joblib"""
+    if caminho.lower().endswith(".npz"):
+        from floresta_nativa import carregar_floresta
+        return carregar_floresta(caminho)
+    import joblib
+    return joblib.load(caminho, mmap_mode=mmap_mode)
+
+
+class RegistroModelos:
+    """Cache de modelos por processo: cada arquivo é desserializado uma única vez"""
+
+    def __init__(self, mmap_mode="r"):
+        # mmap_mode='r' mapeia os arrays numpy da floresta direto do arquivo,
+        # então processos filhos compartilham as mesmas páginas de memória
+        self.mmap_mode = mmap_mode
+        self._modelos = {}
+        self._lock = threading.Lock()
+
+    def obter(self, caminho=MODELO_PADRAO):
+        """Retorna o modelo do caminho, carregando-o apenas na primeira chamada"""
+        chave = os.path.abspath(caminho)
+        modelo = self._modelos.get(chave)
+        if modelo is None:
+            with self._lock:
+                modelo = self._modelos.get(chave)
+                if modelo is None:
+                    modelo = ler_modelo(caminho, self.mmap_mode)
+                    self._modelos[chave] = modelo
+        return modelo
+
+    def registrar(self, caminho, modelo):
+        """Registra um modelo já carregado (ex.: recém-treinado) sob um caminho"""
+        with self._lock:
+            self._modelos[os.path.abspath(caminho)] = modelo
+
+    def limpar(self):
+        """Descarta todos os modelos em cache"""
+        with self._lock:
+            self._modelos.clear()
+
+
+# Registro compartilhado por todos os analisadores do processo
+REGISTRO = RegistroModelos()
+
+
+def carregar_modelo(caminho=MODELO_PADRAO):
+    """Atalho para obter um modelo do registro padrão"""
+    return REGISTRO.obter(caminho)
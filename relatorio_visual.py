@@ -0,0 +1,82 @@
+import unicodedata
+import cv2
+import numpy as np
+
+# Ordem e títulos dos painéis do relatório visual (grade 2x3, último painel = texto)
+TITULOS_PAINEIS = ['Original', 'Pré-processada', 'Segmentação', 'Bordas (Canny)', 'Sobreposição']
+
+RENDERIZADORES = ('matplotlib', 'opencv')
+
+
+def sobreposicao(original, mask):
+    """Mistura a imagem original (redimensionada para a máscara) com a máscara, em BGR"""
+    altura, largura = mask.shape[:2]
+    base = cv2.resize(original, (largura, altura))
+    if base.ndim == 2:
+        base = cv2.cvtColor(base, cv2.COLOR_GRAY2BGR)
+    return cv2.addWeighted(base, 0.7, cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR), 0.3, 0)
+
+
+def _paineis(original, processed, mask, edges):
+    """Painéis da grade, na ordem de TITULOS_PAINEIS (None = painel indisponível)"""
+    overlay = sobreposicao(original, mask) if mask is not None else None
+    return [original, processed, mask, edges, overlay]
+
+
+def renderizar_matplotlib(caminho, original, processed, mask, edges, texto):
+    """Desenha o relatório com matplotlib (backend Agg, sem pyplot) e salva em PNG"""
+    # Importação adiada: só quem pede o relatório em PNG paga o custo do matplotlib
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(15, 10))
+    FigureCanvasAgg(fig)
+
+    for i, (titulo, painel) in enumerate(zip(TITULOS_PAINEIS, _paineis(original, processed, mask, edges)), 1):
+        ax = fig.add_subplot(2, 3, i)
+        if painel is not None:
+            if painel.ndim == 3:
+                ax.imshow(cv2.cvtColor(painel, cv2.COLOR_BGR2RGB))
+            else:
+                ax.imshow(painel, cmap='gray')
+        ax.set_title(titulo)
+        ax.axis('off')
+
+    # Texto das características
+    ax = fig.add_subplot(2, 3, 6)
+    ax.text(0.1, 0.5, texto, fontsize=10)
+    ax.axis('off')
+
+    fig.suptitle("Análise da Lesão Cutânea", fontsize=16)
+    fig.savefig(caminho, bbox_inches='tight')
+
+
+def _ascii(texto):
+    """Remove acentos (as fontes Hershey do OpenCV só desenham ASCII)"""
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+def _ladrilho(painel, titulo, tamanho):
+    """Converte um painel em ladrilho BGR `tamanho` x `tamanho` com o título no topo"""
+    ladrilho = np.full((tamanho + 30, tamanho, 3), 255, np.uint8)
+    if painel is not None:
+        if painel.ndim == 2:
+            painel = cv2.cvtColor(painel, cv2.COLOR_GRAY2BGR)
+        ladrilho[30:] = cv2.resize(painel, (tamanho, tamanho), interpolation=cv2.INTER_AREA)
+    cv2.putText(ladrilho, _ascii(titulo), (5, 21), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1, cv2.LINE_AA)
+    return ladrilho
+
+
+def renderizar_opencv(caminho, original, processed, mask, edges, texto, tamanho=256):
+    """Compõe o mesmo relatório só com OpenCV/NumPy (bem mais rápido que o matplotlib)"""
+    ladrilhos = [_ladrilho(p, t, tamanho) for t, p in zip(TITULOS_PAINEIS, _paineis(original, processed, mask, edges))]
+
+    # Painel de texto
+    ladrilho_texto = np.full((tamanho + 30, tamanho, 3), 255, np.uint8)
+    for i, linha in enumerate(texto.split("\n")):
+        cv2.putText(ladrilho_texto, _ascii(linha), (10, 50 + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.45,
+                    (0, 0, 0), 1, cv2.LINE_AA)
+    ladrilhos.append(ladrilho_texto)
+
+    grade = np.vstack([np.hstack(ladrilhos[:3]), np.hstack(ladrilhos[3:])])
+    cv2.imwrite(caminho, grade)
@@ -0,0 +1,415 @@
+"""Serviço local de análise: modelo e buffers aquecidos, imagens recebidas por HTTP
+
+    py servico.py --porta 8765 --workers 4
+    curl --data-binary @samples/lpele5.jpg "http://127.0.0.1:8765/analisar?nome=lpele5"
+    curl http://127.0.0.1:8765/metricas
+
+O servidor (asyncio, HTTP/1.1 com keep-alive, em TCP ou socket Unix) só
+recebe os bytes e responde JSON. A análise roda num pool de processos, cada
+um com o modelo carregado e um ContextoPipeline desde o início. Requisições
+que chegam enquanto os workers estão ocupados se acumulam na fila e são
+despachadas juntas: cada worker analisa um micro-lote e classifica todas as
+imagens dele com uma única chamada ao modelo.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from lesion_analyzer import (SkinLesionAnalyzer, ContextoPipeline, classificar_lote, classificar_matriz,
+                             features_do_modelo, verificar_decodificacao, CLASSE_SUSPEITA, MODOS_DECODIFICACAO,
+                             MODOS_SEGMENTACAO)
+from registro_modelos import MODELO_PADRAO, MODELO_NATIVO_PADRAO, carregar_modelo
+
+PORTA_PADRAO = 8765
+TAMANHO_MAXIMO = 20 * 1024 * 1024  # maior corpo aceito (bytes)
+PERCENTIS = (50, 95, 99)
+
+STATUS_HTTP = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+# ==================== Worker ====================
+
+# Estado do processo worker (preenchido uma vez no inicializador)
+_modelo = None
+_contexto = None
+_decodificacao = 'full'
+_segmentacao = 'watershed'
+
+
+def _inicializar_worker(modelo_path, decodificacao='full', segmentacao='watershed'):
+    """Carrega o modelo e cria os buffers uma única vez em cada processo"""
+    global _modelo, _contexto, _decodificacao, _segmentacao
+    # Ctrl+C chega a todo o grupo de processos: quem encerra o pool é o processo principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _modelo = carregar_modelo(modelo_path)
+    _contexto = ContextoPipeline()
+    _decodificacao = decodificacao
+    _segmentacao = segmentacao
+    # Primeira predição fora do caminho das requisições (páginas do modelo já tocadas)
+    classificar_matriz(_modelo, np.zeros((1, len(features_do_modelo(_modelo))), np.float32))
+
+
+def _aquecer(segundos):
+    """Tarefa vazia que segura o worker um instante, para o pool subir todos os processos"""
+    time.sleep(segundos)
+    return os.getpid()
+
+
+def _json_float(valor):
+    valor = float(valor)
+    return None if math.isnan(valor) or math.isinf(valor) else valor
+
+
+def _analisar_bloco(itens):
+    """Analisa um micro-lote [(nome, bytes)] e classifica as imagens válidas com uma chamada ao modelo
+
+    Devolve um dicionário por item, na mesma ordem (com `erro` nas falhas).
+    """
+    respostas = [{"imagem": nome} for nome, _ in itens]
+    pendentes = []
+    for i, (nome, conteudo) in enumerate(itens):
+        try:
+            analyzer = SkinLesionAnalyzer(nome, modelo=_modelo, report_mode='none', decode_mode=_decodificacao,
+                                          contexto=_contexto, conteudo=conteudo, segmentation_mode=_segmentacao)
+            resultado = analyzer.analyze(save_report=False, verbose=False, classify=False)
+        except Exception as e:
+            respostas[i]["erro"] = str(e)
+            continue
+        respostas[i]["tempos_ms"] = {etapa: s * 1e3 for etapa, s in resultado.timings.items()}
+        if not resultado.sucesso:
+            respostas[i]["erro"] = resultado.erro
+            continue
+        respostas[i]["features"] = {nome_f: _json_float(v) for nome_f, v in resultado.features.items()}
+        respostas[i]["segmentacao"] = resultado.segmentation_tier
+        pendentes.append((i, resultado.features))
+
+    if pendentes:
+        inicio = time.perf_counter()
+        rotulos, proba = classificar_lote(_modelo, [f for _, f in pendentes], return_proba=True)
+        por_imagem = (time.perf_counter() - inicio) * 1e3 / len(pendentes)
+        classes = list(_modelo.classes_)
+        j = classes.index(CLASSE_SUSPEITA) if CLASSE_SUSPEITA in classes else None
+        for k, (i, _) in enumerate(pendentes):
+            respostas[i]["classificacao"] = str(rotulos[k])
+            respostas[i]["probabilidade_suspeita"] = None if j is None else float(proba[k, j])
+            respostas[i]["tempos_ms"]["classify_lesion"] = por_imagem
+    return respostas
+
+
+# ==================== Métricas ====================
+
+class MetricasServico:
+    """Contadores e janelas deslizantes de latência do serviço (últimas `janela` amostras)"""
+
+    def __init__(self, janela=2048):
+        self.inicio = time.perf_counter()
+        self.latencias = deque(maxlen=janela)   # recebida -> respondida (s)
+        self.esperas = deque(maxlen=janela)     # recebida -> despachada a um worker (s)
+        self.lotes = deque(maxlen=janela)       # tamanho de cada micro-lote
+        self.etapas = {}                        # etapa -> deque de ms (medidos nos workers)
+        self.janela = janela
+        self.atendidas = 0
+        self.falhas = 0
+        self.rejeitadas = 0
+
+    def registrar(self, latencia, espera, resposta):
+        self.latencias.append(latencia)
+        self.esperas.append(espera)
+        if "erro" in resposta:
+            self.falhas += 1
+        else:
+            self.atendidas += 1
+        for etapa, ms in resposta.get("tempos_ms", {}).items():
+            self.etapas.setdefault(etapa, deque(maxlen=self.janela)).append(ms)
+
+    @staticmethod
+    def _percentis(amostras, escala=1.0):
+        if not amostras:
+            return {}
+        valores = np.fromiter(amostras, np.float64, len(amostras)) * escala
+        resumo = {"n": len(valores), "media_ms": float(valores.mean())}
+        for p, v in zip(PERCENTIS, np.percentile(valores, PERCENTIS)):
+            resumo[f"p{p}_ms"] = float(v)
+        return resumo
+
+    def resumo(self, fila, em_processamento, workers_livres):
+        decorrido = time.perf_counter() - self.inicio
+        return {
+            "fila": fila,
+            "em_processamento": em_processamento,
+            "workers_livres": workers_livres,
+            "atendidas": self.atendidas,
+            "falhas": self.falhas,
+            "rejeitadas": self.rejeitadas,
+            "vazao_por_s": (self.atendidas + self.falhas) / decorrido if decorrido > 0 else 0.0,
+            "lote_medio": float(np.mean(self.lotes)) if self.lotes else 0.0,
+            "latencia": self._percentis(self.latencias, 1e3),
+            "espera_fila": self._percentis(self.esperas, 1e3),
+            "etapas": {etapa: self._percentis(ms) for etapa, ms in self.etapas.items()},
+        }
+
+
+# ==================== Serviço ====================
+
+class Sobrecarga(Exception):
+    """Fila cheia: a requisição é recusada (HTTP 503)"""
+
+
+class ServicoAnalise:
+    """Fila de requisições, despacho em micro-lotes para o pool e métricas
+
+    Um micro-lote sai assim que há um worker livre, com o que estiver na fila
+    (até `lote_max`, dividindo a fila entre os workers livres); com
+    `espera_ms` > 0 o despachante ainda espera esse tempo por mais imagens.
+    Com mais de `fila_max` requisições pendentes, as novas são recusadas.
+    """
+
+    def __init__(self, modelo_path=MODELO_PADRAO, workers=None, lote_max=16, espera_ms=0.0, fila_max=256,
+                 decodificacao='full', janela_metricas=2048, segmentacao='watershed'):
+        if decodificacao not in MODOS_DECODIFICACAO:
+            raise ValueError(f"Modo de decodificação inválido: {decodificacao!r}")
+        if segmentacao not in MODOS_SEGMENTACAO:
+            raise ValueError(f"Modo de segmentação inválido: {segmentacao!r}")
+        self.modelo_path = modelo_path
+        self.workers = workers or os.cpu_count() or 1
+        self.lote_max = max(1, lote_max)
+        self.espera = espera_ms / 1e3
+        self.fila_max = fila_max
+        self.decodificacao = decodificacao
+        self.segmentacao = segmentacao
+        self.metricas = MetricasServico(janela_metricas)
+        self.executor = None
+        self.fila = None
+        self.livres = None
+        self.ocupados = 0
+        self.pendentes = 0
+        self._despachante = None
+
+    def iniciar(self):
+        """Sobe o pool e espera todos os workers carregarem o modelo (antes de aceitar conexões)"""
+        if self.decodificacao != 'full':
+            # Falha aqui, com a mensagem certa, e não no inicializador de cada worker
+            verificar_decodificacao(carregar_modelo(self.modelo_path), self.decodificacao)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_inicializar_worker,
+                                            initargs=(self.modelo_path, self.decodificacao, self.segmentacao))
+        tarefas = [self.executor.submit(_aquecer, 0.2) for _ in range(self.workers)]
+        return len({tarefa.result() for tarefa in tarefas})
+
+    def encerrar(self):
+        if self._despachante is not None:
+            self._despachante.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def analisar(self, conteudo, nome="imagem"):
+        """Enfileira uma imagem (bytes) e espera a resposta do worker"""
+        if self._despachante is None:
+            self.fila = asyncio.Queue()
+            self.livres = asyncio.Semaphore(self.workers)
+            self._despachante = asyncio.create_task(self._despachar())
+        if self.pendentes >= self.fila_max:
+            self.metricas.rejeitadas += 1
+            raise Sobrecarga(f"fila cheia ({self.pendentes} pendentes)")
+        self.pendentes += 1
+        chegada = time.perf_counter()
+        futuro = asyncio.get_running_loop().create_future()
+        item = {"nome": nome, "conteudo": conteudo, "futuro": futuro, "chegada": chegada}
+        try:
+            await self.fila.put(item)
+            resposta = await futuro
+        finally:
+            self.pendentes -= 1
+        fim = time.perf_counter()
+        resposta["latencia_ms"] = (fim - chegada) * 1e3
+        self.metricas.registrar(fim - chegada, item["despacho"] - chegada, resposta)
+        return resposta
+
+    async def _despachar(self):
+        while True:
+            await self.livres.acquire()
+            lote = [await self.fila.get()]
+            self.ocupados += 1
+            # Divide o que já está na fila entre os workers livres (o atual incluído)
+            livres = self.workers - self.ocupados + 1
+            tamanho = min(self.lote_max, math.ceil((self.fila.qsize() + 1) / livres))
+            while len(lote) < tamanho and not self.fila.empty():
+                lote.append(self.fila.get_nowait())
+            if self.espera > 0 and len(lote) < tamanho:
+                prazo = time.perf_counter() + self.espera
+                while len(lote) < tamanho and (restante := prazo - time.perf_counter()) > 0:
+                    try:
+                        lote.append(await asyncio.wait_for(self.fila.get(), restante))
+                    except asyncio.TimeoutError:
+                        break
+            asyncio.create_task(self._executar(lote))
+
+    async def _executar(self, lote):
+        agora = time.perf_counter()
+        for item in lote:
+            item["despacho"] = agora
+        self.metricas.lotes.append(len(lote))
+        try:
+            respostas = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _analisar_bloco, [(item["nome"], item["conteudo"]) for item in lote])
+            for item, resposta in zip(lote, respostas):
+                if not item["futuro"].done():
+                    item["futuro"].set_result(resposta)
+        except Exception as e:
+            for item in lote:
+                if not item["futuro"].done():
+                    item["futuro"].set_exception(e)
+        finally:
+            self.ocupados -= 1
+            self.livres.release()
+
+    def resumo_metricas(self):
+        fila = self.fila.qsize() if self.fila is not None else 0
+        return self.metricas.resumo(fila, self.pendentes - fila, self.workers - self.ocupados)
+
+
+# ==================== HTTP ====================
+
+def _resposta_http(status, corpo, manter=True):
+    dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+    cabecalho = (f"HTTP/1.1 {status} {STATUS_HTTP[status]}\r\n"
+                 f"Content-Type: application/json; charset=utf-8\r\n"
+                 f"Content-Length: {len(dados)}\r\n"
+                 f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n")
+    return cabecalho.encode("latin-1") + dados
+
+
+async def _rotear(servico, metodo, alvo, corpo):
+    url = urlsplit(alvo)
+    if url.path == "/analisar":
+        if metodo != "POST":
+            return 405, {"erro": "use POST com os bytes da imagem no corpo"}
+        if not corpo:
+            return 400, {"erro": "corpo vazio"}
+        nome = parse_qs(url.query).get("nome", ["imagem"])[0]
+        try:
+            resposta = await servico.analisar(corpo, nome)
+        except Sobrecarga as e:
+            return 503, {"erro": str(e)}
+        except Exception as e:
+            return 500, {"erro": str(e)}
+        return (200 if "erro" not in resposta else 422), resposta
+    if url.path == "/metricas" and metodo == "GET":
+        return 200, servico.resumo_metricas()
+    if url.path == "/saude" and metodo == "GET":
+        return 200, {"status": "ok", "workers": servico.workers}
+    return 404, {"erro": f"rota desconhecida: {metodo} {url.path}"}
+
+
+async def _atender(servico, reader, writer):
+    """Atende uma conexão HTTP/1.1 (várias requisições com keep-alive)"""
+    try:
+        while True:
+            linha = await reader.readline()
+            if not linha:
+                break
+            metodo, alvo, versao = linha.decode("latin-1").split()
+            cabecalhos = {}
+            while (cabecalho := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                nome, _, valor = cabecalho.decode("latin-1").partition(":")
+                cabecalhos[nome.strip().lower()] = valor.strip()
+            manter = versao == "HTTP/1.1" and cabecalhos.get("connection", "").lower() != "close"
+            tamanho = int(cabecalhos.get("content-length", 0))
+            if tamanho < 0:
+                raise ValueError(f"Content-Length inválido: {tamanho}")
+            if tamanho > TAMANHO_MAXIMO:
+                writer.write(_resposta_http(413, {"erro": f"imagem maior que {TAMANHO_MAXIMO} bytes"}, False))
+                await writer.drain()
+                break
+            corpo = await reader.readexactly(tamanho) if tamanho else b""
+            status, resposta = await _rotear(servico, metodo, alvo, corpo)
+            writer.write(_resposta_http(status, resposta, manter))
+            await writer.drain()
+            if not manter:
+                break
+    except ValueError as e:
+        # Linha de requisição ou cabeçalho malformado (ou longo demais): 400 e fecha
+        try:
+            writer.write(_resposta_http(400, {"erro": f"requisição malformada: {e}"}, False))
+            await writer.drain()
+        except ConnectionError:
+            pass
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass  # cliente desconectou: não há a quem responder
+    finally:
+        writer.close()
+
+
+async def servir(servico, host="127.0.0.1", porta=PORTA_PADRAO, unix=None):
+    """Aceita conexões até Ctrl+C/SIGTERM (TCP em host:porta ou socket Unix em `unix`)"""
+    def atender(reader, writer):
+        return _atender(servico, reader, writer)
+
+    if unix:
+        servidor = await asyncio.start_unix_server(atender, path=unix)
+        endereco = unix
+    else:
+        servidor = await asyncio.start_server(atender, host, porta)
+        endereco = f"http://{host}:{porta}"
+    # Ctrl+C/SIGTERM encerram com calma (no Windows o Ctrl+C chega como KeyboardInterrupt)
+    parar = asyncio.Event()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sinal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    print(f"✅ Serviço pronto em {endereco} ({servico.workers} workers)", flush=True)
+    async with servidor:
+        await parar.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de análise de lesões (modelo sempre carregado)")
+    parser.add_argument("--host", default="127.0.0.1", help="endereço de escuta")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO, help="porta TCP")
+    parser.add_argument("--unix", help="escuta num socket Unix neste caminho em vez de TCP")
+    modelo_padrao = MODELO_NATIVO_PADRAO if os.path.exists(MODELO_NATIVO_PADRAO) else MODELO_PADRAO
+    parser.add_argument("--modelo", default=modelo_padrao, help="modelo treinado (.pkl ou floresta nativa .npz)")
+    parser.add_argument("--workers", type=int, default=None, help="processos de análise (padrão: núcleos)")
+    parser.add_argument("--lote-max", type=int, default=16, help="maior micro-lote enviado a um worker")
+    parser.add_argument("--espera-ms", type=float, default=0.0,
+                        help="tempo extra que o despachante espera para completar um micro-lote")
+    parser.add_argument("--fila-max", type=int, default=256, help="requisições pendentes antes de responder 503")
+    parser.add_argument("--decodificacao", choices=MODOS_DECODIFICACAO, default="full",
+                        help="'reduced' decodifica em cinza a 1/2 da resolução (mais rápido)")
+    parser.add_argument("--segmentacao", choices=MODOS_SEGMENTACAO, default="watershed",
+                        help="'tiered' só roda o watershed quando a máscara morfológica é ambígua")
+    args = parser.parse_args(argv)
+
+    servico = ServicoAnalise(args.modelo, args.workers, args.lote_max, args.espera_ms, args.fila_max,
+                             args.decodificacao, segmentacao=args.segmentacao)
+    print(f"🔄 Carregando o modelo em {servico.workers} workers...", flush=True)
+    try:
+        servico.iniciar()
+    except ValueError as e:
+        print(f"❌ {e}")
+        servico.encerrar()
+        return 1
+    try:
+        asyncio.run(servir(servico, args.host, args.porta, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servico.encerrar()
+    print("⏹️ Serviço encerrado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
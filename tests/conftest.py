@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Os módulos do projeto ficam na raiz (sem pacote); os geradores sintéticos em benchmarks/
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
@@ -0,0 +1,62 @@
+"""Alocação por imagem plana com ContextoPipeline (tracemalloc)"""
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from lesion_analyzer import SkinLesionAnalyzer, EtapasLesao, ContextoPipeline
+from sinteticas import gerar_imagem
+
+IMAGENS = 30
+AQUECIMENTO = 3                  # as primeiras imagens criam os buffers do contexto
+CRESCIMENTO_MAXIMO = 16 * 1024   # bytes que podem sobrar depois de todas as imagens (~3 KiB hoje)
+PICO_MAXIMO = 128 * 1024         # pico de cada imagem com contexto (~55 KiB hoje; sem contexto, >1 MiB)
+
+
+def _imagens(n, semente=0):
+    rng = np.random.default_rng(semente)
+    return [gerar_imagem(semente * 100003 + i, raio=int(rng.integers(50, 130)),
+                         irregularidade=float(rng.uniform(0.05, 0.4))) for i in range(n)]
+
+
+def _analisar(analyzer, imagem):
+    etapas = EtapasLesao(analyzer, entrada=imagem)
+    return etapas.features, etapas.mask.copy()
+
+
+def test_alocacao_plana_com_contexto():
+    imagens = _imagens(IMAGENS + AQUECIMENTO)
+    analyzer = SkinLesionAnalyzer("memoria", report_mode='none', contexto=ContextoPipeline(),
+                                  output_dir=tempfile.gettempdir())
+    for imagem in imagens[:AQUECIMENTO]:
+        _analisar(analyzer, imagem)
+
+    picos = []
+    tracemalloc.start()
+    try:
+        inicio, _ = tracemalloc.get_traced_memory()
+        for imagem in imagens[AQUECIMENTO:]:
+            tracemalloc.reset_peak()
+            antes, _ = tracemalloc.get_traced_memory()
+            EtapasLesao(analyzer, entrada=imagem).features
+            _, pico = tracemalloc.get_traced_memory()
+            picos.append(pico - antes)
+        fim, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    crescimento = fim - inicio
+    assert crescimento < CRESCIMENTO_MAXIMO, f"{crescimento / 1024:.1f} KiB retidos em {IMAGENS} imagens"
+    assert max(picos) < PICO_MAXIMO, f"pico de {max(picos) / 1024:.1f} KiB numa imagem"
+
+
+def test_contexto_nao_muda_resultado():
+    imagens = _imagens(5, semente=1)
+    sem = SkinLesionAnalyzer("sem", report_mode='none', output_dir=tempfile.gettempdir())
+    com = SkinLesionAnalyzer("com", report_mode='none', contexto=ContextoPipeline(),
+                             output_dir=tempfile.gettempdir())
+    for imagem in imagens:
+        features_sem, mascara_sem = _analisar(sem, imagem)
+        features_com, mascara_com = _analisar(com, imagem)
+        assert features_sem == features_com
+        np.testing.assert_array_equal(mascara_sem, mascara_com)
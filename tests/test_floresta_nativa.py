@@ -0,0 +1,53 @@
+"""Paridade da floresta exportada (.npz) com o RandomForestClassifier do sklearn"""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from floresta_nativa import FlorestaNativa, amostras_paridade, exportar_floresta
+from lesion_analyzer import CLASSE_SUSPEITA, classificar_matriz
+from registro_modelos import ler_modelo
+
+
+def _dados(n=300, semente=0):
+    rng = np.random.default_rng(semente)
+    X = (rng.random((n, 5)) * [20000, 800, 1, 2, 1]).astype(np.float32)
+    ruido = rng.random(n) < 0.15
+    y = np.where((X[:, 2] < 0.4) ^ ruido, CLASSE_SUSPEITA, "PROVAVELMENTE BENIGNA")
+    return X, y
+
+
+@pytest.mark.parametrize("max_depth", [None, 1, 3])
+def test_npz_igual_ao_predict_proba(tmp_path, max_depth):
+    X, y = _dados()
+    modelo = RandomForestClassifier(n_estimators=15, max_depth=max_depth, random_state=0).fit(X, y)
+    modelo.limiar_suspeita_ = 0.35
+
+    caminho = str(tmp_path / "modelo.npz")
+    exportar_floresta(modelo, caminho, X)
+    nativa = ler_modelo(caminho)
+    assert isinstance(nativa, FlorestaNativa)
+    assert nativa.limiar_suspeita_ == modelo.limiar_suspeita_
+
+    # Linhas do treino e linhas sobre os limiares (testam o <= de cada nó)
+    amostras = np.vstack([X, amostras_paridade(nativa)])
+    np.testing.assert_array_equal(nativa.predict_proba(amostras), modelo.predict_proba(amostras))
+    np.testing.assert_array_equal(nativa.predict(amostras), modelo.predict(amostras))
+    # Rótulos com o limiar de SUSPEITA, como no analisador
+    assert classificar_matriz(nativa, amostras) == [str(r) for r in classificar_matriz(modelo, amostras)]
+
+
+def test_arvores_de_profundidades_diferentes(tmp_path):
+    """Árvores rasas viram folhas cedo; as demais continuam descendo até a maior profundidade"""
+    X, y = _dados(semente=1)
+    modelo = RandomForestClassifier(n_estimators=8, max_depth=2, random_state=1).fit(X, y)
+    profunda = RandomForestClassifier(n_estimators=4, random_state=2).fit(X, y)
+    modelo.estimators_ += profunda.estimators_
+    modelo.n_estimators = len(modelo.estimators_)
+    modelo.limiar_suspeita_ = 0.5
+
+    caminho = str(tmp_path / "mista.npz")
+    exportar_floresta(modelo, caminho)
+    nativa = ler_modelo(caminho)
+    amostras = np.vstack([X, amostras_paridade(nativa)])
+    np.testing.assert_array_equal(nativa.predict_proba(amostras), modelo.predict_proba(amostras))
+    assert classificar_matriz(nativa, amostras) == [str(r) for r in classificar_matriz(modelo, amostras)]
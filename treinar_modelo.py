@@ -1,42 +1,253 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import argparse
+import hashlib
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, confusion_matrix
+from sklearn.metrics import classification_report, confusion_matrix, precision_recall_curve, roc_auc_score
+from sklearn.model_selection import (GridSearchCV, RandomizedSearchCV, StratifiedGroupKFold,
+                                     cross_val_predict)
 import joblib
+from dados import caminho_gravado, ler_tabela
+from floresta_nativa import exportar_floresta
+from lesion_analyzer import COLUNAS_MODELO, CONJUNTOS_FEATURES, CLASSE_SUSPEITA, classificar_matriz
+
+# === Caminhos padrão (podem ser trocados pela linha de comando) ===
+caminho_dados = r"C:\Users\DettCloud2\Downloads\tcc\base_treinamento.parquet"
+caminho_modelo = r"C:\Users\DettCloud2\Downloads\tcc\modelo_random_forest.pkl"
 
-# === 1. Carregar a base de treinamento ===
-caminho_dados = r"C:\Users\DettCloud2\Downloads\tcc\base_treinamento.csv"
-df = pd.read_csv(caminho_dados)
+# Colunas de entrada (features), na ordem usada pelo analisador
+COLUNAS_FEATURES = list(COLUNAS_MODELO.values())
 
-# === 2. Selecionar as colunas de entrada (features) ===
-X = df[["area", "perimetro", "circularidade", "aspect_ratio", "solidez"]]
+# Espaço de busca dos hiperparâmetros da floresta
+ESPACO_BUSCA = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [None, 8, 12, 16, 24],
+    "min_samples_leaf": [1, 2, 4, 8],
+    "max_features": ["sqrt", 0.6, None],
+    "class_weight": ["balanced", "balanced_subsample"],
+}
 
-# === 3. Selecionar o rótulo (target) ===
-y = df["diagnostico_real"]
+# Grade menor para a busca exaustiva
+GRADE_BUSCA = {
+    "n_estimators": [200],
+    "max_depth": [None, 12],
+    "min_samples_leaf": [1, 4],
+    "max_features": ["sqrt", None],
+    "class_weight": ["balanced"],
+}
 
-# === 4. Dividir em treino e teste ===
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
 
-# === 5. Treinar o modelo Random Forest com balanceamento ===
-model = RandomForestClassifier(
-    n_estimators=100, 
-    random_state=42, 
-    class_weight='balanced'
-)
+def carregar_base(caminho, pasta_cache=None, colunas=COLUNAS_FEATURES):
+    """Lê a base de treinamento e devolve (X, y, grupos)
 
-model.fit(X_train, y_train)
+    Com `pasta_cache`, a matriz X (float32), os rótulos e os grupos ficam em
+    arquivos .npy identificados pelo caminho, tamanho e data da base e pelas
+    colunas; nas execuções seguintes X é aberta como memmap (somente leitura),
+    sem reler a base, e os processos da busca compartilham as mesmas páginas.
+    Os grupos são os `lesion_id` (várias imagens por lesão); se a coluna não
+    existir, cada imagem vira o próprio grupo. Linhas com alguma coluna vazia
+    (ex.: variancia_cor de um lote com decodificação 'reduced') ficam de fora.
+    """
+    caminho = caminho_gravado(caminho)
+    if pasta_cache:
+        info = os.stat(caminho)
+        chave = f"{os.path.abspath(caminho)}:{info.st_size}:{info.st_mtime_ns}:{','.join(colunas)}"
+        prefixo = os.path.join(pasta_cache, hashlib.sha1(chave.encode("utf-8")).hexdigest()[:16])
+        arquivos = {nome: f"{prefixo}_{nome}.npy" for nome in ("X", "y", "grupos")}
+        if all(os.path.exists(a) for a in arquivos.values()):
+            return (np.load(arquivos["X"], mmap_mode="r"), np.load(arquivos["y"]),
+                    np.load(arquivos["grupos"]))
 
-# === 6. Avaliar o modelo ===
-y_pred = model.predict(X_test)
-print("✅ Relatório de desempenho:")
-print(classification_report(y_test, y_pred))
+    df = ler_tabela(caminho, colunas=list(colunas) + ["diagnostico_real", "lesion_id"])
+    ausentes = [c for c in colunas if c not in df]
+    if ausentes:
+        raise ValueError(f"A base {caminho} não tem as colunas {', '.join(ausentes)} "
+                         "(gere de novo o relatorio_lote.csv e a base com preparar_dados.py)")
+    vazias = df[colunas].isna().any(axis=1)
+    if vazias.any():
+        print(f"⚠️ {int(vazias.sum())} imagens com características vazias ficaram de fora")
+        df = df[~vazias]
+    X = np.ascontiguousarray(df[colunas].to_numpy(dtype=np.float32))
+    y = df["diagnostico_real"].to_numpy(dtype=str)
+    if "lesion_id" in df:
+        grupos = df["lesion_id"].to_numpy(dtype=str)
+    else:
+        print("⚠️ Base sem lesion_id: a validação cruzada vai agrupar por imagem")
+        grupos = np.arange(len(df)).astype(str)
 
-print("📊 Matriz de confusão:")
-print(confusion_matrix(y_test, y_pred))
+    if pasta_cache:
+        os.makedirs(pasta_cache, exist_ok=True)
+        for nome, array in (("X", X), ("y", y), ("grupos", grupos)):
+            temporario = arquivos[nome] + ".tmp.npy"
+            np.save(temporario, array)
+            os.replace(temporario, arquivos[nome])
+        X = np.load(arquivos["X"], mmap_mode="r")
+    return X, y, grupos
 
-# === 7. Salvar o modelo treinado ===
-caminho_modelo = r"C:\Users\DettCloud2\Downloads\tcc\modelo_random_forest.pkl"
-joblib.dump(model, caminho_modelo)
-print(f"✅ Modelo salvo com sucesso em: {caminho_modelo}")
+
+def dividir_treino_teste(y, grupos, fracao_teste=0.2, semente=42):
+    """Índices de treino e teste estratificados por rótulo, sem separar imagens da mesma lesão"""
+    n_folds = max(2, round(1 / fracao_teste))
+    divisor = StratifiedGroupKFold(n_splits=n_folds, shuffle=True, random_state=semente)
+    return next(divisor.split(np.zeros(len(y)), y, grupos))
+
+
+def buscar_hiperparametros(X, y, grupos, metodo="aleatoria", iteracoes=40, folds=5, n_jobs=-1, semente=42):
+    """Busca os hiperparâmetros da floresta com validação cruzada estratificada por lesão
+
+    As combinações x folds rodam em paralelo (`n_jobs`), cada floresta com
+    um único núcleo. A métrica é a AUC ROC, que não depende do limiar.
+    """
+    base = RandomForestClassifier(random_state=semente, n_jobs=1)
+    cv = StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=semente)
+    if metodo == "grade":
+        busca = GridSearchCV(base, GRADE_BUSCA, scoring="roc_auc", cv=cv, n_jobs=n_jobs, refit=False)
+    else:
+        busca = RandomizedSearchCV(base, ESPACO_BUSCA, n_iter=iteracoes, scoring="roc_auc", cv=cv,
+                                   n_jobs=n_jobs, refit=False, random_state=semente)
+    busca.fit(X, y, groups=grupos)
+    return busca.best_params_, busca.best_score_
+
+
+def escolher_limiar(y, proba_suspeita, sensibilidade_minima=None):
+    """Limiar de P(SUSPEITA) a partir de probabilidades fora da amostra
+
+    Sem `sensibilidade_minima`, maximiza o F1 da classe SUSPEITA; com ela,
+    escolhe o maior limiar que ainda detecta essa fração das suspeitas
+    (menos falsos positivos sem perder sensibilidade).
+    Retorna (limiar, precisão, sensibilidade).
+    """
+    precisao, sensibilidade, limiares = precision_recall_curve(y == CLASSE_SUSPEITA, proba_suspeita)
+    precisao, sensibilidade = precisao[:-1], sensibilidade[:-1]
+    if sensibilidade_minima is None:
+        f1 = np.divide(2 * precisao * sensibilidade, precisao + sensibilidade,
+                       out=np.zeros_like(precisao), where=(precisao + sensibilidade) > 0)
+        i = int(np.argmax(f1))
+    else:
+        candidatos = np.flatnonzero(sensibilidade >= sensibilidade_minima)
+        i = int(candidatos[-1]) if len(candidatos) else 0
+    return float(limiares[i]), float(precisao[i]), float(sensibilidade[i])
+
+
+def probabilidades_validacao(modelo, X, y, grupos, folds=5, n_jobs=-1, semente=42):
+    """P(SUSPEITA) de cada linha prevista pelo fold em que ela ficou de fora"""
+    cv = StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=semente)
+    proba = cross_val_predict(modelo, X, y, groups=grupos, cv=cv, n_jobs=n_jobs, method="predict_proba")
+    return proba[:, list(np.unique(y)).index(CLASSE_SUSPEITA)]
+
+
+def crescer_floresta(parametros, X, y, arvores=(), n_jobs=-1, semente=42, tolerancia=0.001):
+    """Treina a floresta final aumentando o número de árvores com warm_start
+
+    Para cada total em `arvores` (ex.: 100, 200, 400) só as árvores novas são
+    treinadas e a AUC out-of-bag é medida; o crescimento para quando o ganho
+    fica abaixo de `tolerancia`. Sem `arvores`, usa o n_estimators da busca.
+    """
+    parametros = dict(parametros)
+    totais = sorted(arvores) or [parametros.get("n_estimators", 100)]
+    parametros["n_estimators"] = totais[0]
+    modelo = RandomForestClassifier(**parametros, warm_start=True, oob_score=True, n_jobs=n_jobs,
+                                    random_state=semente)
+    auc_anterior = None
+    for total in totais:
+        modelo.set_params(n_estimators=total)
+        with warnings.catch_warnings():
+            # O aviso sobre class_weight + warm_start não se aplica: os dados não mudam entre as etapas
+            warnings.filterwarnings("ignore", message="class_weight presets")
+            modelo.fit(X, y)
+        j = list(modelo.classes_).index(CLASSE_SUSPEITA)
+        auc = roc_auc_score(y == CLASSE_SUSPEITA, np.nan_to_num(modelo.oob_decision_function_[:, j]))
+        print(f"🌲 {total} árvores: AUC out-of-bag {auc:.4f}")
+        if auc_anterior is not None and auc - auc_anterior < tolerancia:
+            break
+        auc_anterior = auc
+    return modelo
+
+
+def avaliar(modelo, X, y):
+    """Relatório de desempenho e matriz de confusão usando o limiar do modelo"""
+    previsto = np.asarray(classificar_matriz(modelo, np.asarray(X, dtype=np.float32)), dtype=str)
+    print("✅ Relatório de desempenho:")
+    print(classification_report(y, previsto))
+    print("📊 Matriz de confusão:")
+    print(confusion_matrix(y, previsto))
+
+
+def treinar(dados=caminho_dados, modelo_saida=caminho_modelo, pasta_cache=None, busca="aleatoria", iteracoes=40,
+            folds=5, n_jobs=-1, semente=42, fracao_teste=0.2, arvores=(), sensibilidade_minima=None,
+            features="basicas"):
+    """Busca, limiar, treino final, avaliação no teste e exportação (.pkl e .npz)
+
+    `features='estendidas'` treina também com os descritores ABCD
+    (lesion_analyzer.COLUNAS_ABCD); as colunas usadas ficam no modelo em
+    `colunas_features_`, e o analisador monta a entrada a partir delas.
+    """
+    inicio = time.perf_counter()
+    colunas = list(CONJUNTOS_FEATURES[features].values())
+    X, y, grupos = carregar_base(dados, pasta_cache, colunas)
+    treino, teste = dividir_treino_teste(y, grupos, fracao_teste, semente)
+    X_train, y_train, g_train = X[treino], y[treino], grupos[treino]
+    print(f"📂 {len(y)} imagens ({len(np.unique(grupos))} lesões): {len(treino)} treino, {len(teste)} teste")
+
+    parametros = dict(n_estimators=100, class_weight="balanced")
+    if busca != "nenhuma":
+        parametros, auc = buscar_hiperparametros(X_train, y_train, g_train, busca, iteracoes, folds, n_jobs,
+                                                 semente)
+        print(f"🔎 Melhores hiperparâmetros (AUC {auc:.4f}): {parametros}")
+
+    proba = probabilidades_validacao(RandomForestClassifier(**parametros, random_state=semente, n_jobs=1),
+                                     X_train, y_train, g_train, folds, n_jobs, semente)
+    limiar, precisao, sensibilidade = escolher_limiar(y_train, proba, sensibilidade_minima)
+    print(f"🎚️ Limiar de SUSPEITA: {limiar:.3f} (precisão {precisao:.3f}, sensibilidade {sensibilidade:.3f})")
+
+    modelo = crescer_floresta(parametros, X_train, y_train, arvores, n_jobs, semente)
+    modelo.limiar_suspeita_ = limiar
+    modelo.colunas_features_ = colunas
+    # Não guarda as estruturas só usadas no treino
+    modelo.set_params(warm_start=False, n_jobs=None)
+    for atributo in ("oob_decision_function_", "oob_score_"):
+        if hasattr(modelo, atributo):
+            delattr(modelo, atributo)
+
+    avaliar(modelo, X[teste], y[teste])
+
+    joblib.dump(modelo, modelo_saida)
+    print(f"✅ Modelo salvo com sucesso em: {modelo_saida}")
+    caminho_nativo = os.path.splitext(modelo_saida)[0] + ".npz"
+    diferenca = exportar_floresta(modelo, caminho_nativo, X[teste])
+    print(f"✅ Floresta nativa salva em: {caminho_nativo} (diferença máxima para o sklearn: {diferenca:.2g})")
+    print(f"⏱️ Treinamento concluído em {time.perf_counter() - inicio:.1f}s")
+    return modelo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Treina o classificador de lesões (Random Forest)")
+    parser.add_argument("--dados", default=caminho_dados, help="base de treinamento gerada pelo preparar_dados.py (.parquet, .feather, .pkl ou .csv)")
+    parser.add_argument("--modelo", default=caminho_modelo, help="arquivo .pkl de saída (o .npz é gravado ao lado)")
+    parser.add_argument("--cache", metavar="PASTA", help="guarda a matriz de features em .npy (memmap)")
+    parser.add_argument("--busca", choices=("aleatoria", "grade", "nenhuma"), default="aleatoria",
+                        help="busca de hiperparâmetros (padrão: aleatória)")
+    parser.add_argument("--iteracoes", type=int, default=40, help="combinações sorteadas na busca aleatória")
+    parser.add_argument("--folds", type=int, default=5, help="folds da validação cruzada (agrupada por lesão)")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="processos da busca e do treino (-1 = todos)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--teste", type=float, default=0.2, help="fração das lesões reservada para teste")
+    parser.add_argument("--arvores", type=int, nargs="+", default=[],
+                        help="totais de árvores para o crescimento com warm_start (ex.: 100 200 400 800)")
+    parser.add_argument("--sensibilidade-minima", type=float,
+                        help="escolhe o limiar que mantém esta sensibilidade (padrão: maior F1)")
+    parser.add_argument("--features", choices=tuple(CONJUNTOS_FEATURES), default="basicas",
+                        help="'estendidas' inclui assimetria, irregularidade da borda, variância de cor e diâmetro")
+    args = parser.parse_args(argv)
+
+    treinar(args.dados, args.modelo, args.cache, args.busca, args.iteracoes, args.folds, args.n_jobs,
+            args.semente, args.teste, args.arvores, args.sensibilidade_minima, args.features)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())